@@ -0,0 +1,65 @@
+import random
+import sys
+import time
+from dna.benchmark.util import report
+from dna.middleware.protocol.batch import BatchCodec
+from dna.middleware.protocol.transport import Packet, Parser, Router
+
+
+def capture(count=None, seed=1):
+    """
+    :return: list of count datagrams with random headers and 0-64 byte payloads
+    """
+    generator = random.Random(seed)
+    return [Packet({'id': _id % 65536, 'flags': generator.getrandbits(8) << 8,
+                    'request_address': generator.getrandbits(48), 'response_address': generator.getrandbits(48),
+                    'data_window_start': generator.getrandbits(16), 'data_window_end': generator.getrandbits(16),
+                    'payload': bytes(generator.getrandbits(8) for _ in range(generator.randrange(65)))}).pack()
+            for _id in range(count)]
+
+
+def scalar(datagrams=None):
+    """
+    Parser.parse per datagram, addresses split with Router.route (the fields the batch decoder produces)
+    """
+    parser = Parser()
+    records = list()
+    for datagram in datagrams:
+        parts = parser.parse(datagram)
+        records.append((parts, Router.route(parts['request_address']), Router.route(parts['response_address'])))
+    return records
+
+
+def run(count=200000):
+    datagrams = capture(count=count)
+    codec = BatchCodec()
+    buffer, offsets = codec.pack(datagrams)
+    print("{} datagrams, {:.1f} MB".format(count, len(buffer) / 2 ** 20))
+
+    start = time.perf_counter()
+    parsed = scalar(datagrams=datagrams)
+    baseline = count / (time.perf_counter() - start)
+    report("Parser.parse + Router.route", baseline)
+    start = time.perf_counter()
+    records = codec.decode(buffer=buffer, offsets=offsets)
+    report("BatchCodec.decode", count / (time.perf_counter() - start), baseline=baseline)
+
+    header = Parser.codec()
+    start = time.perf_counter()
+    b''.join(header.encode(values=[parts[field] for field in header.fields], payload=parts['payload'])
+             for parts, _, _ in parsed)
+    baseline = count / (time.perf_counter() - start)
+    report("HeaderCodec.encode", baseline)
+    start = time.perf_counter()
+    encoded, _ = codec.encode(records=records, payloads=buffer)
+    report("BatchCodec.encode", count / (time.perf_counter() - start), baseline=baseline)
+    assert encoded == buffer
+
+
+if "__main__" == __name__:
+
+    try:
+        cycles = int(sys.argv[1])
+    except (BaseException, ):
+        cycles = 200000
+    run(count=cycles)
@@ -0,0 +1,61 @@
+import socket
+import sys
+import time
+import tracemalloc
+from dna.benchmark.util import report
+from dna.middleware.endpoint.buffer import BufferPool
+
+
+SIZE = 8192
+
+
+def receive(count=10000, pooled=False, length=256):
+    """
+    :return: (datagrams/s, peak bytes allocated while receiving)
+    """
+    receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    receiver.bind(("127.0.0.1", 0))
+    receiver.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+    sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    pool = BufferPool(slab_size=SIZE, slabs=4)
+    message, address = bytes(length), receiver.getsockname()
+    elapsed, peak = 0.0, 0
+    tracemalloc.start()
+    for _ in range(count // 100):
+        for _ in range(100):
+            sender.sendto(message, address)
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        for _ in range(100):
+            if pooled:
+                slab = pool.acquire()
+                slab.length, client_address = receiver.recvfrom_into(slab.buffer)
+                data = slab.data
+                slab.release()
+            else:
+                data, client_address = receiver.recvfrom(SIZE)
+        elapsed += time.perf_counter() - start
+        peak = max(peak, tracemalloc.get_traced_memory()[1] - base)
+    tracemalloc.stop()
+    sender.close()
+    receiver.close()
+    return count / elapsed, peak
+
+
+def run(count=100000):
+    value, peak = receive(count=count)
+    report("recvfrom({})".format(SIZE), value, unit="datagrams/s, peak {:,} bytes allocated".format(peak))
+    baseline = value
+    value, peak = receive(count=count, pooled=True)
+    report("BufferPool + recvfrom_into", value, unit="datagrams/s, peak {:,} bytes allocated".format(peak),
+           baseline=baseline)
+
+
+if "__main__" == __name__:
+
+    try:
+        cycles = int(sys.argv[1])
+    except (BaseException, ):
+        cycles = 100000
+    run(count=cycles)
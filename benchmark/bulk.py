@@ -0,0 +1,54 @@
+import socket
+import sys
+import time
+from dna.benchmark.util import report
+from dna.middleware.endpoint.bulk import BulkSocket
+
+
+def loopback(batch=1, count=100000, native=True, size=64):
+    """
+    Sender and receiver on one thread, each round sends batch datagrams and reads them back
+    :return: packets/s
+    """
+    receiver_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    receiver_socket.bind(("127.0.0.1", 0))
+    receiver = BulkSocket(socket_instance=receiver_socket, batch=batch, native=native)
+    sender = BulkSocket(batch=batch, native=native)
+    datagrams = [(bytes(size), receiver_socket.getsockname())] * batch
+    received = 0
+    start = time.perf_counter()
+    for _ in range(count // batch):
+        sender.send(datagrams=datagrams)
+        pending = batch
+        while pending > 0:
+            got = len(receiver.receive(timeout=1.0))
+            if 0 == got:
+                break
+            pending -= got
+            received += got
+    elapsed = time.perf_counter() - start
+    sender.close()
+    receiver.close()
+    return received / elapsed
+
+
+def run(count=100000):
+    for native in (False, True):
+        if native and BulkSocket.LIBC is None:
+            print("recvmmsg/sendmmsg not available, native path skipped")
+            continue
+        baseline = None
+        for batch in (1, 8, 32, 128):
+            value = loopback(batch=batch, count=count, native=native)
+            baseline = baseline or value
+            name = "{} batch {}".format("recvmmsg/sendmmsg" if native else "recvfrom_into/sendto", batch)
+            report(name, value, baseline=baseline)
+
+
+if "__main__" == __name__:
+
+    try:
+        cycles = int(sys.argv[1])
+    except (BaseException, ):
+        cycles = 100000
+    run(count=cycles)
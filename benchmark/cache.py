@@ -0,0 +1,56 @@
+import socket
+import sys
+from dna.benchmark.util import rate, report
+from dna.middleware.models.cache import ResponseCache
+from dna.middleware.models.manager import Manager
+from dna.middleware.models.route import RouteTable
+from dna.middleware.protocol.transport import Packet
+
+RESOURCES = 16
+
+
+def sensor():
+    # stands in for a device read (bus transaction, conversion), ~20 us
+    return str(sum(range(1000)))
+
+
+def requests(action=0):
+    return [Packet({'id': 1, 'flags': action << 12 | 1 << 11, 'payload': b'',
+                    'request_address': 1 << 32 | 1 << 16 | resource}).pack() for resource in range(1, RESOURCES + 1)]
+
+
+def run(count=100000, ttl=0.05):
+    receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    receiver.bind(("127.0.0.1", 0))
+    sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    reads, writes = requests(action=0), requests(action=1)
+    results = list()
+    for cache in (None, ResponseCache(ttl=ttl)):
+        manager = Manager(cache=cache)
+        manager.add_route(address=1 << 32 | 1 << 16, handler=sensor, mask=RouteTable.COMPONENT_MASK)
+        manager.client_address = receiver.getsockname()
+        index = [0]
+
+        def poll():
+            # several consumers polling the same resources round robin, every 100th request a write
+            index[0] += 1
+            manager.manage(((writes if not index[0] % 100 else reads)[index[0] % RESOURCES], sender))
+
+        results.append(rate(poll, count=count // 10))
+        if cache is not None:
+            stats = cache.stats()
+    report("manage, no cache", results[0])
+    report("manage, cache ttl {} s".format(ttl), results[1], baseline=results[0])
+    print("hit rate {:.1%}, {} invalidations".format(stats['hits'] / max(stats['hits'] + stats['misses'], 1),
+                                                   stats['invalidations']))
+    sender.close()
+    receiver.close()
+
+
+if "__main__" == __name__:
+
+    try:
+        cycles = int(sys.argv[1])
+    except (BaseException, ):
+        cycles = 100000
+    run(count=cycles)
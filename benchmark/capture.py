@@ -0,0 +1,50 @@
+import os
+import sys
+import tempfile
+import time
+from dna.benchmark.util import report
+from dna.middleware.models.capture import Capture, CaptureReader, CaptureWriter, Replayer
+from dna.middleware.models.manager import Manager
+from dna.middleware.protocol.transport import Packet
+
+RESOURCES = 1000
+
+
+def run(count=1000000):
+    path = os.path.join(tempfile.mkdtemp(), 'benchmark.dnp')
+    datagrams = [Packet({'id': resource, 'flags': 1 << 11, 'payload': b'21.5',
+                         'request_address': 1 << 32 | 1 << 16 | resource}).pack() for resource in range(RESOURCES)]
+    start = time.perf_counter()
+    with CaptureWriter(path=path) as writer:
+        for index in range(count):
+            writer.write(data=datagrams[index % RESOURCES], peer=("127.0.0.1", 5000), timestamp=index * 1e-5)
+    report("capture write", count / (time.perf_counter() - start), unit="records/s")
+    print("{} records, {:.1f} MB".format(count, os.path.getsize(path) / 2 ** 20))
+
+    start = time.perf_counter()
+    with CaptureReader(path=path) as reader:
+        print("open (index footer) {:.2f} ms".format((time.perf_counter() - start) * 1000))
+        # one resource out of RESOURCES: full scan and filter vs the index
+        start = time.perf_counter()
+        selected = sum(1 for _, _, data in reader if Capture.match(address=Capture.address(data=data), resource=7))
+        baseline = time.perf_counter() - start
+        print("filter one resource, scan {:.1f} ms".format(baseline * 1000))
+        start = time.perf_counter()
+        assert selected == sum(1 for _ in reader.select(resource=7))
+        elapsed = time.perf_counter() - start
+        print("filter one resource, index {:.1f} ms  (x{:.0f})".format(elapsed * 1000, baseline / elapsed))
+
+        manager = Manager()
+        manager.add(entity='component', _id=1, handler=lambda: True)
+        stats = Replayer(reader=reader, speed=None).replay(manager=manager)
+        report("replay into Manager, as fast as possible", stats['rate'])
+    os.remove(path)
+
+
+if "__main__" == __name__:
+
+    try:
+        cycles = int(sys.argv[1])
+    except (BaseException, ):
+        cycles = 1000000
+    run(count=cycles)
@@ -0,0 +1,78 @@
+import sys
+from dna.benchmark.util import rate, report
+from dna.middleware.protocol.transport import Parser, Packet
+
+
+class BytewiseParser(Parser):
+
+    """
+    Reference byte-by-byte implementation of the Parser, kept as the baseline for the compiled header codec
+    """
+
+    def parse(self, data=None):
+        parts = dict()
+        total = 0
+        for item in self.TEMPLATE:
+            key = None
+            for key, length in item.items():
+                pass
+            merged = 0
+            if length == 0:
+                parts[key] = data[total:]
+                return parts
+            for byte in range(length):
+                try:
+                    merged <<= 8
+                    merged |= data[total]
+                except (BaseException, ):
+                    merged |= 0
+                total += 1
+            parts[key] = merged
+        return parts
+
+    def pack(self, packet=None):
+        response = list()
+        for item in self.TEMPLATE:
+            key, length = None, None
+            for key, length in item.items():
+                pass
+            value = getattr(packet, key)
+            if not value:
+                value = 0
+            partial = list()
+            if 'payload' == key:
+                partial = packet.payload
+            else:
+                if 'flags' == key:
+                    value = value.pack()
+                for byte in range(length):
+                    partial.append(value >> byte * 8 & 2**8-1)
+                partial = reversed(partial)
+            response.extend(partial)
+        return bytes(response)
+
+
+DATAGRAM = bytes([254, 2, 255, 0, 0, 0, 0, 0, 1, 1, 2, 2, 2, 2, 2, 2, 0, 0, 0, 0, 0, 0, 2, 2, 2, 2, 2, 2] + list(range(64)))
+
+
+def run(count=100000):
+    reference, compiled = BytewiseParser(), Parser()
+    assert reference.parse(DATAGRAM) == compiled.parse(DATAGRAM)
+    packet = Packet(compiled.parse(DATAGRAM))
+    assert reference.pack(packet) == compiled.pack(packet) == DATAGRAM
+
+    baseline = rate(lambda: reference.parse(DATAGRAM), count=count)
+    report("Parser.parse (bytewise)", baseline)
+    report("Parser.parse (compiled)", rate(lambda: compiled.parse(DATAGRAM), count=count), baseline=baseline)
+    baseline = rate(lambda: reference.pack(packet), count=count)
+    report("Parser.pack (bytewise)", baseline)
+    report("Parser.pack (compiled)", rate(lambda: compiled.pack(packet), count=count), baseline=baseline)
+
+
+if "__main__" == __name__:
+
+    try:
+        cycles = int(sys.argv[1])
+    except (BaseException, ):
+        cycles = 100000
+    run(count=cycles)
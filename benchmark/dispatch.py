@@ -0,0 +1,71 @@
+import contextlib
+import os
+import sys
+import threading
+import time
+from dna.benchmark.util import report
+from dna.middleware.models.dispatcher import Dispatcher
+from dna.middleware.models.manager import Manager
+
+
+class Socket(object):
+
+    def __init__(self):
+        self.replies = dict()
+        self.lock = threading.Lock()
+
+    def sendto(self, data=None, address=None):
+        # replies counted by response payload
+        payload = bytes(data[28:]) or b'ok'
+        with self.lock:
+            self.replies[payload] = self.replies.get(payload, 0) + 1
+        return len(data)
+
+
+def sensor():
+    time.sleep(0.002)
+    return True
+
+
+def burst(manager=None, count=2000, spawn=False):
+    """
+    :param spawn: start a thread per request (ThreadingMixIn behaviour) instead of calling manage on the receive loop
+    :return: (elapsed seconds, peak thread count, replies by message)
+    """
+    socket = Socket()
+    manager.client_address = ("127.0.0.1", 0)
+    data = bytes([0, 1, 8, 0, 0, 1, 0, 1, 1, 1] + [0] * 18)
+    peak = 0
+    start = time.perf_counter()
+    for _ in range(count):
+        if spawn:
+            threading.Thread(target=manager.manage, args=((data, socket), )).start()
+        else:
+            manager.manage((data, socket))
+        peak = max(peak, threading.active_count())
+    while sum(socket.replies.values()) < count:
+        time.sleep(0.001)
+    return time.perf_counter() - start, peak, socket.replies
+
+
+def run(count=2000):
+    results = list()
+    manager = Manager()
+    manager.add(entity='resource', _id=257, handler=sensor)
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        results.append(("thread per request", ) + burst(manager=manager, count=count, spawn=True))
+        for policy in (Dispatcher.POLICY_BLOCK, Dispatcher.POLICY_REJECT):
+            manager.dispatcher = Dispatcher(workers=8, queue_size=64, policy=policy)
+            results.append(("pool of 8, policy {}".format(policy), ) + burst(manager=manager, count=count))
+            manager.dispatcher.shutdown()
+    for name, elapsed, peak, replies in results:
+        report(name, count / elapsed, unit="requests/s, peak threads {}, replies {}".format(peak, replies))
+
+
+if "__main__" == __name__:
+
+    try:
+        cycles = int(sys.argv[1])
+    except (BaseException, ):
+        cycles = 2000
+    run(count=cycles)
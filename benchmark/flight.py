@@ -0,0 +1,60 @@
+import sys
+import threading
+import time
+from dna.benchmark.server import datagram
+from dna.benchmark.util import report
+from dna.middleware.models.flight import SingleFlight
+from dna.middleware.models.manager import Manager
+
+
+class Socket(object):
+
+    def sendto(self, data=None, address=None):
+        return len(data)
+
+
+def run(clients=64, rounds=10, latency=0.005):
+    """
+    clients threads (one per datagram, as ThreadedUDPServer) read the same slow resource rounds times each
+    """
+    request, socket = datagram(), Socket()
+    bus = threading.Lock()
+    results = list()
+    for flight in (None, SingleFlight()):
+        calls = [0]
+
+        def sensor():
+            # hardware backed read, the bus serves one transaction at a time
+            with bus:
+                calls[0] += 1
+                time.sleep(latency)
+            return b'21.5'
+
+        manager = Manager(flight=flight)
+        manager.add(entity='resource', _id=257, handler=sensor)
+        manager.client_address = ("127.0.0.1", 0)
+
+        def client():
+            for _ in range(rounds):
+                manager.manage((request, socket))
+
+        threads = [threading.Thread(target=client) for _ in range(clients)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        results.append((clients * rounds / (time.perf_counter() - start), calls[0]))
+    print("{} concurrent readers, {} ms handler".format(clients, int(latency * 1000)))
+    report("no coalescing", results[0][0], unit="reads/s, {} handler calls".format(results[0][1]))
+    report("single-flight", results[1][0], unit="reads/s, {} handler calls".format(results[1][1]),
+           baseline=results[0][0])
+
+
+if "__main__" == __name__:
+
+    try:
+        count = int(sys.argv[1])
+    except (BaseException, ):
+        count = 64
+    run(clients=count)
@@ -0,0 +1,69 @@
+import socket
+import sys
+import time
+from concurrent.futures import wait
+from dna.benchmark.server import HOST, datagram
+from dna.benchmark.util import report
+from dna.middleware.endpoint.client import PipelineClient
+from dna.middleware.endpoint.server import Server, ManagedHandler
+from dna.middleware.models.manager import Manager
+from dna.middleware.protocol.flow import FlowControl
+
+# small receive buffer, a burst overflows it the way a fast device overwhelms a loaded service
+RECEIVE_BUFFER = 32768
+
+
+def kernel_drops():
+    """
+    :return: UDP datagrams dropped by the kernel for full receive buffers (Linux), None elsewhere
+    """
+    try:
+        with open('/proc/net/snmp') as snmp:
+            lines = [line.split() for line in snmp if line.startswith('Udp:')]
+        return int(lines[1][lines[0].index('RcvbufErrors')])
+    except (BaseException, ):
+        return None
+
+
+def handler():
+    # a little work per request
+    return sum(range(2000)) > 0
+
+
+def overload(port=None, count=None, flow=None):
+    """
+    :return: (responses/s, failed requests, kernel drops)
+    """
+    manager = Manager(flow=flow)
+    manager.add(entity='resource', _id=257, handler=handler)
+    server = Server(host=HOST, port=port)
+    server.run(handler=ManagedHandler(), manager=manager, block=False)
+    server.server.socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RECEIVE_BUFFER)
+    client = PipelineClient(ip=HOST, port=port, window=1024, timeout=0.5, retries=0, flow_control=flow is not None)
+    message = datagram()
+    drops = kernel_drops()
+    start = time.perf_counter()
+    futures = [client.submit(message) for _ in range(count)]
+    done, _ = wait(futures)
+    elapsed = time.perf_counter() - start
+    failed = len([future for future in done if future.exception() is not None])
+    drops = None if drops is None else kernel_drops() - drops
+    client.close()
+    server.stop()
+    return (count - failed) / elapsed, failed, drops
+
+
+def run(count=5000, port=23520):
+    for offset, (name, flow) in enumerate((("no flow control", None),
+                                           ("flow control, 32 credits", FlowControl(capacity=32)))):
+        value, failed, drops = overload(port=port + offset, count=count, flow=flow)
+        report(name, value, unit="responses/s, dropped {:.1%} (kernel {})".format(failed / count, drops))
+
+
+if "__main__" == __name__:
+
+    try:
+        cycles = int(sys.argv[1])
+    except (BaseException, ):
+        cycles = 5000
+    run(count=cycles)
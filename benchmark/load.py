@@ -0,0 +1,90 @@
+import contextlib
+import os
+import sys
+import time
+from dna.benchmark.util import report, save
+from dna.middleware.endpoint.load import AddressDistribution, LoadGenerator
+from dna.middleware.endpoint.server import Server, AsyncServer, BulkServer, MultiProcessServer, ManagedHandler
+from dna.middleware.models.manager import Manager
+from dna.middleware.models.route import RouteTable
+
+
+HOST = "127.0.0.1"
+
+SERVERS = {
+    'threaded': Server,
+    'asyncio': AsyncServer,
+    'bulk': BulkServer,
+    'multiprocess': MultiProcessServer
+}
+
+
+def manager():
+    """
+    Manager answering any resource of service 1 component 1, module level so multiprocess workers can build it
+    """
+    instance = Manager()
+    instance.add_route(address=RouteTable.address(1, 1), handler=lambda: True, mask=RouteTable.COMPONENT_MASK)
+    return instance
+
+
+def load(mode=None, port=None, **kwargs):
+    """
+    Run a LoadGenerator against a local server of mode, see SERVERS
+    :param kwargs: LoadGenerator arguments
+    :return: LoadGenerator results, with the server mode
+    """
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        server = SERVERS[mode](host=HOST, port=port)
+        server.run(handler=ManagedHandler(), manager=manager if 'multiprocess' == mode else manager(), block=False)
+        # let the server (workers) bind
+        time.sleep(0.5 if 'multiprocess' == mode else 0.1)
+        try:
+            results = LoadGenerator(ip=HOST, port=port, **kwargs).run()
+        finally:
+            server.stop()
+    results['config']['server'] = mode
+    return results
+
+
+def run(modes=None, rate=None, seconds=3.0, workers=2, kind=AddressDistribution.ZIPF, output=None, port=23460):
+    """
+    :param rate: requests/s (open loop), None for a closed loop
+    :param output: JSON results path, "-" for stdout, None to only print the summary
+    """
+    distribution = AddressDistribution(kind=kind, first=1, resources=1024)
+    results = list()
+    for offset, mode in enumerate(modes or sorted(SERVERS)):
+        result = load(mode=mode, port=port + offset, rate=rate, seconds=seconds, workers=workers,
+                      distribution=distribution, seed=1)
+        results.append(result)
+        latency = result['latency_ms']
+        report("{} server".format(mode), result['throughput'],
+               unit="replies/s, p50 {:.3f} p99 {:.3f} p999 {:.3f} ms, loss {:.2%}".format(
+                   latency['p50'], latency['p99'], latency['p999'], result['loss']))
+    if output is not None:
+        save(path=output, results=results)
+    return results
+
+
+if "__main__" == __name__:
+
+    # CLI: load.py [modes, comma separated] [rate, 0 for a closed loop] [seconds] [output.json]
+    try:
+        selected = sys.argv[1].split(',')
+        assert all(mode in SERVERS for mode in selected)
+    except (BaseException, ):
+        selected = None
+    try:
+        offered = float(sys.argv[2]) or None
+    except (BaseException, ):
+        offered = None
+    try:
+        duration = float(sys.argv[3])
+    except (BaseException, ):
+        duration = 3.0
+    try:
+        path = sys.argv[4]
+    except (BaseException, ):
+        path = None
+    run(modes=selected, rate=offered, seconds=duration, output=path)
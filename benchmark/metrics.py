@@ -0,0 +1,49 @@
+import contextlib
+import os
+import sys
+import time
+from dna.benchmark.server import datagram
+from dna.benchmark.util import rate, report
+from dna.middleware.models.entity import QualityOfService
+from dna.middleware.models.manager import Manager
+
+
+class Socket(object):
+
+    def sendto(self, data=None, address=None):
+        return len(data)
+
+
+def manager(qos=None):
+    instance = Manager(qos=qos)
+    instance.add(entity='resource', _id=257, handler=lambda: True)
+    instance.client_address = ("127.0.0.1", 0)
+    return instance
+
+
+def run(count=100000):
+    request = (datagram(), Socket())
+    qos = QualityOfService(max_samples=count)
+    plain, measured = manager(), manager(qos=qos)
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        baseline = rate(lambda: plain.manage(request), count=count)
+        value = rate(lambda: measured.manage(request), count=count)
+    report("manage", baseline)
+    report("manage + QualityOfService", value, baseline=baseline)
+    report("request path overhead", (1 / value - 1 / baseline) * 1e9, unit="ns/packet")
+    start = time.perf_counter()
+    drained = qos.drain()
+    report("drain into histograms (off request path)", (time.perf_counter() - start) / drained * 1e9,
+           unit="ns/sample")
+    for key, stages in qos.read(metrics=['response_time'])['response_time'].items():
+        for stage, values in stages.items():
+            report("{} {} p50".format(key, stage), values['p50'], unit="ns")
+
+
+if "__main__" == __name__:
+
+    try:
+        cycles = int(sys.argv[1])
+    except (BaseException, ):
+        cycles = 100000
+    run(count=cycles)
@@ -0,0 +1,49 @@
+import sys
+import time
+import tracemalloc
+from dna.benchmark.util import rate, report
+from dna.middleware.protocol.transport import Packet, Flags
+
+
+FIELDS = {
+    'id': 30000,
+    'flags': 2 ** 15 + 2 ** 10 + 2 ** 9,
+    'request_address': 2 ** 32 + 2 ** 16 + 1,
+    'response_address': 2 ** 32 + 1,
+    'payload': b'\x00\x01\x02\x03'
+}
+
+
+def build(count=1000000):
+    """
+    :return: seconds spent and bytes held per packet for count live packets
+    """
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    packets = [Packet(FIELDS) for _ in range(count)]
+    elapsed = time.perf_counter() - start
+    size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del packets
+    return elapsed, size / count
+
+
+def run(count=1000000):
+    elapsed, size = build(count=count)
+    report("Packet construction ({:,} live)".format(count), count / elapsed)
+    report("Packet memory", size, unit="bytes/packet")
+    flags = Flags(FIELDS['flags'])
+    report("Flags.pack", rate(flags.pack, count=count // 10))
+    report("Flags.unpack", rate(lambda: flags.unpack(FIELDS['flags']), count=count // 10))
+    report("Flags.fields", rate(flags.fields, count=count // 10))
+    report("Flags attribute read", rate(lambda: flags.action, count=count // 10), unit="reads/s")
+
+
+if "__main__" == __name__:
+
+    try:
+        cycles = int(sys.argv[1])
+    except (BaseException, ):
+        cycles = 1000000
+    run(count=cycles)
@@ -0,0 +1,81 @@
+import collections
+import socket
+import sys
+import threading
+import time
+from concurrent.futures import wait
+from dna.benchmark.server import HOST, datagram
+from dna.benchmark.util import report
+from dna.middleware.endpoint.bulk import BulkSocket
+from dna.middleware.endpoint.client import Client, PipelineClient
+
+
+def echo(port=None, stop=None, delay=0.0):
+    """
+    Echo server, replies with the request datagram (id included) after delay seconds (simulated link/device latency)
+    until stop is set
+    """
+    server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    server.bind((HOST, port))
+    bulk = BulkSocket(socket_instance=server)
+    queue = collections.deque()
+    while not stop.is_set():
+        timeout = max(queue[0][0] - time.monotonic(), 0) if queue else 0.1
+        due = time.monotonic() + delay
+        queue.extend([(due, bytes(data), address) for data, address in bulk.receive(timeout=timeout)])
+        now = time.monotonic()
+        replies = list()
+        while queue and queue[0][0] <= now:
+            _, data, address = queue.popleft()
+            replies.append((data, address))
+        bulk.send(datagrams=replies)
+    server.close()
+
+
+def blocking(port=None, count=10000):
+    client = Client()
+    message = datagram()
+    start = time.perf_counter()
+    for _ in range(count):
+        client.socket.sendto(message, (HOST, port))
+        client.socket.recv(Client.BUFFER_SIZE)
+    elapsed = time.perf_counter() - start
+    client.socket.close()
+    return count / elapsed
+
+
+def pipelined(port=None, count=10000, window=None):
+    client = PipelineClient(ip=HOST, port=port, window=window, timeout=1.0, retries=2)
+    message = datagram()
+    start = time.perf_counter()
+    futures = [client.submit(message) for _ in range(count)]
+    done, failed = wait(futures)
+    elapsed = time.perf_counter() - start
+    client.close()
+    return count / elapsed, len([future for future in done if future.exception() is not None])
+
+
+def run(count=10000, port=23470):
+    for offset, delay in enumerate((0.0, 0.001)):
+        stop = threading.Event()
+        server = threading.Thread(target=echo, args=(port + offset, stop, delay), daemon=True)
+        server.start()
+        time.sleep(0.1)
+        print("echo latency {:.1f} ms".format(delay * 1000))
+        baseline = blocking(port=port + offset, count=count)
+        report("Client send/recv", baseline, unit="requests/s")
+        for window in (1, 8, 32, 128):
+            value, failed = pipelined(port=port + offset, count=count, window=window)
+            report("PipelineClient, window {}".format(window), value, unit="requests/s, failed {}".format(failed),
+                   baseline=baseline)
+        stop.set()
+        server.join()
+
+
+if "__main__" == __name__:
+
+    try:
+        cycles = int(sys.argv[1])
+    except (BaseException, ):
+        cycles = 10000
+    run(count=cycles)
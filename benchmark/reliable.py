@@ -0,0 +1,75 @@
+import heapq
+import sys
+import time
+from dna.benchmark.util import report
+from dna.middleware.protocol.reliable import Deduplicator
+from dna.middleware.util.timer import TimerWheel
+
+
+def heap(count=None):
+    """
+    Retransmit deadlines on a heap, answered requests are skipped lazily when their deadline comes up (the former
+    PipelineClient bookkeeping)
+    :return: (schedules/s, expirations/s)
+    """
+    deadlines, pending = list(), dict()
+    now = time.monotonic()
+    start = time.perf_counter()
+    for _id in range(count):
+        pending[_id] = now + 1.0 + _id * 1e-6
+        heapq.heappush(deadlines, (pending[_id], _id))
+    scheduled = time.perf_counter() - start
+    # half of the requests are answered before their deadline
+    for _id in range(0, count, 2):
+        del pending[_id]
+    start = time.perf_counter()
+    expired = 0
+    later = now + 2.0
+    while deadlines and deadlines[0][0] <= later:
+        deadline, _id = heapq.heappop(deadlines)
+        if pending.get(_id) == deadline:
+            expired += 1
+    return count / scheduled, count / (time.perf_counter() - start)
+
+
+def wheel(count=None):
+    """
+    :return: (schedules/s, expirations/s)
+    """
+    timers = TimerWheel()
+    expired = list()
+    now = time.monotonic()
+    start = time.perf_counter()
+    handles = [timers.schedule(1.0 + _id * 1e-6, expired.append, _id, now=now) for _id in range(count)]
+    scheduled = time.perf_counter() - start
+    for handle in handles[::2]:
+        handle.cancel()
+    start = time.perf_counter()
+    timers.advance(now=now + 2.0)
+    return count / scheduled, count / (time.perf_counter() - start)
+
+
+def run(count=50000):
+    print("{} requests outstanding".format(count))
+    baseline = heap(count=count)
+    report("heap, schedule", baseline[0], unit="timers/s")
+    report("heap, expire", baseline[1], unit="timers/s")
+    value = wheel(count=count)
+    report("timer wheel, schedule", value[0], unit="timers/s", baseline=baseline[0])
+    report("timer wheel, expire", value[1], unit="timers/s", baseline=baseline[1])
+
+    dedup = Deduplicator()
+    peers = [("10.0.0.{}".format(index), 5000) for index in range(64)]
+    start = time.perf_counter()
+    for _id in range(count):
+        dedup.check(peer=peers[_id % 64], _id=_id % 65536)
+    report("dedup window check, 64 peers", count / (time.perf_counter() - start), unit="checks/s")
+
+
+if "__main__" == __name__:
+
+    try:
+        cycles = int(sys.argv[1])
+    except (BaseException, ):
+        cycles = 50000
+    run(count=cycles)
@@ -0,0 +1,55 @@
+import socket
+import sys
+from dna.benchmark.server import datagram
+from dna.benchmark.util import rate, report
+from dna.middleware.models.manager import Manager
+from dna.middleware.protocol.transport import Packet, Parser, ResponseEncoder
+
+
+def run(count=100000):
+    request = datagram()
+    payload = b'21.5'
+    packet = Packet(Parser().parse(request))
+    encoder = ResponseEncoder()
+    assert bytes(encoder.encode(request=request, payload=payload)) == packet.response(payload=payload).pack()
+
+    baseline = rate(lambda: Packet(Parser().parse(request)).response(payload=payload).pack(), count=count)
+    report("parse + Packet.response + pack", baseline)
+    report("ResponseEncoder.encode", rate(lambda: encoder.encode(request=request, payload=payload), count=count),
+           baseline=baseline)
+
+    # constant status replies: encoding the message and the whole header per request vs a patched template
+    status = Manager.ERROR_TARGET_NOT_FOUND
+    assert bytes(encoder.template(request=request, payload=Manager.REPLIES[status])) == \
+        bytes(encoder.encode(request=request, payload=bytes(status, Manager.DEFAULT_ENCODING)))
+    baseline = rate(lambda: encoder.encode(request=request, payload=bytes(status, Manager.DEFAULT_ENCODING)),
+                    count=count)
+    report("status reply, encode", baseline)
+    report("status reply, template", rate(lambda: encoder.template(request=request, payload=Manager.REPLIES[status]),
+                                          count=count), baseline=baseline)
+
+    # reply cost on a real socket, fire-and-forget requests skip the sendto
+    receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    receiver.bind(("127.0.0.1", 0))
+    sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    manager = Manager()
+    manager.add(entity='resource', _id=257, handler=lambda: payload)
+    manager.client_address = receiver.getsockname()
+    fire_and_forget = bytearray(request)
+    fire_and_forget[2] = 0
+    fire_and_forget = bytes(fire_and_forget)
+    baseline = rate(lambda: manager.manage((request, sender)), count=count // 10)
+    report("manage, response required", baseline)
+    report("manage, fire-and-forget", rate(lambda: manager.manage((fire_and_forget, sender)), count=count // 10),
+           baseline=baseline)
+    sender.close()
+    receiver.close()
+
+
+if "__main__" == __name__:
+
+    try:
+        cycles = int(sys.argv[1])
+    except (BaseException, ):
+        cycles = 100000
+    run(count=cycles)
@@ -0,0 +1,117 @@
+import random
+import sys
+import time
+from dna.benchmark.util import rate, report
+from dna.middleware.models.route import RouteTable
+from dna.middleware.protocol.transport import Router
+
+
+class EntityRouter(object):
+
+    """
+    Reference implementation, the Manager routing before route tables: address split, entity chosen by if chain,
+    nested dictionary walk and hasattr on every call, misses raise
+    """
+
+    ENTITY = ['service', 'component', 'resource']
+
+    def __init__(self):
+        self.entities = dict()
+
+    def add(self, entity=None, _id=None, handler=None):
+        if entity not in self.entities.keys():
+            self.entities[entity] = dict()
+        self.entities[entity][_id] = handler
+
+    def route(self, address=None):
+        target_id, component_id, resource_id = Router.route(address)
+        if 0 == target_id:
+            raise Exception("Routing failed, target service/device address is 0")
+        entity = self.ENTITY[0]
+        _id = target_id
+        if 0 != component_id:
+            entity = self.ENTITY[1]
+            _id = component_id
+            if 0 != resource_id:
+                entity = self.ENTITY[2]
+                _id = resource_id
+        return entity, _id
+
+    def dispatch(self, address=None, payload=None):
+        try:
+            entity, _id = self.route(address)
+            handler = self.entities[entity][_id]
+        except (BaseException, ):
+            return None
+        if hasattr(handler, "__call__"):
+            return handler()
+        return handler.handle(payload)
+
+
+def handler():
+    return True
+
+
+def addresses(count=100000):
+    """
+    :return: count distinct resource addresses spread over components of service 1
+    """
+    return [RouteTable.address(1, 1 + index // 1000, 1 + index % 1000) for index in range(count)]
+
+
+def run(count=100000, routes=100000):
+    registered = addresses(count=routes)
+    random.seed(7)
+    hits = [random.choice(registered) for _ in range(1000)]
+    misses = [RouteTable.address(2, 1, 2000 + index) for index in range(1000)]
+
+    # entity routes only reach 2^16 resource ids, the reference router registers what it can
+    reference = EntityRouter()
+    for address in registered[:2 ** 16 - 1]:
+        reference.add(entity='resource', _id=address & RouteTable.ID_MASK, handler=handler)
+
+    table = RouteTable()
+    start = time.perf_counter()
+    for address in registered:
+        table.add(address=address, handler=handler)
+    report("RouteTable.add, {} exact routes".format(routes), routes / (time.perf_counter() - start), unit="routes/s")
+    table.add(address=RouteTable.address(3, 7), handler=handler, mask=RouteTable.COMPONENT_MASK)
+    wildcard = [RouteTable.address(3, 7, index + 1) for index in range(1000)]
+
+    def lookups(router=None, batch=None):
+        def function():
+            for address in batch:
+                router(address)
+        return function
+
+    def invoke(address=None):
+        route = table.lookup(address)
+        if route is not None:
+            return route.invoke(None)
+
+    cycles = max(count // 1000, 1)
+    baseline = rate(lookups(reference.dispatch, hits), count=cycles) * 1000
+    report("reference route + dispatch, hit", baseline, unit="lookups/s")
+    report("RouteTable lookup + invoke, hit", rate(lookups(invoke, hits), count=cycles) * 1000, unit="lookups/s",
+           baseline=baseline)
+    report("RouteTable lookup + invoke, wildcard", rate(lookups(invoke, wildcard), count=cycles) * 1000,
+           unit="lookups/s", baseline=baseline)
+    baseline = rate(lookups(reference.dispatch, misses), count=cycles) * 1000
+    report("reference route + dispatch, miss", baseline, unit="lookups/s")
+    report("RouteTable lookup, miss", rate(lookups(table.lookup, misses), count=cycles) * 1000, unit="lookups/s",
+           baseline=baseline)
+
+    start = time.perf_counter()
+    for address in registered[:10000]:
+        table.remove(address=address)
+        table.add(address=address, handler=handler)
+    report("RouteTable remove + add", 10000 / (time.perf_counter() - start), unit="updates/s")
+
+
+if "__main__" == __name__:
+
+    try:
+        cycles = int(sys.argv[1])
+    except (BaseException, ):
+        cycles = 100000
+    run(count=cycles)
@@ -0,0 +1,58 @@
+import contextlib
+import multiprocessing
+import os
+import sys
+import time
+from dna.benchmark.server import HOST, blast, manager
+from dna.benchmark.util import report
+from dna.middleware.endpoint.server import MultiProcessServer, ManagedHandler
+
+
+CLIENTS = 8
+
+
+def client(port=None, count=None, results=None):
+    results.put(blast(port=port, count=count, window=32))
+
+
+def load(port=None, count=None):
+    """
+    Closed loop load from CLIENTS processes (distinct source ports, so SO_REUSEPORT spreads them over the workers)
+    :return: (replies/s, lost)
+    """
+    results = multiprocessing.Queue()
+    clients = [multiprocessing.Process(target=client, args=(port, count // CLIENTS, results))
+               for _ in range(CLIENTS)]
+    start = time.perf_counter()
+    for process in clients:
+        process.start()
+    outcomes = [results.get() for _ in clients]
+    elapsed = time.perf_counter() - start
+    for process in clients:
+        process.join()
+    lost = sum([lost for rate, lost in outcomes])
+    return (count // CLIENTS * CLIENTS - lost) / elapsed, lost
+
+
+def run(count=40000, port=23490):
+    results = list()
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        for offset, workers in enumerate((1, 2, 4, 8)):
+            server = MultiProcessServer(host=HOST, port=port + offset, workers=workers)
+            server.run(handler=ManagedHandler(), manager=manager(), block=False)
+            time.sleep(0.5)
+            results.append((workers, ) + load(port=port + offset, count=count))
+            server.stop()
+    print("{} CPU(s), {} client processes".format(os.cpu_count(), CLIENTS))
+    baseline = results[0][1]
+    for workers, value, lost in results:
+        report("{} worker(s)".format(workers), value, unit="replies/s, lost {}".format(lost), baseline=baseline)
+
+
+if "__main__" == __name__:
+
+    try:
+        cycles = int(sys.argv[1])
+    except (BaseException, ):
+        cycles = 40000
+    run(count=cycles)
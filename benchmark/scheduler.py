@@ -0,0 +1,81 @@
+import heapq
+import sys
+import time
+from dna.benchmark.server import HOST, datagram
+from dna.benchmark.util import report
+from dna.middleware.endpoint.client import Client
+from dna.middleware.endpoint.server import BulkServer, ManagedHandler
+from dna.middleware.models.manager import Manager
+from dna.middleware.models.scheduler import Scheduler
+
+INTERVALS = (0.05, 0.1, 0.2, 0.5)
+
+
+def sequential(port=None, devices=None, seconds=None):
+    """
+    One blocking request per due device, sleeping until the next one is due (the client CLI loop, generalised)
+    :return: (requests/s, p99 lag in ms)
+    """
+    client = Client()
+    message = datagram()
+    now = time.monotonic()
+    queue = [(now + index * INTERVALS[index % len(INTERVALS)] / devices, index) for index in range(devices)]
+    heapq.heapify(queue)
+    lags, sent = list(), 0
+    deadline = now + seconds
+    while time.monotonic() < deadline:
+        due, index = heapq.heappop(queue)
+        delay = due - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        lags.append(max(time.monotonic() - due, 0))
+        client.send(message=message, ip=HOST, port=port)
+        sent += 1
+        heapq.heappush(queue, (due + INTERVALS[index % len(INTERVALS)], index))
+    client.socket.close()
+    lags.sort()
+    return sent / seconds, lags[int(len(lags) * 0.99)] * 1000
+
+
+def scheduled(port=None, devices=None, seconds=None):
+    """
+    :return: (requests/s, p99 lag in ms, requests per batched send, responses)
+    """
+    scheduler = Scheduler()
+    for index in range(devices):
+        scheduler.add(packet=datagram(), ip=HOST, port=port, interval=INTERVALS[index % len(INTERVALS)],
+                      callback=lambda job, response: None)
+    scheduler.run(block=False)
+    time.sleep(seconds)
+    scheduler.stop()
+    stats = scheduler.stats()
+    return stats['sent'] / seconds, stats['lag']['p99'] / 1e6, stats['sent'] / max(stats['batches'], 1), \
+        stats['received']
+
+
+def run(devices=8000, seconds=3.0, port=23530):
+    manager = Manager()
+    manager.add(entity='resource', _id=257, handler=lambda: True)
+    server = BulkServer(host=HOST, port=port)
+    server.run(handler=ManagedHandler(), manager=manager, block=False)
+    # requests per second the schedule asks for
+    target = sum(1 / INTERVALS[index % len(INTERVALS)] for index in range(devices))
+    print("{} devices polled every {} s, {:,.0f} requests/s due".format(devices, INTERVALS, target))
+    try:
+        baseline, lag = sequential(port=port, devices=devices, seconds=seconds)
+        report("sequential loop", baseline, unit="requests/s, p99 lag {:.1f} ms".format(lag))
+        value, lag, batch, received = scheduled(port=port, devices=devices, seconds=seconds)
+        report("scheduler", value, baseline=baseline,
+               unit="requests/s, p99 lag {:.1f} ms, {:.1f} requests per send, {} responses".format(lag, batch,
+                                                                                                   received))
+    finally:
+        server.stop()
+
+
+if "__main__" == __name__:
+
+    try:
+        count = int(sys.argv[1])
+    except (BaseException, ):
+        count = 8000
+    run(devices=count)
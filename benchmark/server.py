@@ -0,0 +1,79 @@
+import contextlib
+import os
+import socket
+import sys
+import time
+from dna.benchmark.util import report
+from dna.middleware.endpoint.server import Server, AsyncServer, ManagedHandler
+from dna.middleware.models.manager import Manager
+from dna.middleware.protocol.transport import Packet, Flags
+
+
+HOST = "127.0.0.1"
+
+
+def datagram(resource=257):
+    flags = Flags(0)
+    flags.response_required = 1
+    return Packet({
+        'id': 1,
+        'flags': flags,
+        'request_address': 1 << 32 | 1 << 16 | resource,
+        'payload': b'\x00' * 16
+    }).pack()
+
+
+def blast(port=None, count=10000, window=32, timeout=1.0):
+    """
+    Closed loop load, keeps window requests in flight and sends a new one for every reply
+    :return: (replies/s, lost)
+    """
+    client = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    client.settimeout(timeout)
+    message = datagram()
+    sent, received = 0, 0
+    start = time.perf_counter()
+    while sent < min(window, count):
+        client.sendto(message, (HOST, port))
+        sent += 1
+    while received < sent:
+        try:
+            client.recv(1024)
+        except (socket.timeout, ):
+            break
+        received += 1
+        if sent < count:
+            client.sendto(message, (HOST, port))
+            sent += 1
+    elapsed = time.perf_counter() - start
+    client.close()
+    return received / elapsed, count - received
+
+
+def manager():
+    instance = Manager()
+    instance.add(entity='resource', _id=257, handler=lambda: True)
+    return instance
+
+
+def run(count=10000, port=23450):
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        servers = [("threaded", Server(host=HOST, port=port)), ("asyncio", AsyncServer(host=HOST, port=port + 1))]
+        for name, server in servers:
+            server.run(handler=ManagedHandler(), manager=manager(), block=False)
+        results = list()
+        for offset, (name, server) in enumerate(servers):
+            for window in (1, 32):
+                results.append(("{} server, window {}".format(name, window),) + blast(port + offset, count, window))
+            server.stop()
+    for name, value, lost in results:
+        report(name, value, unit="replies/s, lost {}".format(lost))
+
+
+if "__main__" == __name__:
+
+    try:
+        cycles = int(sys.argv[1])
+    except (BaseException, ):
+        cycles = 10000
+    run(count=cycles)
@@ -0,0 +1,168 @@
+"""
+Microbenchmarks of the protocol primitives over fixed datasets (small and large payloads, managers with few and many
+registered entities). Rates are best of 5 rounds; baselines are stored in baselines.json and only comparable on the
+machine (and Python) they were saved on, see environment in the file.
+
+    python -m dna.benchmark.suite save       # store the current rates as baselines
+    python -m dna.benchmark.suite compare    # exit status 1 when a case is more than threshold slower than baseline
+"""
+
+import gc
+import json
+import os
+import sys
+from dna.benchmark.util import rate, report, save
+from dna.middleware.models.manager import Manager
+from dna.middleware.protocol.transport import Flags, Packet, Parser, Router
+
+
+BASELINES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines.json')
+
+# allowed throughput drop against the baseline before compare fails
+DEFAULT_THRESHOLD = 0.2
+
+SMALL = 16
+LARGE = 1400
+# registered resource entities of the "many" manager, entity ids are 16 bit
+MANY = 50000
+
+
+def handler():
+    return True
+
+
+def header(resource=257, payload_size=SMALL):
+    flags = Flags(0)
+    flags.response_required = 1
+    return {
+        'id': 1,
+        'flags': flags,
+        'request_address': 1 << 32 | 1 << 16 | resource,
+        'response_address': 2 << 32 | 1 << 16 | 1,
+        'data_window_start': 0,
+        'data_window_end': 0,
+        'payload': bytes(range(256)) * (payload_size // 256) + bytes(payload_size % 256)
+    }
+
+
+def manager(entities=1):
+    instance = Manager()
+    for _id in range(1, entities + 1):
+        instance.add(entity='resource', _id=_id, handler=handler)
+    return instance
+
+
+def cases():
+    """
+    :return: (name, callable without arguments) pairs, the fixed datasets are built once here
+    """
+    parser = Parser()
+    small, large = Packet(header(payload_size=SMALL)), Packet(header(payload_size=LARGE))
+    small_data, large_data = small.pack(), large.pack()
+    fields, large_fields = header(payload_size=SMALL), header(payload_size=LARGE)
+    flags = Flags(fields['flags'].pack())
+    bits = flags.pack()
+    address = fields['request_address']
+    few, many = manager(entities=10), manager(entities=MANY)
+    # both managers are asked for the last resource registered
+    last_few = (Packet(header(resource=10, payload_size=SMALL)).pack(), None)
+    last_many = (Packet(header(resource=MANY, payload_size=SMALL)).pack(), None)
+    return [
+        ("Parser.parse small", lambda: parser.parse(small_data)),
+        ("Parser.parse large", lambda: parser.parse(large_data)),
+        ("Parser.pack small", lambda: parser.pack(small)),
+        ("Parser.pack large", lambda: parser.pack(large)),
+        ("Flags.pack", flags.pack),
+        ("Flags.unpack", lambda: flags.unpack(bits)),
+        ("Router.route", lambda: Router.route(address)),
+        ("Packet small", lambda: Packet(fields)),
+        ("Packet large", lambda: Packet(large_fields)),
+        ("Manager.route 10 entities", lambda: few.route(request=last_few)),
+        ("Manager.route {} entities".format(MANY), lambda: many.route(request=last_many)),
+        ("Manager.dispatch 10 entities", lambda: few.dispatch(entity='resource', _id=10)),
+        ("Manager.dispatch {} entities".format(MANY), lambda: many.dispatch(entity='resource', _id=MANY))
+    ]
+
+
+def measure(count=100000, pattern=None):
+    """
+    :param pattern: only run the cases whose name contains pattern
+    :return: case name -> calls/s
+    """
+    results = dict()
+    # as timeit, collections triggered by the (large) datasets are not charged to the case measured
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for name, function in cases():
+            if pattern is None or pattern in name:
+                results[name] = rate(function, count=count, repeat=5)
+    finally:
+        if enabled:
+            gc.enable()
+    return results
+
+
+def compare(results=None, baselines=None, threshold=DEFAULT_THRESHOLD):
+    """
+    :return: names of the cases slower than (1 - threshold) times their baseline, cases without one are skipped
+    """
+    return [name for name, value in results.items()
+            if name in baselines and value < baselines[name] * (1.0 - threshold)]
+
+
+def load(path=BASELINES):
+    with open(path) as source:
+        return json.load(source)['results']
+
+
+def run(mode="run", count=100000, threshold=DEFAULT_THRESHOLD, pattern=None, path=BASELINES):
+    """
+    :param mode: run (print the rates), save (store them as baselines) or compare (against the stored baselines)
+    :return: names of the cases that regressed (compare), otherwise an empty list
+    """
+    baselines = load(path=path) if "compare" == mode else dict()
+    results = measure(count=count, pattern=pattern)
+    for name, value in results.items():
+        report(name, value, unit="calls/s", baseline=baselines.get(name))
+    if "save" == mode:
+        if pattern is not None and os.path.exists(path):
+            # a partial run only replaces the baselines it measured
+            results = dict(load(path=path), **results)
+        save(path=path, results=results)
+    if "compare" != mode:
+        return list()
+    regressions = compare(results=results, baselines=baselines, threshold=threshold)
+    if regressions:
+        # confirm on a second measurement, a single slow run is usually noise (other processes, frequency scaling)
+        for name in regressions:
+            results[name] = max(results[name], measure(count=count, pattern=name)[name])
+        regressions = compare(results=results, baselines=baselines, threshold=threshold)
+    for name in regressions:
+        print("REGRESSION {}: {:,.0f} calls/s, baseline {:,.0f}, allowed drop {:.0%}".format(
+            name, results[name], baselines[name], threshold))
+    return regressions
+
+
+if "__main__" == __name__:
+
+    # CLI: suite.py [run|save|compare] [threshold, e.g. 0.2 for a 20% drop] [cycles] [case name filter]
+    try:
+        selected = sys.argv[1]
+        assert selected in ("run", "save", "compare")
+    except (BaseException, ):
+        selected = "run"
+    try:
+        allowed = float(sys.argv[2])
+        assert 0.0 <= allowed < 1.0
+    except (BaseException, ):
+        allowed = DEFAULT_THRESHOLD
+    try:
+        cycles = int(sys.argv[3])
+    except (BaseException, ):
+        cycles = 100000
+    try:
+        name_filter = sys.argv[4]
+    except (BaseException, ):
+        name_filter = None
+    sys.exit(1 if run(mode=selected, count=cycles, threshold=allowed, pattern=name_filter) else 0)
@@ -0,0 +1,62 @@
+import datetime
+import json
+import os
+import platform
+import subprocess
+import time
+
+
+def rate(function=None, count=100000, repeat=3):
+    """
+    :param function: callable without arguments, called count times per round
+    :return: best calls per second out of repeat rounds
+    """
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(count):
+            function()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return count / best
+
+
+def report(name=None, value=None, unit="packets/s", baseline=None):
+    line = "{:<40} {:>14,.0f} {}".format(name, value, unit)
+    if baseline:
+        line += "  (x{:.2f})".format(value / baseline)
+    print(line)
+
+
+def environment():
+    """
+    :return: where and when a benchmark ran, stored along with its JSON results
+    """
+    try:
+        revision = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=os.path.dirname(__file__),
+                                  stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, timeout=5,
+                                  check=True).stdout.decode().strip()
+    except (BaseException, ):
+        revision = None
+    return {
+        'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'revision': revision,
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count()
+    }
+
+
+def save(path=None, results=None):
+    """
+    Write results (JSON serializable) along with the environment, to stdout if path is "-"
+    """
+    document = {'environment': environment(), 'results': results}
+    if "-" == path:
+        print(json.dumps(document, indent=2))
+        return document
+    with open(path, 'w') as output:
+        json.dump(document, output, indent=2)
+    return document
@@ -0,0 +1,54 @@
+import sys
+import tracemalloc
+from dna.benchmark.util import rate, report
+from dna.benchmark.codec import DATAGRAM
+from dna.middleware.protocol.transport import Parser, Packet, PacketView, Router
+
+
+def parsed_route(data=None):
+    packet = Packet(Parser().parse(data))
+    return Router.route(packet.request_address), packet.payload, packet
+
+
+def view_route(data=None):
+    packet = PacketView(data)
+    return Router.route(packet.request_address), packet.payload, packet
+
+
+def view_address(data=None):
+    packet = PacketView(data)
+    return Router.route(packet.request_address), packet
+
+
+def allocated(function=None, count=10000):
+    """
+    :return: bytes allocated per packet, results are kept alive so that everything a packet holds is counted
+    """
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    kept = [function(DATAGRAM) for _ in range(count)]
+    size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del kept
+    return size / count
+
+
+def run(count=100000):
+    assert parsed_route(DATAGRAM)[0] == view_route(DATAGRAM)[0]
+    assert bytes(parsed_route(DATAGRAM)[1]) == bytes(view_route(DATAGRAM)[1])
+
+    baseline = rate(lambda: parsed_route(DATAGRAM), count=count)
+    report("route via Parser + Packet", baseline)
+    report("route via PacketView", rate(lambda: view_route(DATAGRAM), count=count), baseline=baseline)
+    report("allocated, Parser + Packet", allocated(parsed_route), unit="bytes/packet")
+    report("allocated, PacketView", allocated(view_route), unit="bytes/packet")
+    report("allocated, PacketView (address only)", allocated(view_address), unit="bytes/packet")
+
+
+if "__main__" == __name__:
+
+    try:
+        cycles = int(sys.argv[1])
+    except (BaseException, ):
+        cycles = 100000
+    run(count=cycles)
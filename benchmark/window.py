@@ -0,0 +1,82 @@
+import os
+import sys
+import time
+from dna.benchmark.server import HOST
+from dna.benchmark.util import report
+from dna.middleware.endpoint.server import BulkServer, Handler, ManagedHandler
+from dna.middleware.models.manager import Manager
+from dna.middleware.models.route import RouteTable
+from dna.middleware.protocol.transport import Packet, Flags
+from dna.middleware.protocol.window import WindowReceiver, WindowTransfer
+
+MB = 2 ** 20
+
+
+class Blob(Handler):
+
+    """
+    Resource holding a blob: written with a windowed request, read back with a windowed response
+    """
+
+    def __init__(self):
+        super(Blob, self).__init__()
+        self.data = b''
+
+    def handle(self, payload=None):
+        if len(payload):
+            self.data = bytes(payload)
+            return True
+        return self.data
+
+
+def message(payload=b''):
+    flags = Flags(0)
+    flags.response_required = 1
+    return Packet({'id': 1, 'flags': flags, 'request_address': RouteTable.address(1, 1, 1), 'payload': payload}).pack()
+
+
+def transfer(port=None, size=None, window=None):
+    """
+    :return: (write MB/s, read MB/s) of a size byte blob
+    """
+    blob = os.urandom(size)
+    client = WindowTransfer(size=window)
+    try:
+        start = time.perf_counter()
+        client.send(address=(HOST, port), message=message(blob))
+        written = time.perf_counter() - start
+        start = time.perf_counter()
+        data = client.request(address=(HOST, port), message=message())
+        read = time.perf_counter() - start
+        assert bytes(data) == blob
+    finally:
+        client.close()
+    return size / MB / written, size / MB / read
+
+
+def run(largest=100, port=23500):
+    manager = Manager()
+    manager.add_route(address=RouteTable.address(1, 1, 1), handler=Blob())
+    server = BulkServer(host=HOST, port=port)
+    server.run(handler=ManagedHandler(), manager=manager, block=False)
+    try:
+        # a single window in flight: the writer waits for every acknowledgement (reads use the service window)
+        baseline, _ = transfer(port=port, size=MB, window=WindowReceiver.DEFAULT_ACK_EVERY)
+        report("1 MB write, one window in flight", baseline, unit="MB/s")
+        for megabytes in (1, 10, 100):
+            if megabytes > largest:
+                break
+            written, read = transfer(port=port, size=megabytes * MB)
+            report("{} MB write".format(megabytes), written, unit="MB/s", baseline=baseline)
+            report("{} MB read".format(megabytes), read, unit="MB/s")
+    finally:
+        server.stop()
+
+
+if "__main__" == __name__:
+
+    try:
+        megabytes = int(sys.argv[1])
+    except (BaseException, ):
+        megabytes = 100
+    run(largest=megabytes)
@@ -0,0 +1,151 @@
+import threading
+import time
+
+
+class BufferPoolException(Exception):
+    pass
+
+
+class Slab(object):
+
+    """
+    Reusable receive buffer, leased from a BufferPool and returned with release()
+    """
+
+    __slots__ = ['buffer', 'view', 'pool', 'leased_at', 'owner', 'length', 'received']
+
+    def __init__(self, size=None, pool=None):
+        self.buffer = bytearray(size)
+        self.view = memoryview(self.buffer)
+        self.pool = pool
+        self.leased_at = None
+        self.owner = None
+        self.length = 0
+        # perf_counter_ns when the datagram was received into the slab
+        self.received = None
+
+    @property
+    def data(self):
+        """
+        :return: view of the received bytes
+        """
+        return self.view[:self.length]
+
+    def release(self):
+        self.pool.release(self)
+
+
+class BufferPool(object):
+
+    """
+    Pool of preallocated receive slabs. Leased slabs are tracked so that slabs never returned (handlers holding on to
+    them, missing release calls) can be reported, see leaks().
+
+    When the pool is empty a new slab is allocated up to max_slabs (counted as a miss), past that acquire() blocks or
+    raises depending on block.
+    """
+
+    DEFAULT_SLAB_SIZE = 8192
+    DEFAULT_SLABS = 64
+    DEFAULT_MAX_SLABS = 1024
+
+    ERROR_EXHAUSTED = "Buffer pool exhausted, {} slabs leased"
+    ERROR_FOREIGN = "Slab does not belong to this pool"
+    ERROR_NOT_LEASED = "Slab released twice or never leased"
+
+    def __init__(self, slab_size=None, slabs=None, max_slabs=None, block=True):
+        self.slab_size = slab_size or self.DEFAULT_SLAB_SIZE
+        self.max_slabs = max_slabs or self.DEFAULT_MAX_SLABS
+        self.block = block
+        self.free = list()
+        self.leased = dict()
+        # the fast path relies on list.pop/append and dict item assignment/pop being atomic, the lock only guards
+        # growing the pool and waiting for a release
+        self.lock = threading.Lock()
+        self.available = threading.Condition(self.lock)
+        self.size = 0
+        self.acquired = 0
+        self.misses = 0
+        self.waits = 0
+        self.waiting = 0
+        # datagrams a server dropped because no slab became available
+        self.dropped = 0
+        self.high_watermark = 0
+        for _ in range(min(slabs or self.DEFAULT_SLABS, self.max_slabs)):
+            self.free.append(Slab(size=self.slab_size, pool=self))
+            self.size += 1
+
+    def acquire(self, timeout=None):
+        try:
+            slab = self.free.pop()
+        except (IndexError, ):
+            with self.lock:
+                slab = self._grow(timeout=timeout)
+        slab.leased_at = time.monotonic()
+        slab.owner = threading.get_ident()
+        self.leased[id(slab)] = slab
+        self.acquired += 1
+        if len(self.leased) > self.high_watermark:
+            self.high_watermark = len(self.leased)
+        return slab
+
+    def _grow(self, timeout=None):
+        """
+        Pool is empty, called holding the lock: allocate a new slab or wait for a release
+        """
+        if self.free:
+            return self.free.pop()
+        if self.size < self.max_slabs:
+            self.size += 1
+            self.misses += 1
+            return Slab(size=self.slab_size, pool=self)
+        if not self.block:
+            raise BufferPoolException(self.ERROR_EXHAUSTED.format(len(self.leased)))
+        self.waits += 1
+        self.waiting += 1
+        try:
+            if not self.available.wait_for(lambda: len(self.free) > 0, timeout=timeout):
+                raise BufferPoolException(self.ERROR_EXHAUSTED.format(len(self.leased)))
+        finally:
+            self.waiting -= 1
+        return self.free.pop()
+
+    def release(self, slab=None):
+        if slab.pool is not self:
+            raise BufferPoolException(self.ERROR_FOREIGN)
+        if self.leased.pop(id(slab), None) is None:
+            raise BufferPoolException(self.ERROR_NOT_LEASED)
+        slab.leased_at = None
+        slab.length = 0
+        self.free.append(slab)
+        if self.waiting:
+            with self.lock:
+                self.available.notify()
+
+    def leaks(self, older_than=1.0):
+        """
+        :param older_than: seconds a slab has to be leased to be reported
+        :return: list of (owner thread ident, seconds leased) for slabs leased longer than older_than
+        """
+        now = time.monotonic()
+        leaks = list()
+        for slab in list(self.leased.values()):
+            leased_at = slab.leased_at
+            if leased_at is not None and now - leased_at > older_than:
+                leaks.append((slab.owner, now - leased_at))
+        return leaks
+
+    def stats(self):
+        leased = len(self.leased)
+        with self.lock:
+            return {
+                'size': self.size,
+                'free': len(self.free),
+                'leased': leased,
+                'acquired': self.acquired,
+                'released': self.acquired - leased,
+                'misses': self.misses,
+                'waits': self.waits,
+                'dropped': self.dropped,
+                'high_watermark': self.high_watermark
+            }
@@ -0,0 +1,323 @@
+import ctypes
+import ctypes.util
+import errno
+import select
+import socket
+import struct
+
+
+class BulkException(Exception):
+    pass
+
+
+class IOVec(ctypes.Structure):
+    _fields_ = [('iov_base', ctypes.c_void_p), ('iov_len', ctypes.c_size_t)]
+
+
+class MsgHdr(ctypes.Structure):
+    _fields_ = [
+        ('msg_name', ctypes.c_void_p),
+        ('msg_namelen', ctypes.c_uint32),
+        ('msg_iov', ctypes.c_void_p),
+        ('msg_iovlen', ctypes.c_size_t),
+        ('msg_control', ctypes.c_void_p),
+        ('msg_controllen', ctypes.c_size_t),
+        ('msg_flags', ctypes.c_int)
+    ]
+
+
+class MMsgHdr(ctypes.Structure):
+    _fields_ = [('msg_hdr', MsgHdr), ('msg_len', ctypes.c_uint)]
+
+
+def libc():
+    """
+    :return: libc exposing recvmmsg/sendmmsg or None (non Linux platforms, old kernels/libc)
+    """
+    try:
+        library = ctypes.CDLL(ctypes.util.find_library('c') or None, use_errno=True)
+        assert hasattr(library, 'recvmmsg') and hasattr(library, 'sendmmsg')
+    except (BaseException, ):
+        return None
+    library.recvmmsg.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_uint, ctypes.c_int, ctypes.c_void_p]
+    library.recvmmsg.restype = ctypes.c_int
+    library.sendmmsg.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_uint, ctypes.c_int]
+    library.sendmmsg.restype = ctypes.c_int
+    return library
+
+
+class MessageVector(object):
+
+    """
+    Preallocated mmsghdr/iovec arrays over a contiguous data slab, one slot (message, iovec, sockaddr and buffer_size
+    bytes of data) per datagram. Fields are patched with precompiled structs instead of ctypes attribute access.
+    """
+
+    # AF_INET only, the kernel never writes more than a sockaddr_in
+    SOCKADDR_SIZE = 16
+
+    POINTER = struct.Struct('@P')
+    SIZE = struct.Struct('@N')
+    UINT = struct.Struct('@I')
+
+    def __init__(self, batch=None, buffer_size=None):
+        self.batch = batch
+        self.buffer_size = buffer_size
+        self.message_size = ctypes.sizeof(MMsgHdr)
+        self.iovec_size = ctypes.sizeof(IOVec)
+        self.data = bytearray(batch * buffer_size)
+        self.names = bytearray(batch * self.SOCKADDR_SIZE)
+        self.messages = bytearray(batch * self.message_size)
+        self.iovecs = bytearray(batch * self.iovec_size)
+        # ctypes views pin the bytearrays (no resize) and expose their addresses
+        self._pinned = [(ctypes.c_char * len(item)).from_buffer(item)
+                        for item in (self.data, self.names, self.messages, self.iovecs)]
+        data, names, self.address, iovecs = [ctypes.addressof(item) for item in self._pinned]
+        self.namelen_offset = MsgHdr.msg_namelen.offset
+        self.flags_offset = MsgHdr.msg_flags.offset
+        self.len_offset = MMsgHdr.msg_len.offset
+        self.iov_len_offset = IOVec.iov_len.offset
+        self.harvesters = dict()
+        for index in range(batch):
+            message = index * self.message_size
+            iovec = index * self.iovec_size
+            self.POINTER.pack_into(self.iovecs, iovec, data + index * buffer_size)
+            self.SIZE.pack_into(self.iovecs, iovec + self.iov_len_offset, buffer_size)
+            self.POINTER.pack_into(self.messages, message + MsgHdr.msg_name.offset, names + index * self.SOCKADDR_SIZE)
+            self.UINT.pack_into(self.messages, message + self.namelen_offset, self.SOCKADDR_SIZE)
+            self.POINTER.pack_into(self.messages, message + MsgHdr.msg_iov.offset, iovecs + iovec)
+            self.SIZE.pack_into(self.messages, message + MsgHdr.msg_iovlen.offset, 1)
+
+    def harvest(self, count=None):
+        """
+        :return: received lengths, message flags and peer names (port + IPv4 address bytes) of the first count slots,
+                 each read with a single struct call compiled once per count
+        """
+        try:
+            messages, names = self.harvesters[count]
+        except (KeyError, ):
+            # msg_flags (in msg_hdr) comes before msg_len
+            layout = '{}xi{}xI{}x'.format(self.flags_offset, self.len_offset - self.flags_offset - 4,
+                                         self.message_size - self.len_offset - 4)
+            messages = struct.Struct('=' + layout * count)
+            names = struct.Struct('=' + '2x6s8x' * count)
+            self.harvesters[count] = messages, names
+        values = messages.unpack_from(self.messages)
+        return values[1::2], values[0::2], names.unpack_from(self.names)
+
+    def set(self, index=None, data=None, name=None):
+        """
+        Copy an outgoing datagram and its destination sockaddr into slot index
+        """
+        start = index * self.buffer_size
+        self.data[start:start + len(data)] = data
+        self.SIZE.pack_into(self.iovecs, index * self.iovec_size + self.iov_len_offset, len(data))
+        offset = index * self.SOCKADDR_SIZE
+        self.names[offset:offset + self.SOCKADDR_SIZE] = name
+
+
+class BulkSocket(object):
+
+    """
+    Batched datagram I/O over a UDP (AF_INET) socket. Uses recvmmsg/sendmmsg on Linux, one syscall per batch, and
+    falls back to recvfrom_into/sendto loops elsewhere.
+
+    Received datagrams are memoryviews into preallocated buffers, they stay valid until the next receive call.
+    Datagrams longer than buffer_size are dropped on receive (counted in truncated) rather than handed over cut short.
+    """
+
+    DEFAULT_BATCH = 32
+    DEFAULT_BUFFER_SIZE = 2048
+    MSG_DONTWAIT = getattr(socket, 'MSG_DONTWAIT', 0x40)
+    MSG_TRUNC = getattr(socket, 'MSG_TRUNC', 0x20)
+    RETRY = (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR)
+    # datagram larger than the buffer (Windows reports it instead of truncating)
+    OVERSIZED = (errno.EMSGSIZE, getattr(errno, 'WSAEMSGSIZE', errno.EMSGSIZE))
+
+    ERROR_FAMILY = "Bulk socket supports AF_INET datagram sockets only"
+    ERROR_RECEIVE = "Batch receive failed: {}"
+    ERROR_SEND = "Batch send failed: {}"
+
+    LIBC = libc()
+
+    def __init__(self, socket_instance=None, batch=None, buffer_size=None, native=True):
+        """
+        :param batch: maximum datagrams per receive/send call
+        :param buffer_size: preallocated bytes per datagram, longer datagrams are dropped on receive
+        :param native: use recvmmsg/sendmmsg when available
+        """
+        if socket_instance is None:
+            socket_instance = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            assert socket.AF_INET == socket_instance.family
+        except (BaseException, ):
+            raise BulkException(self.ERROR_FAMILY)
+        self.socket = socket_instance
+        self.batch = batch or self.DEFAULT_BATCH
+        self.buffer_size = buffer_size or self.DEFAULT_BUFFER_SIZE
+        self.native = native is True and self.LIBC is not None
+        self.addresses = dict()
+        self.names = dict()
+        self.incoming = None
+        self.outgoing = None
+        self.truncated = 0
+        if self.native:
+            self.incoming = MessageVector(batch=self.batch, buffer_size=self.buffer_size)
+            self.buffer = self.incoming.data
+        else:
+            # one spare byte: a datagram filling its slot and the next byte is longer than buffer_size
+            self.buffer = bytearray(self.batch * self.buffer_size + 1)
+        self.view = memoryview(self.buffer)
+
+    def fileno(self):
+        return self.socket.fileno()
+
+    def wait(self, timeout=None):
+        """
+        :return: True once the socket is readable, False on timeout
+        """
+        readable, _, _ = select.select([self.socket], [], [], timeout)
+        return len(readable) > 0
+
+    def wait_writable(self, timeout=None):
+        _, writable, _ = select.select([], [self.socket], [], timeout)
+        return len(writable) > 0
+
+    def receive(self, timeout=None):
+        """
+        :param timeout: seconds to wait for the first datagram, None blocks, 0 polls
+        :return: list of (memoryview, address) tuples, at most self.batch
+        """
+        if not self.wait(timeout=timeout):
+            return list()
+        if self.native:
+            return self._receive_native()
+        return self._receive()
+
+    def _receive_native(self):
+        vector = self.incoming
+        count = self.LIBC.recvmmsg(self.socket.fileno(), vector.address, self.batch, self.MSG_DONTWAIT, None)
+        if count < 0:
+            error = ctypes.get_errno()
+            if error in self.RETRY:
+                return list()
+            raise BulkException(self.ERROR_RECEIVE.format(error))
+        lengths, flags, names = vector.harvest(count=count)
+        addresses, address = self.addresses, self._address
+        view, size, truncated = self.view, self.buffer_size, self.MSG_TRUNC
+        datagrams = list()
+        start = 0
+        for length, flag, name in zip(lengths, flags, names):
+            if flag & truncated:
+                self.truncated += 1
+            else:
+                datagrams.append((view[start:start + length], addresses.get(name) or address(name)))
+            start += size
+        return datagrams
+
+    def _receive(self):
+        datagrams = list()
+        for index in range(self.batch):
+            start = index * self.buffer_size
+            try:
+                # one byte into the next slot (not received into yet) tells a datagram that was cut short
+                length, address = self.socket.recvfrom_into(self.view[start:start + self.buffer_size + 1], 0,
+                                                             self.MSG_DONTWAIT)
+            except (BlockingIOError, InterruptedError, socket.timeout):
+                break
+            except (OSError, ) as error:
+                if error.errno in self.OVERSIZED:
+                    self.truncated += 1
+                    continue
+                if datagrams:
+                    break
+                raise BulkException(self.ERROR_RECEIVE.format(error))
+            if length > self.buffer_size:
+                self.truncated += 1
+                continue
+            datagrams.append((self.view[start:start + length], address))
+        return datagrams
+
+    def _address(self, name=None):
+        port, = struct.unpack_from('>H', name)
+        address = socket.inet_ntoa(name[2:6]), port
+        # bounded caches, peers are usually a handful of gateways/devices
+        if len(self.addresses) > 4096:
+            self.addresses.clear()
+        self.addresses[name] = address
+        return address
+
+    def _sockaddr(self, address=None):
+        try:
+            return self.names[address]
+        except (KeyError, ):
+            pass
+        ip, port = address
+        name = struct.pack('=H', socket.AF_INET) + struct.pack('>H', port) + socket.inet_aton(ip) + bytes(8)
+        if len(self.names) > 4096:
+            self.names.clear()
+        self.names[address] = name
+        return name
+
+    def send(self, datagrams=None):
+        """
+        :param datagrams: list of (data, address) tuples
+        :return: number of datagrams sent
+        """
+        if not datagrams:
+            return 0
+        if self.native:
+            return self._send_native(datagrams=datagrams)
+        return self._send(datagrams=datagrams)
+
+    def _send_native(self, datagrams=None):
+        if self.outgoing is None:
+            self.outgoing = MessageVector(batch=self.batch, buffer_size=self.buffer_size)
+        vector = self.outgoing
+        sent = 0
+        count = 0
+        for data, address in datagrams:
+            if len(data) > self.buffer_size:
+                # oversized datagram, does not fit the slab: sent on its own, after the ones queued before it
+                sent += self._flush(count=count)
+                count = 0
+                sent += self._send(datagrams=[(data, address)])
+                continue
+            vector.set(index=count, data=data, name=self._sockaddr(address=address))
+            count += 1
+            if count == self.batch:
+                sent += self._flush(count=count)
+                count = 0
+        return sent + self._flush(count=count)
+
+    def _flush(self, count=None):
+        """
+        Send the first count messages of the outgoing vector
+        :return: number of datagrams sent
+        """
+        vector = self.outgoing
+        done = 0
+        while done < count:
+            result = self.LIBC.sendmmsg(self.socket.fileno(), vector.address + done * vector.message_size,
+                                        count - done, 0)
+            if result < 0:
+                error = ctypes.get_errno()
+                if error not in self.RETRY:
+                    raise BulkException(self.ERROR_SEND.format(error))
+                self.wait_writable()
+                continue
+            done += result
+        return done
+
+    def _send(self, datagrams=None):
+        sent = 0
+        for data, address in datagrams:
+            try:
+                self.socket.sendto(data, address)
+            except (OSError, ) as error:
+                raise BulkException(self.ERROR_SEND.format(error))
+            sent += 1
+        return sent
+
+    def close(self):
+        self.socket.close()
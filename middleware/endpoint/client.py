@@ -1,6 +1,15 @@
+import asyncio
 import socket
 import sys
+import threading
 import time
+from concurrent.futures import Future
+from dna.middleware.endpoint.bulk import BulkSocket
+from dna.middleware.util.timer import TimerWheel
+
+
+class ClientException(Exception):
+    pass
 
 
 class Client(object):
@@ -11,66 +20,355 @@ class Client(object):
     # alt: ascii
     # utf-8 usually works better
     DEFAULT_ENCODING = "utf-8"
-    BUFFER_SIZE = 1024
+    # largest UDP payload over IPv4, responses are never truncated (larger ones are windowed, see window)
+    BUFFER_SIZE = 65507
     TIMEOUT = 5
 
-    def __init__(self, socket_instance=None):
+    ERROR_TIMEOUT = "No response from {}:{} within {} s"
+    ERROR_SEND = "Error sending message: {}"
+
+    def __init__(self, socket_instance=None, flow=None):
+        """
+        :param flow: optional CongestionWindow, send() is paced by it and marks messages with the flow_control flag
+        """
         if isinstance(socket_instance, socket.socket):
             self.socket = socket_instance
         else:
             self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         self.socket.settimeout(self.TIMEOUT)
+        self.flow = flow
+        self.__bulk = None
+        self.__window = None
 
     def send(self, message=None, ip=None, port=None, raw=True, encoding=None):
         if not ip:
             ip = self.DEFAULT_IP
         if not port:
             port = self.DEFAULT_PORT
+        flow, acquired = self.flow, False
         try:
-            if raw is True:
-                payload_length = self.socket.sendto(message, (ip, port))
-            else:
+            if raw is not True:
                 if encoding is None:
                     encoding = self.DEFAULT_ENCODING
-                payload_length = self.socket.sendto(bytes(message, encoding), (ip, port))
-            response = str(self.socket.recv(self.BUFFER_SIZE), self.DEFAULT_ENCODING)
-            return payload_length, response
-        except:
-            raise Exception("Error sending message")
+                message = bytes(message, encoding)
+            if flow is not None:
+                message = flow.mark(bytearray(message))
+                acquired = flow.acquire()
+                sent_at = time.monotonic()
+            payload_length = self.socket.sendto(message, (ip, port))
+            data = self.socket.recv(self.BUFFER_SIZE)
+        except (BaseException, ) as error:
+            if acquired:
+                flow.loss()
+                flow.release(answered=False)
+            if isinstance(error, socket.timeout):
+                raise ClientException(self.ERROR_TIMEOUT.format(ip, port, self.socket.gettimeout()))
+            raise ClientException(self.ERROR_SEND.format(error))
+        if flow is not None:
+            flow.release(rtt=time.monotonic() - sent_at, credits=flow.credits(data))
+        # responses are binary DNP packets, non text bytes are escaped
+        return payload_length, str(data, self.DEFAULT_ENCODING, 'backslashreplace')
+
+    def send_batch(self, messages=None, ip=None, port=None, timeout=None):
+        """
+        Send all messages with batched socket I/O and collect the responses
+        :param messages: list of raw (bytes) messages
+        :param timeout: seconds to wait for the responses, defaults to self.TIMEOUT
+        :return: number of messages sent, list of responses (bytes) received before the timeout
+        """
+        if not ip:
+            ip = self.DEFAULT_IP
+        if not port:
+            port = self.DEFAULT_PORT
+        if timeout is None:
+            timeout = self.TIMEOUT
+        try:
+            sent = self.bulk.send(datagrams=[(message, (ip, port)) for message in messages])
+        except (BaseException, ) as error:
+            raise ClientException(self.ERROR_SEND.format(error))
+        responses = list()
+        deadline = time.monotonic() + timeout
+        while len(responses) < sent:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            datagrams = self.bulk.receive(timeout=remaining)
+            responses.extend([bytes(data) for data, address in datagrams])
+        return sent, responses
+
+    @property
+    def bulk(self):
+        if self.__bulk is None:
+            self.__bulk = BulkSocket(socket_instance=self.socket, buffer_size=self.BUFFER_SIZE)
+        return self.__bulk
+
+    @property
+    def window(self):
+        """
+        :return: WindowTransfer on the client socket, for requests and responses larger than a datagram
+        """
+        if self.__window is None:
+            # protocol.transport imports this module
+            from dna.middleware.protocol.window import WindowTransfer
+            self.__window = WindowTransfer(socket_instance=self.socket)
+        return self.__window
+
+
+class PipelineClient(object):
+
+    """
+    Pipelined UDP client, keeps up to window requests in flight on a single socket. Each request gets a free 16 bit
+    header id, responses are matched back to their request by the id they carry (responders must echo it).
+
+    A receiver thread drains the socket in batches, completes futures and resends or fails requests whose response
+    did not arrive within timeout. Retransmit timers live on a TimerWheel driven by that thread (no thread or heap
+    entry per request), every resend waits backoff times longer than the previous attempt, up to MAX_TIMEOUT.
+
+    With flow_control the window is a CongestionWindow instead of a fixed one: requests carry the flow_control flag,
+    the service's advertised credits and AIMD (timeouts halve it) bound the requests in flight, sends are paced.
+    """
+
+    DEFAULT_WINDOW = 64
+    DEFAULT_RETRIES = 0
+    DEFAULT_BACKOFF = 2.0
+    MAX_TIMEOUT = 30.0
+    POLL_INTERVAL = 0.5
+    IDS = 2 ** 16
+
+    ERROR_CLOSED = "Client closed"
+    ERROR_TIMEOUT = "No response to request {}, retries exhausted"
+    ERROR_WINDOW = "Window must be between 1 and {}, {} encountered"
+    ERROR_SEND = "Error sending request {}: {}"
+
+    def __init__(self, ip=None, port=None, window=None, timeout=None, retries=None, socket_instance=None,
+                 flow_control=False, backoff=None):
+        """
+        :param window: maximum number of requests in flight, submit() blocks while the window is full
+        :param timeout: seconds to wait for a response to the first attempt
+        :param retries: number of times a request is resent before its future fails
+        :param backoff: timeout multiplier per resend, 1 for a constant timeout
+        :param flow_control: adapt the requests in flight (up to window) to the service, see CongestionWindow
+        """
+        # imported here, the protocol modules depend on this one
+        from dna.middleware.protocol.flow import CongestionWindow
+        from dna.middleware.protocol.transport import Parser
+        self.address = (ip or Client.DEFAULT_IP, port or Client.DEFAULT_PORT)
+        self.window = window or self.DEFAULT_WINDOW
+        self.timeout = Client.TIMEOUT if timeout is None else timeout
+        self.retries = self.DEFAULT_RETRIES if retries is None else retries
+        self.backoff = backoff or self.DEFAULT_BACKOFF
+        try:
+            assert 0 < self.window < self.IDS
+        except (BaseException, ):
+            raise ClientException(self.ERROR_WINDOW.format(self.IDS - 1, repr(window)))
+        if not isinstance(socket_instance, socket.socket):
+            socket_instance = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket = socket_instance
+        self.bulk = BulkSocket(socket_instance=self.socket, buffer_size=Client.BUFFER_SIZE)
+        codec = Parser.codec()
+        self.id_offset, self.id_struct, _ = codec.offsets['id']
+        self.header_length = codec.length
+        self.slots = threading.BoundedSemaphore(self.window)
+        self.flow = CongestionWindow(maximum=self.window) if flow_control else None
+        self.lock = threading.Lock()
+        # id: [future, message, attempts left, retransmit Timer, sent at (None once resent), attempt timeout]
+        self.pending = dict()
+        self.timers = TimerWheel()
+        self.expired = list()
+        self.next_id = 0
+        self.unmatched = 0
+        self.closed = False
+        self.receiver = threading.Thread(target=self._receive, daemon=True)
+        self.receiver.start()
+
+    def submit(self, message=None, timeout=None, retries=None):
+        """
+        :param message: raw (bytes) DNP datagram, its id field is replaced with the id allocated for the request
+        :return: concurrent.futures.Future resolved with the response (bytes) or failed with ClientException
+        """
+        if self.closed:
+            raise ClientException(self.ERROR_CLOSED)
+        timeout = self.timeout if timeout is None else timeout
+        retries = self.retries if retries is None else retries
+        if self.flow is not None:
+            self.flow.acquire()
+        else:
+            self.slots.acquire()
+        future = Future()
+        message = bytearray(message)
+        if len(message) < self.header_length:
+            message.extend(bytes(self.header_length - len(message)))
+        if self.flow is not None:
+            self.flow.mark(message)
+        with self.lock:
+            _id = self._allocate()
+            self.id_struct.pack_into(message, self.id_offset, _id)
+            now = time.monotonic()
+            timer = self.timers.schedule(timeout, self._timeout, _id, now=now)
+            self.pending[_id] = [future, message, retries, timer, now, timeout]
+        try:
+            self.socket.sendto(message, self.address)
+        except (OSError, ) as error:
+            self._fail(_id, ClientException(self.ERROR_SEND.format(_id, error)))
+        return future
+
+    def send(self, message=None, timeout=None, retries=None):
+        """
+        Blocking request, pipelining applies across threads sharing the client
+        """
+        return self.submit(message=message, timeout=timeout, retries=retries).result()
+
+    async def request(self, message=None, timeout=None, retries=None):
+        return await asyncio.wrap_future(self.submit(message=message, timeout=timeout, retries=retries))
+
+    def in_flight(self):
+        return len(self.pending)
+
+    def close(self):
+        self.closed = True
+        self.receiver.join()
+        with self.lock:
+            ids = list(self.pending)
+        for _id in ids:
+            self._fail(_id, ClientException(self.ERROR_CLOSED))
+        self.socket.close()
+
+    def _allocate(self):
+        """
+        Next id not in flight, called holding the lock (the window guarantees a free one)
+        """
+        while self.next_id in self.pending:
+            self.next_id = (self.next_id + 1) % self.IDS
+        _id = self.next_id
+        self.next_id = (self.next_id + 1) % self.IDS
+        return _id
+
+    def _complete(self, _id=None, response=None):
+        with self.lock:
+            request = self.pending.pop(_id, None)
+        if request is None:
+            # late reply to a timed out request, or duplicate reply to a resent one
+            self.unmatched += 1
+            return
+        request[3].cancel()
+        if self.flow is not None:
+            rtt = None if request[4] is None else time.monotonic() - request[4]
+            self.flow.release(rtt=rtt, credits=self.flow.credits(response))
+        else:
+            self.slots.release()
+        request[0].set_result(response)
+
+    def _fail(self, _id=None, error=None):
+        with self.lock:
+            request = self.pending.pop(_id, None)
+        if request is None:
+            return
+        request[3].cancel()
+        if self.flow is not None:
+            self.flow.release(answered=False)
+        else:
+            self.slots.release()
+        request[0].set_exception(error)
+
+    def _timeout(self, _id=None):
+        # timer callback, runs in _expire holding the lock
+        self.expired.append(_id)
+
+    def _expire(self):
+        """
+        Resend or fail requests whose retransmit timer fired
+        :return: seconds until the next timer tick
+        """
+        resend, failed = list(), list()
+        with self.lock:
+            self.timers.advance()
+            expired, self.expired = self.expired, list()
+            now = time.monotonic()
+            for _id in expired:
+                request = self.pending.get(_id)
+                if request is None:
+                    continue
+                if self.flow is not None:
+                    self.flow.loss()
+                if request[2] > 0:
+                    request[2] -= 1
+                    request[5] = min(request[5] * self.backoff, self.MAX_TIMEOUT)
+                    request[3] = self.timers.schedule(request[5], self._timeout, _id, now=now)
+                    # the response could answer either attempt, no round trip sample (Karn)
+                    request[4] = None
+                    resend.append(request[1])
+                else:
+                    failed.append(_id)
+            wait = self.timers.timeout(now=now)
+        for message in resend:
+            try:
+                self.socket.sendto(message, self.address)
+            except (OSError, ):
+                # counts as a lost attempt, the next timer resends or fails it
+                pass
+        for _id in failed:
+            self._fail(_id, ClientException(self.ERROR_TIMEOUT.format(_id)))
+        return self.POLL_INTERVAL if wait is None else min(wait, self.POLL_INTERVAL)
+
+    def _receive(self):
+        id_struct, id_offset, header_length = self.id_struct, self.id_offset, self.header_length
+        while not self.closed:
+            wait = self._expire()
+            try:
+                datagrams = self.bulk.receive(timeout=max(wait, 0))
+            except (BaseException, ):
+                if self.closed:
+                    break
+                continue
+            for data, address in datagrams:
+                if len(data) < header_length:
+                    self.unmatched += 1
+                    continue
+                _id, = id_struct.unpack_from(data, id_offset)
+                self._complete(_id, bytes(data))
 
 
 if "__main__" == __name__:
 
-    # CLI - user convenience
+    # CLI - load a running service: client.py [ip] [port] [rate, 0 for a closed loop] [seconds] [workers]
+    from dna.middleware.endpoint.load import AddressDistribution, LoadGenerator
+
     try:
-        cycles = int(sys.argv[1])
-        assert 10000 >= cycles > 0
+        ip = sys.argv[1]
     except (BaseException, ):
-        cycles = 10
+        ip = Client.DEFAULT_IP
 
     try:
-        interval = float(sys.argv[2])
-        assert 1000.0 >= interval > 0.0
+        port = int(sys.argv[2])
+        assert 65536 > port > 0
     except (BaseException, ):
-        interval = 1.0
+        port = Client.DEFAULT_PORT
 
     try:
-        abcd = ' '.join(sys.argv[3].split('_'))
+        rate = float(sys.argv[3]) or None
+        assert rate is None or rate > 0.0
     except (BaseException, ):
-        abcd = [255, 235, 255, 0, 1, 1, 1, 1, 1, 1, 2, 2, 2, 2, 2, 2, 5, 5, 5, 5, 5, 5, 2, 2, 2, 2, 2, 2, 8, 9, 0, 1,
-                2, 3, 4, 5, 6, 7, 8, 9, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14, 15]
-    # End CLI
-
-    client = Client()
-
-    while cycles > 0:
+        rate = None
 
-        cycles -= 1
-        # Socket is a byte transfer interface!
-        abcd[1] += 1
-        length, _response = client.send(bytes(abcd))
+    try:
+        seconds = float(sys.argv[4])
+        assert seconds > 0.0
+    except (BaseException, ):
+        seconds = 5.0
 
-        print("Sent: {}".format(abcd))
-        print("Received: {}".format(_response))
+    try:
+        workers = int(sys.argv[5])
+        assert workers > 0
+    except (BaseException, ):
+        workers = 1
+    # End CLI
 
-        time.sleep(interval)
+    generator = LoadGenerator(ip=ip, port=port, rate=rate, seconds=seconds, workers=workers,
+                              distribution=AddressDistribution(kind=AddressDistribution.ZIPF, first=1, resources=1024))
+    results = generator.run()
+    latency = results['latency_ms']
+    print("Sent: {} Received: {} Lost: {} ({:.2%})".format(results['sent'], results['received'], results['lost'],
+                                                          results['loss']))
+    print("Throughput: {:,.0f} replies/s".format(results['throughput']))
+    print("Latency: p50 {:.3f} p99 {:.3f} p999 {:.3f} max {:.3f} ms".format(latency['p50'], latency['p99'],
+                                                                           latency['p999'], latency['max']))
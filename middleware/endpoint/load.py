@@ -0,0 +1,280 @@
+import bisect
+import itertools
+import multiprocessing
+import random
+import socket
+import time
+from dna.middleware.endpoint.bulk import BulkException, BulkSocket
+from dna.middleware.endpoint.client import Client
+from dna.middleware.models.entity import Histogram
+from dna.middleware.protocol.transport import Flags, Packet, Parser
+
+
+class LoadException(Exception):
+    pass
+
+
+class AddressDistribution(object):
+
+    """
+    Request addresses a load is spread over: resources first .. first + resources - 1 of one service component,
+    picked uniformly, following a Zipf law (the resource of rank r with weight 1 / r ** skew, a few hot resources and a
+    long tail) or always the first one (fixed)
+    """
+
+    FIXED = 'fixed'
+    UNIFORM = 'uniform'
+    ZIPF = 'zipf'
+
+    KINDS = [FIXED, UNIFORM, ZIPF]
+
+    DEFAULT_SKEW = 1.1
+
+    ERROR_KIND = "Address distribution not supported: {}"
+    ERROR_RESOURCES = "Number of resources must be a positive integer, {} encountered"
+
+    def __init__(self, kind=None, service=1, component=1, first=1, resources=1, skew=None):
+        try:
+            assert kind is None or kind in self.KINDS
+        except (BaseException, ):
+            raise LoadException(self.ERROR_KIND.format(repr(kind)))
+        try:
+            assert isinstance(resources, int) and resources > 0
+        except (BaseException, ):
+            raise LoadException(self.ERROR_RESOURCES.format(repr(resources)))
+        self.kind = kind or self.UNIFORM
+        self.service = service
+        self.component = component
+        self.first = first
+        self.resources = 1 if self.FIXED == self.kind else resources
+        self.skew = self.DEFAULT_SKEW if skew is None else skew
+
+    def addresses(self):
+        """
+        :return: every request address the distribution can pick
+        """
+        base = self.service << 32 | self.component << 16
+        return [base | resource for resource in range(self.first, self.first + self.resources)]
+
+    def sample(self, count=None, generator=None):
+        """
+        :param generator: random.Random, seeded for a repeatable load
+        :return: count request addresses
+        """
+        addresses = self.addresses()
+        generator = generator or random.Random()
+        if self.ZIPF != self.kind:
+            return [addresses[generator.randrange(len(addresses))] for _ in range(count)]
+        weights = list(itertools.accumulate(1.0 / rank ** self.skew for rank in range(1, len(addresses) + 1)))
+        return [addresses[bisect.bisect_left(weights, generator.random() * weights[-1])] for _ in range(count)]
+
+    def describe(self):
+        return {'kind': self.kind, 'service': self.service, 'component': self.component, 'first': self.first,
+                'resources': self.resources, 'skew': self.skew if self.ZIPF == self.kind else None}
+
+
+def generate(generator=None, index=None, results=None):
+    """
+    LoadGenerator worker process entry point (module level so spawned workers can import it)
+    """
+    results.put(generator.worker(index=index))
+
+
+class LoadGenerator(object):
+
+    """
+    UDP load for a DNP service: valid read requests (response required) over an AddressDistribution, sent from one or
+    more worker processes, each with its own socket.
+
+    Open loop (rate set): requests go out on a fixed schedule whether or not responses come back, latency is measured
+    from the time a request was due, so a service falling behind shows up in the percentiles instead of slowing the
+    load down (no coordinated omission). Closed loop (rate None): each worker keeps window requests in flight.
+
+    Requests not answered within timeout after the load stops count as lost.
+    """
+
+    DEFAULT_SECONDS = 5.0
+    DEFAULT_WINDOW = 32
+    DEFAULT_TIMEOUT = 1.0
+    # requests sent at once when the schedule is behind, distinct address samples cycled through per worker
+    BATCH = 64
+    SAMPLES = 4096
+    IDS = 2 ** 16
+
+    ERROR_RATE = "Rate must be a positive number of requests per second, {} encountered"
+    ERROR_WORKERS = "Number of workers must be a positive integer, {} encountered"
+
+    def __init__(self, ip=None, port=None, rate=None, seconds=None, workers=1, window=None, distribution=None,
+                 payload_size=0, timeout=None, seed=None):
+        """
+        :param rate: requests per second over all workers (open loop), None for a closed loop
+        :param window: requests in flight per worker in a closed loop
+        :param distribution: AddressDistribution, one resource (257 on service 1 component 1) by default
+        :param payload_size: request payload bytes
+        """
+        try:
+            assert rate is None or rate > 0
+        except (BaseException, ):
+            raise LoadException(self.ERROR_RATE.format(repr(rate)))
+        try:
+            assert isinstance(workers, int) and workers > 0
+        except (BaseException, ):
+            raise LoadException(self.ERROR_WORKERS.format(repr(workers)))
+        self.address = (ip or Client.DEFAULT_IP, port or Client.DEFAULT_PORT)
+        self.rate = rate
+        self.seconds = seconds or self.DEFAULT_SECONDS
+        self.workers = workers
+        self.window = window or self.DEFAULT_WINDOW
+        self.distribution = distribution or AddressDistribution(kind=AddressDistribution.FIXED, first=257)
+        self.payload_size = payload_size
+        self.timeout = self.DEFAULT_TIMEOUT if timeout is None else timeout
+        self.seed = seed
+
+    def run(self):
+        """
+        :return: results, see results
+        """
+        if 1 == self.workers:
+            return self.results(parts=[self.worker(index=0)])
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context('fork' if 'fork' in methods else 'spawn')
+        queue = context.Queue()
+        processes = [context.Process(target=generate, kwargs={'generator': self, 'index': index, 'results': queue})
+                     for index in range(self.workers)]
+        for process in processes:
+            process.start()
+        parts = [queue.get() for _ in processes]
+        for process in processes:
+            process.join()
+        return self.results(parts=parts)
+
+    def messages(self, index=None):
+        """
+        :return: request datagrams (ids left to the sender) of worker index, one per address sample
+        """
+        flags = Flags(0)
+        flags.response_required = 1
+        templates = dict()
+        generator = random.Random(None if self.seed is None else self.seed + index)
+        messages = list()
+        for address in self.distribution.sample(count=self.SAMPLES, generator=generator):
+            if address not in templates:
+                templates[address] = Packet({'id': 0, 'flags': flags, 'request_address': address,
+                                             'payload': bytes(self.payload_size)}).pack()
+            messages.append(templates[address])
+        return messages
+
+    def worker(self, index=None):
+        """
+        Run the load of one worker
+        :return: partial results: counters and the latency histogram (nanoseconds) buckets
+        """
+        id_offset, id_struct, _ = Parser.codec().offsets['id']
+        messages = self.messages(index=index)
+        sample = len(messages)
+        client = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        bulk = BulkSocket(socket_instance=client, batch=self.BATCH, buffer_size=Client.BUFFER_SIZE)
+        # id -> due time (perf_counter_ns) of the request in flight with that id, 0 for none
+        due = [0] * self.IDS
+        latency = Histogram()
+        counters = {'sent': 0, 'received': 0}
+
+        def send(stamps=None):
+            """
+            :param stamps: due time (perf_counter_ns) of every request to send
+            """
+            batch = list()
+            for stamp in stamps:
+                _id = counters['sent'] % self.IDS
+                message = bytearray(messages[counters['sent'] % sample])
+                id_struct.pack_into(message, id_offset, _id)
+                due[_id] = stamp
+                batch.append((message, self.address))
+                counters['sent'] += 1
+            bulk.send(datagrams=batch)
+
+        def receive(timeout=None):
+            received = 0
+            try:
+                datagrams = bulk.receive(timeout=timeout)
+            except (BulkException, ):
+                # ICMP errors (port unreachable) reported on the socket, the requests concerned count as lost
+                return 0
+            for data, _ in datagrams:
+                if len(data) < id_offset + id_struct.size:
+                    continue
+                _id = id_struct.unpack_from(data, id_offset)[0]
+                sent_at = due[_id]
+                if not sent_at:
+                    # duplicate or a request given up on
+                    continue
+                due[_id] = 0
+                latency.record(time.perf_counter_ns() - sent_at)
+                received += 1
+            counters['received'] += received
+            return received
+
+        started = time.perf_counter()
+        deadline = started + self.seconds
+        try:
+            if self.rate is None:
+                send(stamps=[time.perf_counter_ns()] * self.window)
+                while time.perf_counter() < deadline:
+                    answered = receive(timeout=min(self.timeout, max(deadline - time.perf_counter(), 0)))
+                    # nothing back within timeout: a request is considered lost, replace it to keep the window full
+                    send(stamps=[time.perf_counter_ns()] * (answered or 1))
+            else:
+                interval = self.workers / self.rate
+                # the workers' schedules are staggered over one interval
+                due_next = started + interval * index / self.workers
+                while True:
+                    now = time.perf_counter()
+                    if now >= deadline:
+                        break
+                    while due_next <= now:
+                        # behind schedule: up to a batch at once, each stamped with the time it was due
+                        count = min(int((now - due_next) / interval) + 1, self.BATCH)
+                        send(stamps=[int((due_next + offset * interval) * 1e9) for offset in range(count)])
+                        due_next += count * interval
+                    receive(timeout=max(min(due_next, deadline) - time.perf_counter(), 0))
+            elapsed = time.perf_counter() - started
+            drained = time.perf_counter() + self.timeout
+            while counters['received'] < counters['sent'] and time.perf_counter() < drained:
+                receive(timeout=max(drained - time.perf_counter(), 0))
+        finally:
+            bulk.close()
+        return {'sent': counters['sent'], 'received': counters['received'], 'seconds': elapsed,
+                'counts': latency.counts, 'count': latency.count, 'total': latency.total}
+
+    def results(self, parts=None):
+        """
+        :return: configuration, throughput (responses/s), offered load (requests/s), loss and latency percentiles in
+                 milliseconds, JSON serializable
+        """
+        latency = Histogram()
+        for part in parts:
+            other = Histogram()
+            other.counts, other.count, other.total = part['counts'], part['count'], part['total']
+            latency.merge(other)
+        sent = sum(part['sent'] for part in parts)
+        received = sum(part['received'] for part in parts)
+        seconds = max(part['seconds'] for part in parts)
+        return {
+            'config': {
+                'address': list(self.address),
+                'rate': self.rate,
+                'seconds': self.seconds,
+                'workers': self.workers,
+                'window': None if self.rate is not None else self.window,
+                'payload_size': self.payload_size,
+                'timeout': self.timeout,
+                'distribution': self.distribution.describe()
+            },
+            'sent': sent,
+            'received': received,
+            'lost': sent - received,
+            'loss': (sent - received) / sent if sent else 0.0,
+            'offered': sent / seconds if seconds else 0.0,
+            'throughput': received / seconds if seconds else 0.0,
+            'latency_ms': {key: value / 1e6 for key, value in latency.snapshot().items() if 'count' != key}
+        }
@@ -1,5 +1,50 @@
+import asyncio
+import errno
+import inspect
+import multiprocessing
+import os
+import socket
 import threading
+import time
 import socketserver
+from dna.middleware.endpoint.bulk import BulkSocket
+from dna.middleware.endpoint.buffer import BufferPool, BufferPoolException
+from dna.middleware.util.log import logger, DEBUG
+
+
+log = logger(name='dna.server')
+
+
+class Context(object):
+
+    """
+    Per datagram request context, handed down the handling pipeline instead of being set on the shared handler and
+    manager: concurrent datagrams never see each other's request or peer
+    """
+
+    __slots__ = ['request', 'client_address']
+
+    def __init__(self, request=None, client_address=None):
+        """
+        :param request: (data, socket) or (data, socket, slab) as received by the server
+        :param client_address: peer address replies are sent to
+        """
+        self.request = request
+        self.client_address = client_address
+
+    @property
+    def data(self):
+        return self.request[0]
+
+    @property
+    def socket(self):
+        return self.request[1]
+
+    def reply(self, data=None):
+        """
+        :return: number of bytes sent to the peer
+        """
+        return self.request[1].sendto(data, self.client_address)
 
 
 class Handler(object):
@@ -8,9 +53,20 @@ class Handler(object):
         self.__client_address = None
         self.__request = None
 
-    def handle(self, server=None):
+    def handle(self, server=None, handler=None, manager=None, context=None):
+        """
+        :param context: Context of the datagram, see deliver for handlers overriding handle without it
+        """
         pass
 
+    def context(self, context=None):
+        """
+        :return: context, or one built from request and client_address for callers setting those on the handler
+        """
+        if context is None:
+            return Context(request=self.request, client_address=self.client_address)
+        return context
+
     @property
     def request(self):
         return self.__request
@@ -28,27 +84,51 @@ class Handler(object):
         self.__client_address = client_address
 
 
+# handle functions -> True when they take a context, see deliver
+CONTEXT_HANDLERS = dict()
+
+
+def deliver(handler=None, manager=None, context=None, server=None):
+    """
+    Hand a datagram over to handler.handle along with its Context. Handlers overriding handle without a context
+    parameter (written before Context) get request and client_address set on the handler instead, as they used to:
+    for those the state is shared by datagrams handled concurrently.
+    :return: handler.handle response
+    """
+    handle = handler.handle
+    function = getattr(handle, '__func__', handle)
+    aware = CONTEXT_HANDLERS.get(function)
+    if aware is None:
+        parameters = inspect.signature(handle).parameters.values()
+        aware = CONTEXT_HANDLERS[function] = any('context' == parameter.name or
+                                                 parameter.VAR_KEYWORD == parameter.kind for parameter in parameters)
+    if aware:
+        return handle(server=server, manager=manager, context=context)
+    handler.request = context.request
+    handler.client_address = context.client_address
+    return handle(server=server, manager=manager)
+
+
 class SimpleHandler(Handler):
 
-    def handle(self, server=None, handler=None):
+    def handle(self, server=None, handler=None, manager=None, context=None):
         # example handling
-        data = self.request[0].strip()
-        socket = self.request[1]
-        thread = threading.current_thread()
-        print("In thread: {} ({})".format(thread.name, type(server)))
-        print("Received: {}, returning: {}".format(data, data.upper()))
-        socket.sendto(data.upper(), self.client_address)
+        context = self.context(context=context)
+        data = bytes(context.data).strip()
+        if log.enabled(DEBUG):
+            log.debug('simple.request', thread=threading.current_thread().name, received=data, returning=data.upper())
+        context.reply(data.upper())
 
 
 class ManagedHandler(Handler):
 
-    def handle(self, server=None, handler=None, manager=None):
+    def handle(self, server=None, handler=None, manager=None, context=None):
         try:
-            manager.request = self.request
-            manager.client_address = self.client_address
+            manage = manager.manage
         except (BaseException, ):
             raise Exception("Managed handlers expect Manager instance, {} encountered".format(type(manager)))
-        return manager.manage(self.request)
+        context = self.context(context=context)
+        return manage(request=context.request, context=context)
 
 
 class ThreadedUDPHandler(socketserver.BaseRequestHandler):
@@ -57,20 +137,116 @@ class ThreadedUDPHandler(socketserver.BaseRequestHandler):
     ENCODING = 'utf-8'
 
     def handle(self, server=None, handler=None, manager=None):
-        handler.request = self.request
-        handler.client_address = self.client_address
-        handler.handle(manager=manager)
+        # one request handler instance per datagram, the shared handler only gets the context
+        response = deliver(handler=handler, manager=manager, server=server,
+                           context=Context(request=self.request, client_address=self.client_address))
+        if asyncio.iscoroutine(response):
+            # coroutine handlers are driven to completion on the request thread
+            response = asyncio.run(response)
+        return response
 
 
 class ThreadedUDPServer(socketserver.ThreadingMixIn, socketserver.UDPServer):
     pass
 
 
+class BufferPoolMixIn(object):
+
+    """
+    Receives datagrams with recvfrom_into into pooled slabs instead of allocating max_packet_size bytes per datagram.
+    The request is (data view, socket, slab), the slab goes back to the pool once the request has been handled.
+
+    When every slab is leased (slow handlers) the datagram is dropped right away (counted in the pool stats) instead
+    of stalling the receive loop, shutdown included: under overload the kernel queue keeps draining and holds fresh
+    requests, not stale ones handled late.
+    """
+
+    buffer_pool = None
+
+    # seconds to wait for a slab before dropping, 0 does not wait at all
+    ACQUIRE_TIMEOUT = 0
+
+    def get_request(self):
+        if self.buffer_pool is None:
+            self.buffer_pool = BufferPool(slab_size=self.max_packet_size)
+        try:
+            slab = self.buffer_pool.acquire(timeout=self.ACQUIRE_TIMEOUT)
+        except (BufferPoolException, ):
+            # read and discarded, socketserver skips a request whose get_request raises OSError
+            self.socket.recvfrom(1)
+            self.buffer_pool.dropped += 1
+            log.warning('buffer.exhausted', rate=10, server=type(self).__name__)
+            raise OSError(errno.ENOBUFS, os.strerror(errno.ENOBUFS))
+        try:
+            slab.length, client_address = self.socket.recvfrom_into(slab.buffer)
+        except (BaseException, ):
+            slab.release()
+            raise
+        slab.received = time.perf_counter_ns()
+        return (slab.view[:slab.length], self.socket, slab), client_address
+
+    def shutdown_request(self, request):
+        try:
+            request[2].release()
+        finally:
+            super().shutdown_request(request)
+
+
+class BufferedUDPServer(BufferPoolMixIn, socketserver.UDPServer):
+    pass
+
+
+class BufferedThreadedUDPServer(BufferPoolMixIn, ThreadedUDPServer):
+    pass
+
+
+class DatagramTransportSocket(object):
+
+    """
+    Socket-like adapter over an asyncio datagram transport, handlers reply through request[1].sendto
+    """
+
+    def __init__(self, transport=None):
+        self.transport = transport
+
+    def sendto(self, data=None, address=None):
+        self.transport.sendto(data, address)
+        return len(data)
+
+
+class AsyncUDPProtocol(asyncio.DatagramProtocol):
+
+    def __init__(self, handler=None, manager=None):
+        self.handler = handler
+        self.manager = manager
+        self.transport = None
+        self.socket = None
+        self.tasks = set()
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.socket = DatagramTransportSocket(transport=transport)
+
+    def datagram_received(self, data, address):
+        try:
+            response = deliver(handler=self.handler, manager=self.manager,
+                               context=Context(request=(data, self.socket), client_address=address))
+        except (BaseException, ) as error:
+            log.error('handler.failed', rate=10, client=address, error=repr(error))
+            return
+        if asyncio.iscoroutine(response):
+            task = asyncio.ensure_future(response)
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+
 class Server(object):
 
     DEFAULT_HOST = "0.0.0.0"
     DEFAULT_PORT = 12345
 
+    SERVER_CLASS = BufferedThreadedUDPServer
+
     def __init__(self, host=None, port=None):
         self.server = None
         self.host = self.DEFAULT_HOST
@@ -84,23 +260,28 @@ class Server(object):
         if port is not None:
             self.port = port
 
-    def run(self, instance=None, handler=None, manager=None):
+    def run(self, instance=None, handler=None, manager=None, block=True):
+        """
+        :param block: serve on the calling thread, otherwise serve from a daemon thread which is returned
+        """
 
-        if isinstance(instance, ThreadedUDPServer):
+        if isinstance(instance, socketserver.UDPServer):
             self.server = instance
         else:
             class ThreadedUDPHandlerWithServer(ThreadedUDPHandler):
 
                 def handle(self, _server=None, _handler=None, _manager=None):
                     super().handle(server=instance, handler=handler, manager=manager)
-            self.server = ThreadedUDPServer((self.host, self.port), ThreadedUDPHandlerWithServer)
-
-        server_thread = threading.Thread(target=self.server.serve_forever)
-        server_thread.daemon = True
-        server_thread.start()
+            self.server = self.SERVER_CLASS((self.host, self.port), ThreadedUDPHandlerWithServer)
 
-        print("Server started, single server instance up and running on {}".format(server_thread.name))
+        if block is not True:
+            server_thread = threading.Thread(target=self.server.serve_forever)
+            server_thread.daemon = True
+            server_thread.start()
+            log.info('server.started', server=type(self).__name__, thread=server_thread.name, port=self.port)
+            return server_thread
 
+        log.info('server.started', server=type(self).__name__, thread=threading.current_thread().name, port=self.port)
         self.server.serve_forever()
 
     def stop(self):
@@ -108,6 +289,297 @@ class Server(object):
         self.server.shutdown()
         self.server.server_close()
 
+    @property
+    def buffer_pool(self):
+        """
+        :return: receive BufferPool of the running server (None for unbuffered servers), see BufferPool.stats/leaks
+        """
+        return getattr(self.server, 'buffer_pool', None)
+
+
+class PooledServer(Server):
+
+    """
+    Single receive loop, meant to be used with a Manager holding a Dispatcher: the loop only parses and routes, handlers
+    run on the dispatcher's bounded worker pool
+    """
+
+    SERVER_CLASS = BufferedUDPServer
+
+
+class BatchReplySocket(object):
+
+    """
+    Socket-like reply queue, replies produced while handling a receive batch are sent with a single batch send
+    """
+
+    def __init__(self, bulk=None):
+        self.bulk = bulk
+        self.pending = list()
+
+    def sendto(self, data=None, address=None):
+        # copied, replies may be encoded into a reused buffer
+        self.pending.append((bytes(data), address))
+        return len(data)
+
+    def flush(self):
+        pending, self.pending = self.pending, list()
+        return self.bulk.send(datagrams=pending)
+
+
+class BulkServer(Server):
+
+    """
+    Batched receive loop: datagrams are read up to batch at a time (recvmmsg where available), handled inline and the
+    replies of a batch are sent together (sendmmsg where available)
+    """
+
+    DEFAULT_BATCH = 32
+    POLL_INTERVAL = 0.5
+    # largest datagram handled, as the socketserver based servers, longer ones are dropped
+    max_packet_size = socketserver.UDPServer.max_packet_size
+
+    def __init__(self, host=None, port=None, batch=None):
+        super().__init__(host=host, port=port)
+        self.batch = batch or self.DEFAULT_BATCH
+        self.running = False
+        self.stopped = threading.Event()
+
+    def run(self, instance=None, handler=None, manager=None, block=True):
+        if isinstance(instance, BulkSocket):
+            self.server = instance
+        else:
+            server_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            server_socket.bind((self.host, self.port))
+            self.server = BulkSocket(socket_instance=server_socket, batch=self.batch, buffer_size=self.max_packet_size)
+        self.running = True
+        self.stopped.clear()
+        if block is not True:
+            server_thread = threading.Thread(target=self.serve, kwargs={'handler': handler, 'manager': manager})
+            server_thread.daemon = True
+            server_thread.start()
+            return server_thread
+        self.serve(handler=handler, manager=manager)
+
+    def serve(self, handler=None, manager=None):
+        log.info('server.started', server=type(self).__name__, thread=threading.current_thread().name, port=self.port)
+        replies = BatchReplySocket(bulk=self.server)
+        # pooled handlers outlive the batch: datagrams are copied out of the receive buffers, replies sent directly
+        pooled = getattr(manager, 'dispatcher', None) is not None
+        try:
+            while self.running:
+                for data, address in self.server.receive(timeout=self.POLL_INTERVAL):
+                    if pooled:
+                        context = Context(request=(bytes(data), self.server.socket), client_address=address)
+                    else:
+                        context = Context(request=(data, replies), client_address=address)
+                    try:
+                        response = deliver(handler=handler, manager=manager, context=context)
+                        if asyncio.iscoroutine(response):
+                            asyncio.run(response)
+                    except (BaseException, ) as error:
+                        log.error('handler.failed', rate=10, client=address, error=repr(error))
+                replies.flush()
+        finally:
+            self.stopped.set()
+
+    def stop(self):
+        self.running = False
+        self.stopped.wait(self.POLL_INTERVAL * 4)
+        self.server.close()
+
+
+class AsyncServer(Server):
+
+    """
+    Single threaded asyncio server, datagrams are handled on the event loop as they arrive instead of in a thread per
+    datagram. Handlers registered with the Manager may be coroutine functions.
+    """
+
+    def __init__(self, host=None, port=None):
+        super().__init__(host=host, port=port)
+        self.loop = None
+        self.protocol = None
+        self.stopped = None
+        self.started = threading.Event()
+        # exception the serving thread failed with, raised by a non blocking run that is waiting for the start
+        self.error = None
+
+    def run(self, instance=None, handler=None, manager=None, block=True):
+        if block is not True:
+            self.started.clear()
+            self.error = None
+            server_thread = threading.Thread(target=self._serve, kwargs={'handler': handler, 'manager': manager})
+            server_thread.daemon = True
+            server_thread.start()
+            self.started.wait()
+            if self.error is not None:
+                raise self.error
+            return server_thread
+        asyncio.run(self.serve(handler=handler, manager=manager))
+
+    def _serve(self, handler=None, manager=None):
+        try:
+            asyncio.run(self.serve(handler=handler, manager=manager))
+        except (BaseException, ) as error:
+            self.error = error
+            log.error('server.failed', server=type(self).__name__, port=self.port, error=repr(error))
+        finally:
+            # run must not wait for a start that never comes
+            self.started.set()
+
+    async def serve(self, handler=None, manager=None):
+        self.loop = asyncio.get_running_loop()
+        self.stopped = self.loop.create_future()
+        self.server, self.protocol = await self.loop.create_datagram_endpoint(
+            lambda: AsyncUDPProtocol(handler=handler, manager=manager), local_addr=(self.host, self.port))
+        log.info('server.started', server=type(self).__name__, thread=threading.current_thread().name, port=self.port)
+        self.started.set()
+        try:
+            await self.stopped
+        finally:
+            self.server.close()
+
+    def stop(self):
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self._stop)
+
+    def _stop(self):
+        if self.stopped is not None and not self.stopped.done():
+            self.stopped.set_result(None)
+
+
+class ReusePortUDPServer(BufferedUDPServer):
+    allow_reuse_port = True
+
+
+class ReusePortServer(Server):
+
+    """
+    Single process server bound with SO_REUSEPORT, the kernel spreads datagrams over every socket bound to the port
+    """
+
+    SERVER_CLASS = ReusePortUDPServer
+
+
+def serve_worker(host=None, port=None, handler=None, manager=None):
+    """
+    MultiProcessServer worker entry point (module level so spawned workers can import it)
+    :param manager: Manager, or a callable building one in the worker
+    """
+    if not hasattr(manager, 'manage') and hasattr(manager, '__call__'):
+        manager = manager()
+    ReusePortServer(host=host, port=port).run(handler=handler, manager=manager)
+
+
+class MultiProcessServer(Server):
+
+    """
+    Fan-out over worker processes, each binds the port with SO_REUSEPORT and runs its own Manager (a copy of the one
+    passed to run, or one built in the worker by a factory), so parsing and dispatch are not serialized by a single
+    GIL. A supervisor restarts workers that exit, backing off while a worker keeps dying right after start.
+
+    Workers are forked where supported, with the spawn start method handler and manager (factory) must be picklable.
+    """
+
+    DEFAULT_WORKERS = os.cpu_count() or 1
+    POLL_INTERVAL = 0.2
+    RESTART_DELAY = 0.1
+    MAX_RESTART_DELAY = 5.0
+    # a worker alive that long is considered stable, its restart delay is reset
+    STABLE_AFTER = 10.0
+
+    ERROR_REUSE_PORT = "Multi-process server requires SO_REUSEPORT, not supported on this platform"
+    ERROR_WORKERS = "Number of workers must be a positive integer, {} encountered"
+
+    def __init__(self, host=None, port=None, workers=None):
+        super().__init__(host=host, port=port)
+        self.workers = workers or self.DEFAULT_WORKERS
+        try:
+            assert isinstance(self.workers, int) and self.workers > 0
+        except (BaseException, ):
+            raise Exception(self.ERROR_WORKERS.format(repr(workers)))
+        methods = multiprocessing.get_all_start_methods()
+        self.context = multiprocessing.get_context('fork' if 'fork' in methods else 'spawn')
+        self.processes = list()
+        self.restarts = 0
+        self.running = False
+        self.stopped = threading.Event()
+        self.__spec = None
+
+    def run(self, instance=None, handler=None, manager=None, block=True):
+        try:
+            assert hasattr(socket, 'SO_REUSEPORT')
+        except (BaseException, ):
+            raise Exception(self.ERROR_REUSE_PORT)
+        self.__spec = {'host': self.host, 'port': self.port, 'handler': handler, 'manager': manager}
+        self.running = True
+        self.stopped.clear()
+        self.processes = [self._start(index=index) for index in range(self.workers)]
+        log.info('server.started', server=type(self).__name__, workers=self.workers, port=self.port)
+        if block is not True:
+            supervisor = threading.Thread(target=self.supervise)
+            supervisor.daemon = True
+            supervisor.start()
+            return supervisor
+        try:
+            self.supervise()
+        finally:
+            self.stop()
+
+    def _start(self, index=None):
+        process = self.context.Process(target=serve_worker, kwargs=self.__spec, name="dna-worker-{}".format(index))
+        process.daemon = True
+        process.start()
+        process.started_at = time.monotonic()
+        return process
+
+    def supervise(self):
+        delays = [0.0] * self.workers
+        pending = dict()
+        try:
+            while self.running:
+                now = time.monotonic()
+                for index, process in enumerate(self.processes):
+                    if index in pending or process.is_alive():
+                        continue
+                    process.join()
+                    if now - process.started_at < self.STABLE_AFTER:
+                        delays[index] = min(max(delays[index] * 2, self.RESTART_DELAY), self.MAX_RESTART_DELAY)
+                    else:
+                        delays[index] = 0.0
+                    log.warning('worker.exited', pid=process.pid, exitcode=process.exitcode, restart_in=delays[index])
+                    pending[index] = now + delays[index]
+                for index, restart_at in list(pending.items()):
+                    if restart_at <= now and self.running:
+                        del pending[index]
+                        self.restarts += 1
+                        self.processes[index] = self._start(index=index)
+                time.sleep(self.POLL_INTERVAL)
+        finally:
+            self.stopped.set()
+
+    def stats(self):
+        return {
+            'workers': self.workers,
+            'alive': len([process for process in self.processes if process.is_alive()]),
+            'restarts': self.restarts,
+            'pids': [process.pid for process in self.processes]
+        }
+
+    def stop(self):
+        self.running = False
+        # the supervisor must not restart workers being stopped
+        self.stopped.wait(self.POLL_INTERVAL * 5)
+        for process in self.processes:
+            if process.is_alive():
+                process.terminate()
+        for process in self.processes:
+            process.join(timeout=self.MAX_RESTART_DELAY)
+            if process.is_alive():
+                process.kill()
+                process.join()
+
 
 if __name__ == "__main__":
 
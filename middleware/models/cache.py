@@ -0,0 +1,199 @@
+import collections
+import threading
+import time
+from dna.middleware.protocol.transport import Flags, Parser
+
+
+class CacheException(Exception):
+    pass
+
+
+class ResponseCache(object):
+
+    """
+    Responses to idempotent reads (action read, response required) keyed on (request address, data window start, data
+    window end). Entries expire after the TTL of their request address (default_ttl unless set with set_ttl), the
+    least recently used ones are evicted once the cached payloads exceed budget bytes. A write (action write) to a
+    request address drops every entry of that address.
+
+    Only responses to reads that missed are stored, and a write in between discards them: a handler result computed
+    before a write is not cached after it. The payload is not part of the key, Manager does not look up reads carrying
+    a payload to a handler that takes it.
+    """
+
+    DEFAULT_TTL = 1.0
+    DEFAULT_BUDGET = 2 ** 24
+
+    ERROR_TTL = "TTL must be a non negative number of seconds, {} encountered"
+    ERROR_BUDGET = "Budget must be a positive number of bytes, {} encountered"
+
+    def __init__(self, ttl=None, budget=None):
+        """
+        :param ttl: seconds a response is served from cache, for request addresses without a TTL of their own
+        :param budget: cached payload bytes kept at most
+        """
+        try:
+            assert ttl is None or ttl >= 0
+        except (BaseException, ):
+            raise CacheException(self.ERROR_TTL.format(repr(ttl)))
+        try:
+            assert budget is None or budget > 0
+        except (BaseException, ):
+            raise CacheException(self.ERROR_BUDGET.format(repr(budget)))
+        codec = Parser.codec()
+        shifts = dict(Flags.SHIFTS)
+        self.field = codec.field
+        self.action_bit = 1 << shifts['action']
+        self.required_bit = 1 << shifts['response_required']
+        self.default_ttl = self.DEFAULT_TTL if ttl is None else ttl
+        self.budget = budget or self.DEFAULT_BUDGET
+        self.ttls = dict()
+        # key -> (expires at, payload), least recently used first
+        self.entries = collections.OrderedDict()
+        # keys of reads being handled, their responses are stored unless a write comes in first
+        self.pending = set()
+        # request address -> keys (cached or pending)
+        self.addresses = dict()
+        self.size = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.evictions = 0
+
+    def set_ttl(self, address=None, ttl=None):
+        """
+        :param address: 48 bit request address, see RouteTable.address
+        :param ttl: seconds, 0 disables caching for the address, None restores default_ttl
+        """
+        try:
+            assert ttl is None or ttl >= 0
+        except (BaseException, ):
+            raise CacheException(self.ERROR_TTL.format(repr(ttl)))
+        with self.lock:
+            if ttl is None:
+                self.ttls.pop(address, None)
+            else:
+                self.ttls[address] = ttl
+            self._invalidate(address=address)
+
+    def key(self, header=None):
+        return self.field(header, 'request_address'), self.field(header, 'data_window_start'), \
+            self.field(header, 'data_window_end')
+
+    def lookup(self, header=None):
+        """
+        Called for every request: a write invalidates its address, a read is answered from cache or marked pending
+        :param header: request datagram (at least a full header)
+        :return: cached response payload, None when the request has to be handled
+        """
+        if self.write(header=header):
+            return None
+        flags = self.field(header, 'flags')
+        if not flags & self.required_bit:
+            return None
+        key = self.key(header=header)
+        if not self.ttls.get(key[0], self.default_ttl):
+            return None
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                if entry[0] > time.monotonic():
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                self._remove(key=key)
+            self.misses += 1
+            self.pending.add(key)
+            self.addresses.setdefault(key[0], set()).add(key)
+        return None
+
+    def write(self, header=None):
+        """
+        :return: True if header is a write request, the entries of its address are then dropped
+        """
+        if not self.field(header, 'flags') & self.action_bit:
+            return False
+        address = self.field(header, 'request_address')
+        if address in self.addresses:
+            with self.lock:
+                self._invalidate(address=address)
+        return True
+
+    def store(self, header=None, payload=None):
+        """
+        Cache the response to a read marked pending by lookup, writes invalidate their address (again, in case reads
+        were handled while the write ran)
+        :param payload: response payload, None when the response must not be cached (errors)
+        """
+        if self.write(header=header):
+            return
+        key = self.key(header=header)
+        with self.lock:
+            if key not in self.pending:
+                return
+            self.pending.discard(key)
+            if payload is None or len(payload) > self.budget:
+                self._forget(key=key)
+                return
+            if key in self.entries:
+                self._remove(key=key)
+                self.addresses.setdefault(key[0], set()).add(key)
+            payload = bytes(payload)
+            self.entries[key] = (time.monotonic() + self.ttls.get(key[0], self.default_ttl), payload)
+            self.size += len(payload)
+            while self.size > self.budget:
+                self._remove(key=next(iter(self.entries)))
+                self.evictions += 1
+
+    def invalidate(self, address=None):
+        with self.lock:
+            self._invalidate(address=address)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.pending.clear()
+            self.addresses.clear()
+            self.size = 0
+
+    def _invalidate(self, address=None):
+        """
+        Drop the entries and pending reads of address, called holding the lock
+        """
+        keys = self.addresses.pop(address, None)
+        if not keys:
+            return
+        self.invalidations += 1
+        for key in keys:
+            self.pending.discard(key)
+            entry = self.entries.pop(key, None)
+            if entry is not None:
+                self.size -= len(entry[1])
+
+    def _remove(self, key=None):
+        """
+        Drop a cached entry, called holding the lock
+        """
+        self.size -= len(self.entries.pop(key)[1])
+        self._forget(key=key)
+
+    def _forget(self, key=None):
+        if key in self.pending or key in self.entries:
+            return
+        keys = self.addresses.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self.addresses[key[0]]
+
+    def stats(self):
+        with self.lock:
+            return {
+                'entries': len(self.entries),
+                'bytes': self.size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'invalidations': self.invalidations,
+                'evictions': self.evictions
+            }
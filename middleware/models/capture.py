@@ -0,0 +1,469 @@
+import array
+import mmap
+import os
+import socket
+import struct
+import sys
+import threading
+import time
+from dna.middleware.endpoint.bulk import BulkSocket
+from dna.middleware.endpoint.server import Context, Handler, deliver
+from dna.middleware.protocol.transport import Parser
+from dna.middleware.util.log import logger
+
+
+log = logger(name='dna.capture')
+
+
+class CaptureException(Exception):
+    pass
+
+
+class Capture(object):
+
+    """
+    DNP capture file format, little endian, append only:
+
+    - file header: magic, version
+    - records, back to back: timestamp (float seconds since the epoch), peer IPv4 address and port, datagram length,
+      then the raw datagram
+    - index footer, written on close: for every request address (48 bit, as Router.route splits it) the file offsets
+      of its records, then a table of (address, first offset index, count) sorted by address and a trailer pointing at
+      both
+
+    A capture without footer (writer not closed) is still readable, its index is rebuilt with a scan.
+    """
+
+    MAGIC = b'DNPCAP'
+    INDEX_MAGIC = b'DNPIDX'
+    VERSION = 1
+
+    HEADER = struct.Struct('<6sH')
+    RECORD = struct.Struct('<d4sHH')
+    ENTRY = struct.Struct('<QQQ')
+    # index offsets start, table start, addresses, records, magic
+    TRAILER = struct.Struct('<QQQQ6s')
+
+    ID_BITS = 16
+    ID_MASK = 2 ** ID_BITS - 1
+
+    ERROR_MAGIC = "Not a DNP capture: {}"
+    ERROR_VERSION = "Capture version {} not supported"
+    ERROR_DATAGRAM = "Datagram of {} bytes does not fit a capture record"
+
+    @staticmethod
+    def offsets(data=None):
+        """
+        :return: array of unsigned 64 bit offsets stored little endian in data
+        """
+        offsets = array.array('Q')
+        offsets.frombytes(data)
+        if 'big' == sys.byteorder:
+            offsets.byteswap()
+        return offsets
+
+    @staticmethod
+    def pack_offsets(offsets=None):
+        if 'big' == sys.byteorder:
+            offsets = array.array('Q', offsets)
+            offsets.byteswap()
+        return offsets.tobytes()
+
+    @staticmethod
+    def address(data=None):
+        """
+        :return: request address of a raw datagram (zero padded like Parser.parse)
+        """
+        codec = Parser.codec()
+        if len(data) < codec.length:
+            data = bytes(data) + bytes(codec.length - len(data))
+        return codec.field(data, 'request_address')
+
+    @classmethod
+    def match(cls, address=None, service=None, component=None, resource=None):
+        """
+        :return: True if the request address is on service, component and resource (None matches any)
+        """
+        return (service is None or service == address >> 2 * cls.ID_BITS & cls.ID_MASK) and \
+            (component is None or component == address >> cls.ID_BITS & cls.ID_MASK) and \
+            (resource is None or resource == address & cls.ID_MASK)
+
+
+class CaptureWriter(object):
+
+    """
+    Appends datagrams to a capture file, thread safe. The index is kept in memory (8 bytes per record) and written as
+    the footer on close.
+    """
+
+    BUFFER_SIZE = 2 ** 20
+
+    def __init__(self, path=None, append=False):
+        """
+        :param append: continue an existing capture (its footer is dropped and written again on close)
+        """
+        self.path = path
+        self.index = dict()
+        self.records = 0
+        self.lock = threading.Lock()
+        if append and os.path.exists(path) and os.path.getsize(path):
+            with CaptureReader(path=path) as reader:
+                end = reader.end
+                self.records = len(reader)
+                for address in reader.addresses():
+                    self.index[address] = array.array('Q', reader.positions(address=address))
+            self.file = open(path, 'r+b', buffering=self.BUFFER_SIZE)
+            self.file.truncate(end)
+            self.file.seek(end)
+        else:
+            self.file = open(path, 'wb', buffering=self.BUFFER_SIZE)
+            self.file.write(Capture.HEADER.pack(Capture.MAGIC, Capture.VERSION))
+        self.position = self.file.tell()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return self.records
+
+    def write(self, data=None, peer=None, timestamp=None):
+        """
+        :param data: raw datagram
+        :param peer: (ip, port) the datagram came from, None when unknown
+        :param timestamp: seconds since the epoch, now by default
+        """
+        length = len(data)
+        if length > 0xFFFF:
+            raise CaptureException(Capture.ERROR_DATAGRAM.format(length))
+        try:
+            ip, port = socket.inet_aton(peer[0]), peer[1]
+        except (BaseException, ):
+            ip, port = bytes(4), 0
+        address = Capture.address(data=data)
+        header = Capture.RECORD.pack(time.time() if timestamp is None else timestamp, ip, port, length)
+        with self.lock:
+            position = self.position
+            self.file.write(header)
+            self.file.write(data)
+            self.position += len(header) + length
+            self.records += 1
+            offsets = self.index.get(address)
+            if offsets is None:
+                offsets = self.index[address] = array.array('Q')
+            offsets.append(position)
+
+    def flush(self):
+        with self.lock:
+            self.file.flush()
+
+    def close(self):
+        with self.lock:
+            if self.file.closed:
+                return
+            start = self.position
+            table, first = list(), 0
+            for address in sorted(self.index):
+                offsets = self.index[address]
+                self.file.write(Capture.pack_offsets(offsets=offsets))
+                table.append(Capture.ENTRY.pack(address, first, len(offsets)))
+                first += len(offsets)
+            table_start = start + 8 * first
+            self.file.write(b''.join(table))
+            self.file.write(Capture.TRAILER.pack(start, table_start, len(table), self.records, Capture.INDEX_MAGIC))
+            self.file.close()
+
+
+class CaptureReader(object):
+
+    """
+    Memory mapped capture: opening only reads the footer, records are read in place (datagrams are memoryviews into
+    the map) and filtering by service, component or resource only visits the records of matching addresses.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.file = open(path, 'rb')
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.view = memoryview(self.map)
+        try:
+            magic, version = Capture.HEADER.unpack_from(self.map, 0)
+            assert Capture.MAGIC == magic
+        except (BaseException, ):
+            self.close()
+            raise CaptureException(Capture.ERROR_MAGIC.format(path))
+        if Capture.VERSION != version:
+            self.close()
+            raise CaptureException(Capture.ERROR_VERSION.format(version))
+        # address -> (first offset index, count) into offsets
+        self.table = dict()
+        # (offsets start, table start) of the footer, None for captures indexed in memory (index) by a scan
+        self.offsets = None
+        self.index = None
+        self.records = 0
+        # end of the records (start of the footer)
+        self.end = len(self.map)
+        if not self._footer():
+            self._scan()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return self.records
+
+    def __iter__(self):
+        """
+        :return: every record, in capture order
+        """
+        position, end, size, view = Capture.HEADER.size, self.end, Capture.RECORD.size, self.view
+        unpack = Capture.RECORD.unpack_from
+        while position + size <= end:
+            timestamp, ip, port, length = unpack(view, position)
+            start = position + size
+            yield timestamp, (socket.inet_ntoa(ip), port), view[start:start + length]
+            position = start + length
+
+    def _footer(self):
+        size = Capture.TRAILER.size
+        if len(self.map) < Capture.HEADER.size + size:
+            return False
+        start, table_start, addresses, records, magic = Capture.TRAILER.unpack_from(self.map, len(self.map) - size)
+        if Capture.INDEX_MAGIC != magic:
+            return False
+        for index in range(addresses):
+            address, first, count = Capture.ENTRY.unpack_from(self.map, table_start + index * Capture.ENTRY.size)
+            self.table[address] = (first, count)
+        # offsets stay in the map, decoded per address on demand
+        self.offsets = (start, table_start)
+        self.records = records
+        self.end = start
+        return True
+
+    def _scan(self):
+        """
+        No footer (the writer did not close): index the records in memory
+        """
+        log.warning('capture.unindexed', path=self.path)
+        index = dict()
+        position, size, view = Capture.HEADER.size, Capture.RECORD.size, self.view
+        while position + size <= len(self.map):
+            length = Capture.RECORD.unpack_from(view, position)[3]
+            if position + size + length > len(self.map):
+                # record cut short
+                break
+            index.setdefault(Capture.address(data=view[position + size:position + size + length]),
+                             array.array('Q')).append(position)
+            position += size + length
+            self.records += 1
+        self.end = position
+        self.index = index
+        self.table = {address: (None, len(offsets)) for address, offsets in index.items()}
+
+    def addresses(self, service=None, component=None, resource=None):
+        """
+        :return: request addresses in the capture, sorted, on service, component and resource (None matches any)
+        """
+        return [address for address in sorted(self.table)
+                if Capture.match(address=address, service=service, component=component, resource=resource)]
+
+    def count(self, service=None, component=None, resource=None):
+        return sum(self.table[address][1] for address in self.addresses(service=service, component=component,
+                                                                         resource=resource))
+
+    def positions(self, address=None):
+        """
+        :return: file offsets of the records of request address
+        """
+        if self.offsets is None:
+            return self.index.get(address, array.array('Q'))
+        first, count = self.table.get(address, (0, 0))
+        start = self.offsets[0] + 8 * first
+        return Capture.offsets(data=self.view[start:start + 8 * count])
+
+    def record(self, position=None):
+        """
+        :return: (timestamp, (ip, port), datagram memoryview) of the record at position
+        """
+        timestamp, ip, port, length = Capture.RECORD.unpack_from(self.view, position)
+        start = position + Capture.RECORD.size
+        return timestamp, (socket.inet_ntoa(ip), port), self.view[start:start + length]
+
+    def select(self, service=None, component=None, resource=None):
+        """
+        :return: records of matching addresses, in capture order, without visiting any other record
+        """
+        if service is None and component is None and resource is None:
+            yield from self
+            return
+        addresses = self.addresses(service=service, component=component, resource=resource)
+        if 1 == len(addresses):
+            positions = self.positions(address=addresses[0])
+        else:
+            positions = sorted(position for address in addresses for position in self.positions(address=address))
+        for position in positions:
+            yield self.record(position=position)
+
+    def close(self):
+        if self.view is not None:
+            self.view.release()
+            self.view = None
+        try:
+            self.map.close()
+        except (BufferError, ):
+            # datagram views still referenced, the map goes once the last of them does
+            pass
+        self.file.close()
+
+
+class CapturingHandler(Handler):
+
+    """
+    Records every datagram to a CaptureWriter, then hands it on to handler (e.g. a ManagedHandler)
+    """
+
+    def __init__(self, handler=None, writer=None):
+        super().__init__()
+        self.handler = handler
+        self.writer = writer
+
+    def handle(self, server=None, handler=None, manager=None, context=None):
+        context = self.context(context=context)
+        self.writer.write(data=context.data, peer=context.client_address)
+        return deliver(handler=self.handler, manager=manager, context=context, server=server)
+
+
+class ReplySink(object):
+
+    """
+    Socket-like sink for replies of replayed requests, they are counted and dropped
+    """
+
+    def __init__(self):
+        self.replies = 0
+        self.bytes = 0
+
+    def sendto(self, data=None, address=None):
+        self.replies += 1
+        self.bytes += len(data)
+        return len(data)
+
+
+class Replayer(object):
+
+    """
+    Replays a capture, at the original pace, speed times faster or as fast as possible, either straight into a
+    Manager (the full manage pipeline, every request with a Context of its original peer) or over UDP to a server.
+    """
+
+    # datagrams sent per batch when replaying over UDP
+    BATCH = 64
+
+    def __init__(self, reader=None, speed=1.0):
+        """
+        :param reader: CaptureReader
+        :param speed: replay speed relative to the capture, None or 0 as fast as possible
+        """
+        self.reader = reader
+        self.speed = speed or None
+        self.lag = 0.0
+
+    def _paced(self, records=None):
+        """
+        :return: records, each yielded once it is due (not before)
+        """
+        if self.speed is None:
+            yield from records
+            return
+        first, started = None, time.monotonic()
+        for record in records:
+            if first is None:
+                first = record[0]
+            due = started + (record[0] - first) / self.speed
+            delay = due - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                self.lag = max(self.lag, -delay)
+            yield record
+
+    def replay(self, manager=None, service=None, component=None, resource=None):
+        """
+        Push the matching records into manager
+        :return: stats (packets, replies, seconds, packets/s, largest lag behind the capture pace in seconds)
+        """
+        sink = ReplySink()
+        packets = 0
+        self.lag = 0.0
+        started = time.perf_counter()
+        for _, peer, data in self._paced(self.reader.select(service=service, component=component,
+                                                            resource=resource)):
+            request = (data, sink)
+            manager.manage(request=request, context=Context(request=request, client_address=peer))
+            packets += 1
+        return self._stats(packets=packets, replies=sink.replies, seconds=time.perf_counter() - started)
+
+    def send(self, address=None, service=None, component=None, resource=None, socket_instance=None):
+        """
+        Send the matching records to a server at address (ip, port), replies are not read
+        :return: stats (packets, seconds, packets/s, largest lag behind the capture pace in seconds)
+        """
+        bulk = BulkSocket(socket_instance=socket_instance or socket.socket(socket.AF_INET, socket.SOCK_DGRAM),
+                          batch=self.BATCH)
+        packets = 0
+        self.lag = 0.0
+        started = time.perf_counter()
+        batch = list()
+        try:
+            for _, _, data in self._paced(self.reader.select(service=service, component=component,
+                                                             resource=resource)):
+                batch.append((data, address))
+                # paced replays go out one by one, on time
+                if self.speed is not None or len(batch) >= self.BATCH:
+                    packets += bulk.send(datagrams=batch)
+                    batch = list()
+            packets += bulk.send(datagrams=batch)
+        finally:
+            if socket_instance is None:
+                bulk.close()
+        return self._stats(packets=packets, seconds=time.perf_counter() - started)
+
+    def _stats(self, packets=None, replies=None, seconds=None):
+        stats = {
+            'packets': packets,
+            'seconds': seconds,
+            'rate': packets / seconds if seconds else 0.0,
+            'lag': self.lag
+        }
+        if replies is not None:
+            stats['replies'] = replies
+        return stats
+
+
+if "__main__" == __name__:
+
+    # CLI - list the addresses in a capture, or replay it to a server: capture.py <path> [ip port [speed]]
+    try:
+        capture_path = sys.argv[1]
+    except (BaseException, ):
+        print("Usage: capture.py <path> [ip port [speed]]")
+        sys.exit(1)
+
+    with CaptureReader(path=capture_path) as capture:
+        if len(sys.argv) < 4:
+            print("{} records".format(len(capture)))
+            for request_address in capture.addresses():
+                print("service {} component {} resource {}: {} records".format(
+                    request_address >> 32, request_address >> 16 & 0xFFFF, request_address & 0xFFFF,
+                    len(capture.positions(address=request_address))))
+            sys.exit(0)
+        try:
+            replay_speed = float(sys.argv[4])
+        except (BaseException, ):
+            replay_speed = 1.0
+        print(Replayer(reader=capture, speed=replay_speed).send(address=(sys.argv[2], int(sys.argv[3]))))
@@ -0,0 +1,158 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+
+class DispatcherException(Exception):
+    pass
+
+
+def call(handler=None, payload=None):
+    """
+    Handler invocation on a pool worker (module level so process pools can pickle it), coroutines run to completion
+    """
+    if hasattr(handler, "__call__"):
+        response = handler()
+    else:
+        response = handler.handle(payload)
+    if asyncio.iscoroutine(response):
+        response = asyncio.run(response)
+    return response
+
+
+class Dispatcher(object):
+
+    """
+    Bounded worker pool for Manager handlers. At most workers + queue_size calls are admitted at once, optionally
+    limited further per entity (key), anything above that is handled according to the overflow policy.
+    """
+
+    EXECUTOR_THREAD = 'thread'
+    EXECUTOR_PROCESS = 'process'
+
+    EXECUTOR = {
+        EXECUTOR_THREAD: ThreadPoolExecutor,
+        EXECUTOR_PROCESS: ProcessPoolExecutor
+    }
+
+    # overflow policy: drop silently, reject (Manager replies 503) or block the receive loop until a slot frees up
+    POLICY_DROP = 'drop'
+    POLICY_REJECT = 'reject'
+    POLICY_BLOCK = 'block'
+
+    POLICY = [POLICY_DROP, POLICY_REJECT, POLICY_BLOCK]
+
+    DEFAULT_WORKERS = 4
+    DEFAULT_QUEUE_SIZE = 256
+
+    # submit outcomes
+    ACCEPTED = 'accepted'
+    DROPPED = 'dropped'
+    REJECTED = 'rejected'
+
+    ERROR_EXECUTOR = "Executor not supported: {}"
+    ERROR_POLICY = "Overflow policy not supported: {}"
+    ERROR_LIMIT = "Concurrency limit must be a positive integer, {} encountered"
+
+    def __init__(self, workers=None, queue_size=None, policy=None, limits=None, executor=None):
+        """
+        :param workers: number of pool workers
+        :param queue_size: number of admitted calls waiting for a worker
+        :param policy: overflow policy, see self.POLICY
+        :param limits: dictionary of per-entity concurrency limits, keyed by entity ('resource') or (entity, _id)
+        :param executor: 'thread' or 'process'
+        """
+        self.workers = workers or self.DEFAULT_WORKERS
+        self.queue_size = self.DEFAULT_QUEUE_SIZE if queue_size is None else queue_size
+        self.policy = policy or self.POLICY_REJECT
+        self.executor = executor or self.EXECUTOR_THREAD
+        self.limits = dict()
+        try:
+            assert self.policy in self.POLICY
+        except (BaseException, ):
+            raise DispatcherException(self.ERROR_POLICY.format(str(policy)))
+        try:
+            assert self.executor in self.EXECUTOR
+        except (BaseException, ):
+            raise DispatcherException(self.ERROR_EXECUTOR.format(str(executor)))
+        for key, limit in (limits or dict()).items():
+            self.limit(key=key, limit=limit)
+        self.pool = self.EXECUTOR[self.executor](max_workers=self.workers)
+        self.slots = threading.BoundedSemaphore(self.workers + self.queue_size)
+        self.condition = threading.Condition()
+        self.running = dict()
+        self.counters = {'submitted': 0, 'completed': 0, 'failed': 0, self.DROPPED: 0, self.REJECTED: 0}
+
+    def limit(self, key=None, limit=None):
+        try:
+            assert isinstance(limit, int) and limit > 0
+        except (BaseException, ):
+            raise DispatcherException(self.ERROR_LIMIT.format(repr(limit)))
+        self.limits[key] = limit
+
+    def submit(self, entity=None, _id=None, handler=None, payload=None, callback=None):
+        """
+        :param callback: called with (response, error) once the handler finishes, from a pool thread
+        :return: self.ACCEPTED, self.DROPPED or self.REJECTED
+        """
+        blocking = self.POLICY_BLOCK == self.policy
+        if not self.slots.acquire(blocking=blocking):
+            return self._overflow()
+        keys = self._keys(entity=entity, _id=_id)
+        if not self._admit(keys=keys, blocking=blocking):
+            self.slots.release()
+            return self._overflow()
+        if isinstance(payload, memoryview):
+            # workers outlive the receive buffer the payload points into (pooled slabs are reused)
+            payload = payload.tobytes()
+        with self.condition:
+            self.counters['submitted'] += 1
+        try:
+            future = self.pool.submit(call, handler, payload)
+        except (BaseException, ):
+            self._release(keys=keys, counter='failed')
+            raise
+        future.add_done_callback(lambda done: self._done(done, keys, callback))
+        return self.ACCEPTED
+
+    def stats(self):
+        with self.condition:
+            stats = dict(self.counters)
+        stats['in_flight'] = stats['submitted'] - stats['completed'] - stats['failed']
+        return stats
+
+    def shutdown(self, wait=True):
+        self.pool.shutdown(wait=wait)
+
+    def _keys(self, entity=None, _id=None):
+        return [key for key in (entity, (entity, _id)) if key in self.limits]
+
+    def _admit(self, keys=None, blocking=False):
+        with self.condition:
+            while not all(self.running.get(key, 0) < self.limits[key] for key in keys):
+                if not blocking:
+                    return False
+                self.condition.wait()
+            for key in keys:
+                self.running[key] = self.running.get(key, 0) + 1
+        return True
+
+    def _release(self, keys=None, counter=None):
+        with self.condition:
+            self.counters[counter] += 1
+            for key in keys:
+                self.running[key] -= 1
+            self.condition.notify_all()
+        self.slots.release()
+
+    def _overflow(self):
+        outcome = self.DROPPED if self.POLICY_DROP == self.policy else self.REJECTED
+        with self.condition:
+            self.counters[outcome] += 1
+        return outcome
+
+    def _done(self, future=None, keys=None, callback=None):
+        error = future.exception()
+        self._release(keys=keys, counter='failed' if error is not None else 'completed')
+        if callback is not None:
+            callback(None if error is not None else future.result(), error)
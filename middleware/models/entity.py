@@ -1,5 +1,8 @@
+import collections
 import json
 import os
+import threading
+import time
 
 
 class ConfigurationStructure(object):
@@ -423,46 +426,274 @@ class ServiceConfiguration(Configurable):
             self.resources[str(item)] = item
 
 
-class QualityOfService(object):
+class Histogram(object):
 
-    METRIC = {
-        'response_time': ResponseTimeMetric,
-        'throughput': ThroughputMetric
-    }
+    """
+    Fixed size log-linear (HDR style) histogram of non negative integers (nanoseconds). Values below 2 ** SUB_BITS are
+    counted exactly, larger ones in 2 ** SUB_BITS linear sub-buckets per power of two, i.e. within 1 / 2 ** SUB_BITS
+    (~6%) of the recorded value. Values of 2 ** MAX_BITS (~18 minutes) and more land in the last bucket.
+    """
+
+    __slots__ = ['counts', 'count', 'total']
+
+    SUB_BITS = 4
+    MAX_BITS = 40
+    SIZE = (MAX_BITS - SUB_BITS + 1) << SUB_BITS
+    PERCENTILES = [('p50', 50.0), ('p90', 90.0), ('p99', 99.0), ('p999', 99.9)]
 
     def __init__(self):
-        pass
+        self.counts = [0] * self.SIZE
+        self.count = 0
+        self.total = 0
+
+    def record(self, value=0):
+        shift = value.bit_length() - self.SUB_BITS - 1
+        if shift > 0:
+            index = (shift << self.SUB_BITS) + (value >> shift)
+            if index >= self.SIZE:
+                index = self.SIZE - 1
+        elif value >= 0:
+            index = value
+        else:
+            return
+        self.counts[index] += 1
+        self.count += 1
+        self.total += value
+
+    @classmethod
+    def lowest(cls, index=None):
+        """
+        :return: lowest value counted in bucket index
+        """
+        if index < 2 << cls.SUB_BITS:
+            return index
+        shift = (index >> cls.SUB_BITS) - 1
+        return (index - (shift << cls.SUB_BITS)) << shift
+
+    @classmethod
+    def highest(cls, index=None):
+        return cls.lowest(index=index + 1) - 1
+
+    def percentile(self, percentile=None):
+        """
+        :return: highest value equivalent to the bucket the percentile falls into, 0 for an empty histogram
+        """
+        if 0 == self.count:
+            return 0
+        target = max(1, self.count * percentile / 100.0)
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return self.highest(index=index)
+        return self.highest(index=self.SIZE - 1)
+
+    def merge(self, other=None):
+        self.counts = [count + other_count for count, other_count in zip(self.counts, other.counts)]
+        self.count += other.count
+        self.total += other.total
+        return self
 
-    # communication is a dictionary of sequential request and responses
-    # preformed by middleware
-    # communication = {
-    #                   1: {'request': request, 'response': response'},
-    #                   2: {'request': request, 'response': response}
-    # }
-    # metric = type of metric to performe, self.METRIC value
-    def save(self, communication, metrics):
-        pass
+    def reset(self):
+        self.counts = [0] * self.SIZE
+        self.count = 0
+        self.total = 0
 
-    def read(self, idp=None, metrics=None):
-        pass
+    def snapshot(self):
+        snapshot = {'count': self.count, 'mean': self.total / self.count if self.count else 0}
+        used = [index for index, count in enumerate(self.counts) if count]
+        snapshot['min'] = self.lowest(index=used[0]) if used else 0
+        for name, percentile in self.PERCENTILES:
+            snapshot[name] = self.percentile(percentile=percentile)
+        snapshot['max'] = self.highest(index=used[-1]) if used else 0
+        return snapshot
 
 
 class Metric(object):
 
-    def __init__(self, communication=None):
-        self.communication = communication
+    """
+    Aggregate per key ((entity, _id) of the handling route), fed with packet timestamps by QualityOfService
+    """
+
+    def __init__(self):
+        self.entries = dict()
+
+    def update(self, key=None, timestamps=None):
+        pass
+
+    def snapshot(self):
+        return dict()
+
+    def reset(self):
+        self.entries.clear()
 
 
 class ResponseTimeMetric(Metric):
 
-    def __init__(self, communication=None):
-        super().__init__(communication=communication)
+    """
+    Stage timings, timestamps are perf_counter_ns values taken when the datagram was received and at the end of each
+    stage: queued until handled (receive), parsed and routed (route), handler done (dispatch), reply sent (reply)
+    """
+
+    STAGES = ['receive', 'route', 'dispatch', 'reply', 'total']
+
+    def update(self, key=None, timestamps=None):
+        try:
+            histograms = self.entries[key]
+        except (KeyError, ):
+            histograms = self.entries[key] = [Histogram() for _ in self.STAGES]
+        previous = timestamps[0]
+        for histogram, timestamp in zip(histograms, timestamps[1:]):
+            histogram.record(timestamp - previous)
+            previous = timestamp
+        histograms[-1].record(previous - timestamps[0])
+
+    def snapshot(self):
+        return {key: {stage: histogram.snapshot() for stage, histogram in zip(self.STAGES, histograms)}
+                for key, histograms in self.entries.items()}
 
 
 class ThroughputMetric(Metric):
 
-    def __init__(self, communication=None):
-        super().__init__(communication=communication)
+    """
+    Packet counters, rates are packets/s since the metric was created or reset. Snapshots change nothing, readers
+    wanting rates over their own interval keep the previous counts, see QualityOfService.dump
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.since = time.monotonic()
+
+    def update(self, key=None, timestamps=None):
+        self.entries[key] = self.entries.get(key, 0) + 1
+
+    def snapshot(self):
+        elapsed = max(time.monotonic() - self.since, 1e-9)
+        return {key: {'packets': count, 'rate': count / elapsed} for key, count in self.entries.items()}
+
+    def reset(self):
+        super().reset()
+        self.since = time.monotonic()
+
+
+class QualityOfService(object):
+
+    """
+    Server pipeline metrics. The request path only appends a timestamp sample to a bounded queue (record), samples
+    are aggregated into the metrics when read (read, dump), so keep draining them at least every max_samples packets:
+    older samples are discarded.
+
+    Metrics are keyed by (entity, _id) of the handling route, string keys "entity:_id" in reads and dumps.
+    """
+
+    METRIC = {
+        'response_time': ResponseTimeMetric,
+        'throughput': ThroughputMetric
+    }
+
+    DEFAULT_MAX_SAMPLES = 2 ** 16
+
+    ERROR_METRIC = "Metric not supported: {}"
+
+    def __init__(self, metrics=None, max_samples=None):
+        """
+        :param metrics: list of self.METRIC names, all by default
+        """
+        self.metrics = dict()
+        for name in metrics or self.METRIC:
+            try:
+                self.metrics[name] = self.METRIC[name]()
+            except (BaseException, ):
+                raise Exception(self.ERROR_METRIC.format(str(name)))
+        self.samples = collections.deque(maxlen=max_samples or self.DEFAULT_MAX_SAMPLES)
+        # request path: (route, received, started, routed, dispatched, replied) tuples, appends are thread safe
+        self.record = self.samples.append
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+
+    # communication is an iterable of samples, (route, timestamps...) tuples, recorded by the middleware
+    # metrics = names of the metrics to update, self.METRIC keys
+    def save(self, communication=None, metrics=None):
+        metrics = [self.metrics[name] for name in metrics or self.metrics if name in self.metrics]
+        for sample in communication:
+            key = (sample[0].entity, sample[0]._id)
+            for metric in metrics:
+                metric.update(key=key, timestamps=sample[1:])
+
+    def drain(self):
+        """
+        Aggregate buffered samples into the metrics
+        :return: number of samples aggregated
+        """
+        with self.lock:
+            samples = list()
+            try:
+                for _ in range(len(self.samples)):
+                    samples.append(self.samples.popleft())
+            except (IndexError, ):
+                pass
+            self.save(communication=samples)
+        return len(samples)
+
+    def read(self, idp=None, metrics=None):
+        """
+        Pull API
+        :param idp: (entity, _id) to read, all entries by default
+        :param metrics: list of metric names to read, all by default
+        :return: {metric: {"entity:_id": values}}
+        """
+        self.drain()
+        with self.lock:
+            snapshot = dict()
+            for name in metrics or self.metrics:
+                entries = self.metrics[name].snapshot()
+                snapshot[name] = {"{}:{}".format(*key): value for key, value in entries.items()
+                                  if idp is None or tuple(idp) == key}
+        return snapshot
+
+    def reset(self):
+        with self.lock:
+            self.samples.clear()
+            for metric in self.metrics.values():
+                metric.reset()
+
+    def dump(self, interval=10.0, path=None, callback=None):
+        """
+        Periodic snapshot dump from a daemon thread, until stop(). Throughput rates are packets/s over the dump
+        interval, from the counts of the previous dump (reads in between do not affect them)
+        :param path: file the snapshots are appended to, one JSON document per line
+        :param callback: called with every snapshot instead
+        :return: dump thread
+        """
+        self.stopped.clear()
+        # "entity:_id" -> packets at the previous dump
+        previous = {key: value['packets'] for key, value in self.read().get('throughput', dict()).items()}
+
+        def run():
+            since = time.monotonic()
+            while not self.stopped.wait(interval):
+                metrics = self.read()
+                now = time.monotonic()
+                elapsed = max(now - since, 1e-9)
+                for key, value in metrics.get('throughput', dict()).items():
+                    last = previous.get(key, 0)
+                    # counters reset in between start over from zero
+                    value['rate'] = (value['packets'] - (last if last <= value['packets'] else 0)) / elapsed
+                    previous[key] = value['packets']
+                since = now
+                snapshot = {'time': time.time(), 'metrics': metrics}
+                if callback is not None:
+                    callback(snapshot)
+                    continue
+                with open(path, 'a') as handle:
+                    handle.write(json.dumps(snapshot) + "\n")
+
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self):
+        self.stopped.set()
 
 
 if "__main__" == __name__:
@@ -0,0 +1,96 @@
+import threading
+from dna.middleware.util.log import logger
+
+
+log = logger(name='dna.flight')
+
+
+class Flight(object):
+
+    """
+    Call in progress: callers joining it are handed its outcome once the leader finishes
+    """
+
+    __slots__ = ['done', 'response', 'error', 'callbacks']
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.response = None
+        self.error = None
+        self.callbacks = list()
+
+
+class SingleFlight(object):
+
+    """
+    Request coalescing: the first caller for a key (the leader) runs the call, identical calls arriving while it is in
+    progress do not call again but wait for it and get the same response (or exception). Nothing is kept once a call
+    finishes, the next caller leads a new call.
+
+    Manager keys reads on (request address, data window start, data window end) and, for handlers taking the request
+    payload, the payload, see Manager.flight.
+    """
+
+    def __init__(self):
+        self.flights = dict()
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.coalesced = 0
+
+    def call(self, key=None, function=None, *args):
+        """
+        Run function(*args), or wait for the call in progress for key
+        :return: function response
+        """
+        flight, leader = self.join(key=key)
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.response
+        try:
+            response = function(*args)
+        except (BaseException, ) as error:
+            self.finish(key=key, error=error)
+            raise
+        self.finish(key=key, response=response)
+        return response
+
+    def join(self, key=None, callback=None):
+        """
+        :param callback: called with (response, error) when a call is in progress for key, from the leader's thread
+        :return: (Flight, True when the caller leads the call and has to finish it)
+        """
+        with self.lock:
+            flight = self.flights.get(key)
+            if flight is None:
+                flight = self.flights[key] = Flight()
+                self.calls += 1
+                return flight, True
+            self.coalesced += 1
+            if callback is not None:
+                flight.callbacks.append(callback)
+            return flight, False
+
+    def finish(self, key=None, response=None, error=None):
+        """
+        Hand the outcome of the call for key to the callers that joined it
+        """
+        with self.lock:
+            flight = self.flights.pop(key)
+        flight.response, flight.error = response, error
+        flight.done.set()
+        for callback in flight.callbacks:
+            # a failing follower (e.g. its reply could not be sent) does not keep the others from their outcome
+            try:
+                callback(response=response, error=error)
+            except (BaseException, ) as callback_error:
+                log.warning('flight.callback', rate=10, error=str(callback_error))
+
+    def stats(self):
+        with self.lock:
+            return {
+                'in_flight': len(self.flights),
+                'calls': self.calls,
+                'coalesced': self.coalesced
+            }
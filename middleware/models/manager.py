@@ -1,6 +1,21 @@
-from datetime import datetime
-from dna.middleware.endpoint.server import Handler
-from dna.middleware.protocol.transport import Packet, Router, Parser
+import inspect
+import threading
+import time
+from time import perf_counter_ns
+from dna.middleware.endpoint.server import Context, Handler
+from dna.middleware.models.cache import ResponseCache
+from dna.middleware.models.dispatcher import Dispatcher
+from dna.middleware.models.entity import QualityOfService
+from dna.middleware.models.flight import SingleFlight
+from dna.middleware.models.route import RouteTable
+from dna.middleware.protocol.flow import FlowControl
+from dna.middleware.protocol.reliable import Deduplicator
+from dna.middleware.protocol.transport import PacketView, ResponseEncoder
+from dna.middleware.protocol.window import Window, WindowException, WindowReceiver, WindowSender
+from dna.middleware.util.log import logger, DEBUG
+
+
+log = logger(name='dna.manager')
 
 
 class Manager(object):
@@ -13,16 +28,77 @@ class Manager(object):
     ENTITY = ['service', 'component', 'resource']
     DEFAULT_ENCODING = "utf-8"
 
-    DEFAULT_SUCCESS_MESSAGE = 'success'
     DEFAULT_ERROR_MESSAGE = 'failure'
-    # HTTP style status codes and response messages
+    # HTTP style status codes and response messages, sent as response packet payload
     ERROR_TARGET_NOT_FOUND = "404 Not found"
     ERROR_HANDLING_REQUEST = "500 Server error"
+    ERROR_SERVICE_UNAVAILABLE = "503 Service unavailable"
+    ERROR_PAYLOAD_TOO_LARGE = "413 Payload too large"
     # ERROR_TARGET_NOT_FOUND = "Target device or service not found"
     # ERROR_HANDLING_REQUEST = "Error handling request"
+    # error responses are never cached
+    ERRORS = (ERROR_TARGET_NOT_FOUND, ERROR_HANDLING_REQUEST, ERROR_SERVICE_UNAVAILABLE, ERROR_PAYLOAD_TOO_LARGE)
+    # constant replies encoded once, sent from ResponseEncoder templates
+    REPLIES = dict(zip(ERRORS + (DEFAULT_ERROR_MESSAGE, ), map(str.encode, ERRORS + (DEFAULT_ERROR_MESSAGE, ))))
+
+    # response packets are encoded into per thread output buffers
+    ENCODER = ResponseEncoder()
+
+    # debug request records are sampled (one in LOG_SAMPLE), malformed packet warnings limited to LOG_RATE per second
+    LOG_SAMPLE = 100
+    LOG_RATE = 10
+
+    # windowed transfers (chunked requests and responses, see Window): largest transfer accepted, bytes announced by
+    # the requests being received at most (413 above MAX_TRANSFER, 503 once the total or the transfers of a peer
+    # would exceed MAX_TRANSFER_BYTES or MAX_PEER_TRANSFERS) and seconds an idle transfer is kept
+    WINDOW = Window()
+    MAX_TRANSFER = 2 ** 27
+    MAX_TRANSFER_BYTES = 2 ** 28
+    MAX_PEER_TRANSFERS = 8
+    TRANSFER_TIMEOUT = 30
 
-    def __init__(self):
+    def __init__(self, dispatcher=None, qos=None, flow=None, dedup=None, cache=None, flight=None):
+        """
+        :param dispatcher: optional Dispatcher, handlers then run on its bounded worker pool instead of inline
+        :param qos: optional QualityOfService, stage timings of handled packets are recorded into it
+        :param flow: optional FlowControl, responses to requests with the flow_control flag advertise credits
+        :param dedup: optional Deduplicator, resent requests (same id from the same peer) are not handled again, their
+                      response is replayed
+        :param cache: optional ResponseCache, reads are answered from it while fresh, writes invalidate it
+        :param flight: optional SingleFlight, concurrent identical reads share one handler call
+        """
         self.__entities = dict()
+        self.__routes = RouteTable()
+        self.__dispatcher = None
+        self.__qos = None
+        self.__flow = None
+        self.__dedup = None
+        self.__cache = None
+        self.__flight = None
+        # peer replied to when manage is called without a Context
+        self.client_address = None
+        # (client address, id) -> WindowReceiver of windowed requests / (WindowSender, template) of windowed responses
+        self.__receivers = dict()
+        self.__senders = dict()
+        # (client address, id) -> (completed at, final acknowledgement) of reassembled requests, late chunks are
+        # acknowledged again instead of starting a new transfer
+        self.__completed = dict()
+        # bytes announced by the requests being received, transfers being received per peer
+        self.__transfer_bytes = 0
+        self.__peer_transfers = dict()
+        self.__transfers_lock = threading.Lock()
+        if dispatcher is not None:
+            self.dispatcher = dispatcher
+        if qos is not None:
+            self.qos = qos
+        if flow is not None:
+            self.flow = flow
+        if dedup is not None:
+            self.dedup = dedup
+        if cache is not None:
+            self.cache = cache
+        if flight is not None:
+            self.flight = flight
 
     def add(self, entity=None, _id=None, handler=None):
         try:
@@ -36,10 +112,28 @@ class Manager(object):
         if entity not in self.entities.keys():
             self.entities[entity] = dict()
         self.entities[entity][_id] = handler
+        self.routes.add_entity(entity=entity, _id=_id, handler=handler)
 
     def remove(self, entity=None, _id=None):
         if entity in self.entities.keys() and _id in self.entities[entity].keys():
             del self.entities[entity][_id]
+        self.routes.remove_entity(entity=entity, _id=_id)
+
+    def add_route(self, address=None, handler=None, mask=None):
+        """
+        Route a request address straight to handler, takes precedence over entity handlers
+        :param address: 48 bit request address, see RouteTable.address
+        :param mask: None for the exact address, otherwise a wildcard mask, e.g. RouteTable.COMPONENT_MASK routes any
+                     resource on the address component
+        """
+        try:
+            assert hasattr(handler, "__call__") or (type(handler) and issubclass(handler.__class__, Handler))
+        except (BaseException, ):
+            raise Exception("Handler must be a callable or a Handler subclass")
+        self.routes.add(address=address, handler=handler, mask=mask)
+
+    def remove_route(self, address=None, mask=None):
+        self.routes.remove(address=address, mask=mask)
 
     @property
     def entities(self):
@@ -48,54 +142,460 @@ class Manager(object):
     @entities.setter
     def entities(self, entities):
         self.__entities = entities
+        for entity in RouteTable.ENTITY:
+            self.routes.entities[entity].clear()
+        for entity, handlers in entities.items():
+            for _id, handler in handlers.items():
+                self.routes.add_entity(entity=entity, _id=_id, handler=handler)
 
-    def manage(self, request=None):
-        socket = request[1]
+    @property
+    def routes(self):
+        return self.__routes
+
+    @property
+    def dispatcher(self):
+        return self.__dispatcher
+
+    @dispatcher.setter
+    def dispatcher(self, dispatcher):
         try:
-            entity, _id, payload = self.route(request=request)
-            print(entity, _id, payload)
+            assert dispatcher is None or isinstance(dispatcher, Dispatcher)
         except (BaseException, ):
-            socket.sendto(bytes(self.ERROR_TARGET_NOT_FOUND, self.DEFAULT_ENCODING), self.client_address)
-            return
+            raise Exception("Dispatcher instance expected, {} encountered".format(type(dispatcher)))
+        self.__dispatcher = dispatcher
+
+    @property
+    def qos(self):
+        return self.__qos
+
+    @qos.setter
+    def qos(self, qos):
+        try:
+            assert qos is None or isinstance(qos, QualityOfService)
+        except (BaseException, ):
+            raise Exception("QualityOfService instance expected, {} encountered".format(type(qos)))
+        self.__qos = qos
+
+    @property
+    def flow(self):
+        return self.__flow
+
+    @flow.setter
+    def flow(self, flow):
+        try:
+            assert flow is None or isinstance(flow, FlowControl)
+        except (BaseException, ):
+            raise Exception("FlowControl instance expected, {} encountered".format(type(flow)))
+        self.__flow = flow
+
+    @property
+    def dedup(self):
+        return self.__dedup
+
+    @dedup.setter
+    def dedup(self, dedup):
+        try:
+            assert dedup is None or isinstance(dedup, Deduplicator)
+        except (BaseException, ):
+            raise Exception("Deduplicator instance expected, {} encountered".format(type(dedup)))
+        self.__dedup = dedup
+
+    @property
+    def cache(self):
+        return self.__cache
+
+    @cache.setter
+    def cache(self, cache):
+        try:
+            assert cache is None or isinstance(cache, ResponseCache)
+        except (BaseException, ):
+            raise Exception("ResponseCache instance expected, {} encountered".format(type(cache)))
+        self.__cache = cache
+
+    @property
+    def flight(self):
+        return self.__flight
+
+    @flight.setter
+    def flight(self, flight):
         try:
-            response = self.dispatch(entity, _id, payload)
+            assert flight is None or isinstance(flight, SingleFlight)
         except (BaseException, ):
-            socket.sendto(bytes(self.ERROR_HANDLING_REQUEST, self.DEFAULT_ENCODING), self.client_address)
+            raise Exception("SingleFlight instance expected, {} encountered".format(type(flight)))
+        self.__flight = flight
+
+    def manage(self, request=None, context=None):
+        """
+        Handle a received datagram: route it, run the handler and reply
+        :param request: (data, socket) or (data, socket, slab) as received by the server
+        :param context: per datagram Context, servers pass one along with every request, without it the reply goes to
+                        client_address
+        """
+        if context is None:
+            context = Context(request=request, client_address=self.client_address)
+        client_address = context.client_address
+        qos = self.qos
+        if qos is not None:
+            started = perf_counter_ns()
+        route, packet = self.resolve(request=request, context=context)
+        if packet is None:
             return
-        # @todo: replace message with response.__repr__
-        if response is True:
-            message = self.DEFAULT_SUCCESS_MESSAGE
-            # message = str(response)
-        else:
-            message = self.DEFAULT_ERROR_MESSAGE
-        if 7 == socket.sendto(bytes(message, self.DEFAULT_ENCODING), self.client_address):
+        if self.WINDOW.windowed(packet.view):
+            return self.transfer(context=context, route=route, packet=packet)
+        # request header the response is derived from, None for fire-and-forget requests (no reply at all)
+        header = packet.view if self.ENCODER.required(packet.view) else None
+        if self.dedup is not None and header is not None:
+            duplicate, response = self.dedup.check(peer=client_address, _id=packet.id)
+            if duplicate:
+                return response is not None and len(response) == context.reply(response)
+        if self.flow is not None:
+            # in progress until respond()
+            self.flow.begin()
+        if route is None:
+            return self.respond(context=context, response=self.ERROR_TARGET_NOT_FOUND, request=header)
+        payload = packet.payload
+        if self.cache is not None:
+            if route.payload and len(payload):
+                # the payload parameterises the call and is not part of the cache key: such reads are not cached,
+                # writes still invalidate
+                self.cache.write(header=packet.view)
+            else:
+                cached = self.cache.lookup(header=packet.view)
+                if cached is not None:
+                    return self.respond(context=context, response=cached, request=header)
+        if log.enabled(DEBUG):
+            log.debug('request', sample=self.LOG_SAMPLE, entity=route.entity, _id=route._id, payload=bytes(payload),
+                      client=client_address)
+        timing = None
+        if qos is not None:
+            # buffered servers stamp the receive time on the slab (request[2])
+            timing = (request[2].received if len(request) > 2 else started, started, perf_counter_ns())
+        # identical reads (address, data window and, for handlers taking it, payload) in progress at the same time
+        # share a handler call
+        key = None
+        if self.flight is not None and not packet.flags.action:
+            key = (packet.request_address, packet.data_window_start, packet.data_window_end,
+                   bytes(payload) if route.payload else None)
+        return self.invoke(context=context, route=route, payload=payload, timing=timing, request=header, key=key)
+
+    def invoke(self, context=None, route=None, payload=None, timing=None, request=None, key=None):
+        """
+        Run the route handler (inline, on the dispatcher or awaited by the server for coroutine handlers) and reply
+        :param timing: QualityOfService timestamps so far (received, started, routed), None when not measured
+        :param request: request header, None when no response is required
+        :param key: SingleFlight key, None when the call is not coalesced
+        """
+        if self.dispatcher is not None:
+            return self.submit(context=context, route=route, payload=payload, timing=timing, request=request, key=key)
+        try:
+            if key is None:
+                response = route.invoke(payload)
+            else:
+                response = self.flight.call(key, route.invoke, payload)
+        except (BaseException, ):
+            return self.respond(context=context, response=self.ERROR_HANDLING_REQUEST, request=request)
+        if inspect.isawaitable(response):
+            # coroutine handler, the caller (server) awaits the reply
+            return self._respond_later(context=context, response=response, route=route,
+                                       timing=timing, request=self._copy(request))
+        if timing is None:
+            return self.respond(context=context, response=response, request=request)
+        dispatched = perf_counter_ns()
+        replied = self.respond(context=context, response=response, request=request)
+        self.qos.record((route, ) + timing + (dispatched, perf_counter_ns()))
+        return replied
+
+    def transfer(self, context=None, route=None, packet=None):
+        """
+        Windowed packet: a chunk of a request (reassembled, then handled as a single request) or an acknowledgement
+        of a windowed response
+        """
+        window = self.WINDOW
+        client_address = context.client_address
+        key = (client_address, packet.id)
+        if window.response(packet.view):
+            return self._acknowledged(context=context, key=key, packet=packet)
+        receiver = self.__receivers.get(key)
+        if receiver is None:
+            completed = self.__completed.get(key)
+            if completed is not None:
+                return context.reply(completed[1]) > 0
+            header = packet.view if self.ENCODER.required(packet.view) else None
+            if route is None or packet.data_window_end > self.MAX_TRANSFER:
+                if self.flow is not None:
+                    self.flow.begin()
+                return self.respond(context=context, request=header,
+                                    response=self.ERROR_TARGET_NOT_FOUND if route is None else
+                                    self.ERROR_PAYLOAD_TOO_LARGE)
+            self.expire()
+            receiver = self._receiver(key=key, total=packet.data_window_end)
+            if receiver is None:
+                log.warning('window.refused', rate=self.LOG_RATE, client=client_address)
+                if self.flow is not None:
+                    self.flow.begin()
+                return self.respond(context=context, request=header, response=self.ERROR_SERVICE_UNAVAILABLE)
+        acknowledgement = None
+        with receiver.lock:
+            try:
+                receiver.receive(offset=packet.data_window_start, data=packet.payload)
+            except (WindowException, ):
+                log.warning('window.malformed', rate=self.LOG_RATE, client=client_address)
+                self._release(key=key)
+                return False
+            complete = receiver.complete and self._release(key=key)
+            if receiver.due():
+                acknowledgement = window.acknowledgement(packet.view, *receiver.acknowledgement())
+        if acknowledgement is not None:
+            context.reply(acknowledgement)
+        if not complete:
             return True
-        return False
+        self.__completed[key] = (time.monotonic(), acknowledgement)
+        if self.flow is not None:
+            self.flow.begin()
+        request = window.request(packet.view)
+        if self.cache is not None:
+            self.cache.write(header=request)
+        return self.invoke(context=context, route=route, payload=receiver.data,
+                           request=request if self.ENCODER.required(request) else None)
+
+    def _receiver(self, key=None, total=None):
+        """
+        :return: WindowReceiver of transfer key, a new one when within the transfer limits, otherwise None
+        """
+        with self.__transfers_lock:
+            receiver = self.__receivers.get(key)
+            if receiver is not None:
+                return receiver
+            peer = key[0]
+            transfers = self.__peer_transfers.get(peer, 0)
+            if transfers >= self.MAX_PEER_TRANSFERS or self.__transfer_bytes + total > self.MAX_TRANSFER_BYTES:
+                return None
+            self.__peer_transfers[peer] = transfers + 1
+            self.__transfer_bytes += total
+            receiver = self.__receivers[key] = WindowReceiver(total=total, window=self.WINDOW)
+            return receiver
+
+    def _release(self, key=None):
+        """
+        Drop the receiver of transfer key
+        :return: True if it was still registered (the caller owns the outcome of the transfer)
+        """
+        with self.__transfers_lock:
+            return self._drop(key=key)
+
+    def _drop(self, key=None):
+        """
+        Called holding the transfers lock
+        """
+        receiver = self.__receivers.pop(key, None)
+        if receiver is None:
+            return False
+        self.__transfer_bytes -= receiver.total
+        peer = key[0]
+        transfers = self.__peer_transfers.get(peer, 0) - 1
+        if transfers > 0:
+            self.__peer_transfers[peer] = transfers
+        else:
+            self.__peer_transfers.pop(peer, None)
+        return True
+
+    def _acknowledged(self, context=None, key=None, packet=None):
+        try:
+            sender, template = self.__senders[key]
+        except (KeyError, ):
+            return False
+        with sender.lock:
+            sender.acknowledge(offset=packet.data_window_start, bitmap=bytes(packet.payload))
+            if sender.complete:
+                self.__senders.pop(key, None)
+                return True
+            return self._push(context=context, sender=sender, template=template)
+
+    def _push(self, context=None, sender=None, template=None):
+        """
+        Send the chunks of a windowed response that are due, called holding the sender lock
+        """
+        chunk = self.WINDOW.chunk
+        for index in sender.pending():
+            context.reply(chunk(template, *sender.data(index)))
+        return True
+
+    def expire(self):
+        """
+        Drop transfers idle for longer than TRANSFER_TIMEOUT seconds
+        """
+        deadline = time.monotonic() - self.TRANSFER_TIMEOUT
+        with self.__transfers_lock:
+            for key, receiver in list(self.__receivers.items()):
+                if receiver.touched < deadline:
+                    self._drop(key=key)
+            for key, (sender, _) in list(self.__senders.items()):
+                if sender.touched < deadline:
+                    self.__senders.pop(key, None)
+            for key, (completed, _) in list(self.__completed.items()):
+                if completed < deadline:
+                    self.__completed.pop(key, None)
+
+    def transfers(self):
+        """
+        :return: number of windowed (receiving, sending) transfers in progress
+        """
+        return len(self.__receivers), len(self.__senders)
 
-    def route(self, request=None):
+    def submit(self, context=None, route=None, payload=None, timing=None, request=None, key=None):
+        """
+        Hand the handler call over to the dispatcher pool, the reply is sent from the pool once the handler finishes
+        :param timing: QualityOfService timestamps so far (received, started, routed), None when not measured
+        :param request: request header, None when no response is required
+        :param key: SingleFlight key, None when the call is not coalesced
+        :return: Dispatcher submit outcome
+        """
+        # the receive buffer is reused once manage returns
+        request = self._copy(request)
+
+        def reply(response=None, error=None):
+            if error is not None:
+                self.respond(context=context, response=self.ERROR_HANDLING_REQUEST, request=request)
+                return
+            if timing is None:
+                self.respond(context=context, response=response, request=request)
+                return
+            dispatched = perf_counter_ns()
+            self.respond(context=context, response=response, request=request)
+            self.qos.record((route, ) + timing + (dispatched, perf_counter_ns()))
+
+        callback = reply
+        if key is not None:
+            if not self.flight.join(key=key, callback=reply)[1]:
+                # replied to when the call in progress finishes
+                return Dispatcher.ACCEPTED
+
+            def callback(response=None, error=None):
+                # the flight ends even when the leader's reply fails, followers must not join a dead one
+                try:
+                    reply(response=response, error=error)
+                finally:
+                    self.flight.finish(key=key, response=response, error=error)
+
+        outcome = None
+        try:
+            outcome = self.dispatcher.submit(entity=route.entity, _id=route._id, handler=route.handler,
+                                             payload=payload, callback=callback)
+        except (BaseException, ) as error:
+            if key is not None:
+                self.flight.finish(key=key, error=error)
+            raise
+        finally:
+            # dropped (or failed) submissions are never responded to, they are no longer in progress either
+            if self.flow is not None and outcome in (None, Dispatcher.DROPPED):
+                self.flow.end()
+        if Dispatcher.REJECTED == outcome:
+            self.respond(context=context, response=self.ERROR_SERVICE_UNAVAILABLE, request=request)
+        if Dispatcher.ACCEPTED != outcome and key is not None:
+            # the calls waiting on a rejected or dropped one are turned away as well
+            self.flight.finish(key=key, response=self.ERROR_SERVICE_UNAVAILABLE)
+        return outcome
+
+    def respond(self, context=None, response=None, request=None):
+        """
+        Send the handler response as a response packet to request, responses larger than a chunk go out as a windowed
+        transfer when the request sets the window flag
+        :param request: request datagram (header), None when the request does not require a response
+        :return: True if the response was sent
+        """
+        flow = self.flow
+        if flow is not None:
+            flow.end()
+        if request is None:
+            return False
+        constant = self.constant(response=response)
+        payload = self.payload(response=response) if constant is None else constant
+        if self.cache is not None:
+            self.cache.store(header=request, payload=None if response is False or response in self.ERRORS else payload)
+        if constant is not None:
+            data = self.ENCODER.template(request=request, payload=constant)
+        elif len(payload) > self.WINDOW.chunk_size and self.WINDOW.supported(request):
+            return self._respond_window(context=context, payload=payload, request=request)
+        else:
+            data = self.ENCODER.encode(request=request, payload=payload)
+        if flow is not None and flow.requested(request):
+            flow.advertise(data)
+        if self.dedup is not None:
+            self.dedup.store(peer=context.client_address, _id=self.WINDOW.codec.field(request, 'id'),
+                             response=bytes(data))
+        return len(data) == context.reply(data)
+
+    def _respond_window(self, context=None, payload=None, request=None):
+        sender = WindowSender(payload=payload, window=self.WINDOW)
+        template = self.WINDOW.template(header=self.ENCODER.encode(request=request, payload=b''), total=sender.total)
+        key = (context.client_address, self.WINDOW.codec.field(request, 'id'))
+        self.expire()
+        self.__senders[key] = (sender, template)
+        with sender.lock:
+            return self._push(context=context, sender=sender, template=template)
+
+    def constant(self, response=None):
+        """
+        :return: pre-encoded payload of constant replies (True or None, False and the status messages), None for
+                 anything else
+        """
+        if response is True or response is None:
+            return b''
+        if response is False:
+            return self.REPLIES[self.DEFAULT_ERROR_MESSAGE]
+        if str is type(response):
+            return self.REPLIES.get(response)
+        return None
+
+    def payload(self, response=None):
+        """
+        :return: response packet payload for a handler return value: bytes-like values as they are, strings encoded,
+                 True or None empty, False the default error message, anything else its string representation
+        """
+        if response is True or response is None:
+            return b''
+        if response is False:
+            response = self.DEFAULT_ERROR_MESSAGE
+        if isinstance(response, (bytes, bytearray, memoryview)):
+            return response
+        return bytes(str(response), self.DEFAULT_ENCODING)
+
+    async def _respond_later(self, context=None, response=None, route=None, timing=None, request=None):
         try:
-            parser = Parser()
-            parsed = parser.parse(request[0])
-            packet = Packet(parsed)
+            response = await response
         except (BaseException, ):
-            print ("[{}: {}] Data packet not well formed, dropping".format(datetime.now(), self.client_address))
-            return
-        target_id, component_id, resource_id = Router.route(packet.request_address)
-        if 0 == target_id:
-            raise Exception("Routing failed, target service/device address is 0")
-        entity = self.ENTITY[0]
-        _id = target_id
-        if 0 != component_id:
-            entity = self.ENTITY[1]
-            _id = component_id
-            if 0 != resource_id:
-                entity = self.ENTITY[2]
-                _id = resource_id
-        return entity, _id, packet.payload
+            return self.respond(context=context, response=self.ERROR_HANDLING_REQUEST, request=request)
+        if timing is None:
+            return self.respond(context=context, response=response, request=request)
+        dispatched = perf_counter_ns()
+        replied = self.respond(context=context, response=response, request=request)
+        self.qos.record((route, ) + timing + (dispatched, perf_counter_ns()))
+        return replied
+
+    def _copy(self, request=None):
+        return None if request is None else bytes(request[:self.ENCODER.length])
+
+    def resolve(self, request=None, context=None):
+        """
+        :return: (Route, PacketView) for the request, Route is None when no handler matches the request address and
+                 both are None for datagrams that could not be read
+        """
+        try:
+            packet = PacketView(request[0])
+            return self.routes.lookup(packet.request_address), packet
+        except (BaseException, ):
+            log.warning('packet.malformed', rate=self.LOG_RATE,
+                        client=self.client_address if context is None else context.client_address)
+            return None, None
+
+    def route(self, request=None, context=None):
+        route, packet = self.resolve(request=request, context=context)
+        if route is None:
+            raise Exception("Routing failed, no handler for the request address")
+        return route.entity, route._id, packet.payload
 
     def dispatch(self, entity=None, _id=None, payload=None):
-        if hasattr(self.entities[entity][_id], "__call__"):
-            response = self.entities[entity][_id]()
-        else:
-            response = self.entities[entity][_id].handle(payload)
-        return response
+        route = self.routes.entity(entity=entity, _id=_id)
+        if route is None:
+            raise Exception("No handler registered for {} {}".format(entity, _id))
+        return route.invoke(payload)
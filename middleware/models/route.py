@@ -0,0 +1,164 @@
+class RouteException(Exception):
+    pass
+
+
+class Route(object):
+
+    """
+    Handler resolved at registration time: entity/_id it is registered for and the bound call
+    """
+
+    __slots__ = ['entity', '_id', 'handler', 'call', 'payload']
+
+    def __init__(self, entity=None, _id=None, handler=None):
+        self.entity = entity
+        self._id = _id
+        self.handler = handler
+        if hasattr(handler, "__call__"):
+            self.call = handler
+            self.payload = False
+        else:
+            self.call = handler.handle
+            self.payload = True
+
+    def invoke(self, payload=None):
+        if self.payload:
+            return self.call(payload)
+        return self.call()
+
+
+class RouteTable(object):
+
+    """
+    Request address (48 bit: service, component and resource id, 16 bits each) to Route table. Lookup order:
+
+    - exact addresses
+    - masked (wildcard) routes, most specific mask first, e.g. COMPONENT_MASK for any resource on a component
+    - entity routes (Manager.add): the deepest non zero address part selects the entity, its id the route
+
+    Lookups are plain dictionary gets (one per mask in use), add/remove update a single entry.
+    """
+
+    ENTITY = ['service', 'component', 'resource']
+
+    ID_BITS = 16
+    ID_MASK = 2 ** ID_BITS - 1
+    ADDRESS_MASK = 2 ** (3 * ID_BITS) - 1
+    SERVICE_MASK = ID_MASK << 2 * ID_BITS
+    COMPONENT_MASK = (2 ** (2 * ID_BITS) - 1) << ID_BITS
+
+    ERROR_ENTITY = "Entity not supported: {}"
+    ERROR_ADDRESS = "Route address must be a 48 bit integer, exact routes need a non zero service id, {} encountered"
+    ERROR_MASK = "Route mask must be a 48 bit integer, {} encountered"
+
+    def __init__(self):
+        self.exact = dict()
+        self.masked = dict()
+        # (mask, routes) pairs, most specific (most bits set) first
+        self.masks = list()
+        self.entities = {entity: dict() for entity in self.ENTITY}
+
+    @classmethod
+    def address(cls, service=0, component=0, resource=0):
+        return service << 2 * cls.ID_BITS | component << cls.ID_BITS | resource
+
+    @classmethod
+    def split(cls, address=None):
+        return address >> 2 * cls.ID_BITS, address >> cls.ID_BITS & cls.ID_MASK, address & cls.ID_MASK
+
+    @classmethod
+    def target(cls, address=None):
+        """
+        :return: (entity, _id) an address is routed to by entity routes, the deepest non zero address part
+        """
+        service, component, resource = cls.split(address=address)
+        if 0 == component:
+            return cls.ENTITY[0], service
+        if 0 == resource:
+            return cls.ENTITY[1], component
+        return cls.ENTITY[2], resource
+
+    def add(self, address=None, handler=None, mask=None):
+        """
+        :param address: request address, bits outside mask are ignored
+        :param mask: None for an exact route, otherwise the address bits that have to match
+        """
+        self._validate(address=address, mask=mask)
+        if mask is None or self.ADDRESS_MASK == mask:
+            entity, _id = self.target(address=address)
+            route = Route(entity=entity, _id=_id, handler=handler)
+            self.exact[address] = route
+            return route
+        # wildcard routes are registered for the deepest address part the mask covers
+        entity, _id = self.ENTITY[0], address >> 2 * self.ID_BITS
+        for index, part in enumerate(self.split(address=mask)):
+            if part:
+                entity, _id = self.ENTITY[index], self.split(address=address)[index]
+        route = Route(entity=entity, _id=_id, handler=handler)
+        if mask not in self.masked:
+            self.masked[mask] = dict()
+            self.masks = sorted(self.masked.items(), key=lambda item: bin(item[0]).count('1'), reverse=True)
+        self.masked[mask][address & mask] = route
+        return route
+
+    def remove(self, address=None, mask=None):
+        if mask is None or self.ADDRESS_MASK == mask:
+            self.exact.pop(address, None)
+            return
+        routes = self.masked.get(mask)
+        if routes is None:
+            return
+        routes.pop(address & mask, None)
+        if not routes:
+            del self.masked[mask]
+            self.masks = [item for item in self.masks if item[0] != mask]
+
+    def add_entity(self, entity=None, _id=None, handler=None):
+        try:
+            assert entity in self.entities
+        except (BaseException, ):
+            raise RouteException(self.ERROR_ENTITY.format(str(entity)))
+        route = Route(entity=entity, _id=_id, handler=handler)
+        self.entities[entity][_id] = route
+        return route
+
+    def remove_entity(self, entity=None, _id=None):
+        if entity in self.entities:
+            self.entities[entity].pop(_id, None)
+
+    def entity(self, entity=None, _id=None):
+        return self.entities[entity].get(_id) if entity in self.entities else None
+
+    def lookup(self, address=None):
+        """
+        :return: Route for the request address, None when nothing matches (or the service id is 0)
+        """
+        if not address >> 2 * self.ID_BITS:
+            return None
+        route = self.exact.get(address)
+        if route is not None:
+            return route
+        for mask, routes in self.masks:
+            route = routes.get(address & mask)
+            if route is not None:
+                return route
+        if not address >> self.ID_BITS & self.ID_MASK:
+            return self.entities['service'].get(address >> 2 * self.ID_BITS)
+        if not address & self.ID_MASK:
+            return self.entities['component'].get(address >> self.ID_BITS & self.ID_MASK)
+        return self.entities['resource'].get(address & self.ID_MASK)
+
+    def __len__(self):
+        return len(self.exact) + sum([len(routes) for routes in self.masked.values()]) + \
+               sum([len(routes) for routes in self.entities.values()])
+
+    def _validate(self, address=None, mask=None):
+        try:
+            assert isinstance(address, int) and 0 <= address <= self.ADDRESS_MASK
+            assert mask not in (None, self.ADDRESS_MASK) or 0 < address >> 2 * self.ID_BITS
+        except (BaseException, ):
+            raise RouteException(self.ERROR_ADDRESS.format(repr(address)))
+        try:
+            assert mask is None or (isinstance(mask, int) and 0 < mask <= self.ADDRESS_MASK)
+        except (BaseException, ):
+            raise RouteException(self.ERROR_MASK.format(repr(mask)))
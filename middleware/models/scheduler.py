@@ -0,0 +1,255 @@
+import random
+import sys
+import threading
+import time
+from dna.middleware.models.entity import Histogram
+from dna.middleware.protocol.transport import Packet, Parser, Transport
+from dna.middleware.util.log import logger
+from dna.middleware.util.timer import TimerWheel
+
+
+log = logger(name='dna.scheduler')
+
+
+class SchedulerException(Exception):
+    pass
+
+
+class Job(object):
+
+    """
+    Periodic request: a packed packet sent to address every interval seconds, responses go to callback(job, response)
+    """
+
+    __slots__ = ['_id', 'message', 'address', 'interval', 'callback', 'base', 'due', 'timer', 'runs', 'responses',
+                 'missed']
+
+    def __init__(self, _id=None, message=None, address=None, interval=None, callback=None):
+        self._id = _id
+        self.message = message
+        self.address = address
+        self.interval = interval
+        self.callback = callback
+        # nominal time of the next run, due adds the jitter
+        self.base = None
+        self.due = None
+        self.timer = None
+        self.runs = 0
+        self.responses = 0
+        self.missed = 0
+
+
+class Scheduler(object):
+
+    """
+    Periodic sensor polls and actuator commands on a TimerWheel, sent through a Transport. Jobs due on the same tick
+    are coalesced into one batched send per destination, every run is delayed by a random jitter (up to jitter times
+    the interval) so that jobs sharing an interval do not stampede, and how far each tick ran behind schedule is
+    recorded (see stats).
+
+    Jobs run at a fixed rate: runs missed while the scheduler lags are skipped and counted, not sent as a burst. Every
+    job gets its own packet id, responses are matched back to their job by id.
+    """
+
+    DEFAULT_TICK = 0.01
+    DEFAULT_JITTER = 0.05
+    POLL_INTERVAL = 0.5
+    IDS = 2 ** 16
+
+    ERROR_INTERVAL = "Interval must be a positive number of seconds, {} encountered"
+    ERROR_JOBS = "At most {} jobs can be scheduled, one packet id each"
+
+    def __init__(self, transport=None, tick=None, jitter=None, seed=None):
+        """
+        :param transport: Transport the requests are sent with, responses are read from its client socket
+        :param tick: timer resolution in seconds, jobs due within one tick share a send
+        :param jitter: fraction of the interval a run is delayed by at most
+        """
+        codec = Parser.codec()
+        self.transport = transport or Transport()
+        self.tick = tick or self.DEFAULT_TICK
+        self.jitter = self.DEFAULT_JITTER if jitter is None else jitter
+        self.random = random.Random(seed)
+        self.timers = TimerWheel(tick=self.tick)
+        self.id_offset, self.id_struct, _ = codec.offsets['id']
+        self.header_length = codec.length
+        self.jobs = dict()
+        self.due = list()
+        self.next_id = 0
+        self.lock = threading.Lock()
+        # nanoseconds the earliest job of a tick was sent after its due time
+        self.lag = Histogram()
+        self.ticks = 0
+        self.batches = 0
+        self.sent = 0
+        self.received = 0
+        self.unmatched = 0
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def add(self, packet=None, ip=None, port=None, interval=None, callback=None, delay=None):
+        """
+        :param packet: Packet or packed packet, its id is replaced with the id allocated for the job
+        :param callback: called with (job, response bytes) for every response, None for fire-and-forget commands
+        :param delay: seconds to the first run, random within one interval by default (spreads the initial phase)
+        :return: Job
+        """
+        try:
+            assert interval > 0
+        except (BaseException, ):
+            raise SchedulerException(self.ERROR_INTERVAL.format(repr(interval)))
+        message = bytearray(packet.pack() if isinstance(packet, Packet) else packet)
+        if len(message) < self.header_length:
+            message.extend(bytes(self.header_length - len(message)))
+        with self.lock:
+            if len(self.jobs) >= self.IDS:
+                raise SchedulerException(self.ERROR_JOBS.format(self.IDS))
+            while self.next_id in self.jobs:
+                self.next_id = (self.next_id + 1) % self.IDS
+            _id = self.next_id
+            self.next_id = (self.next_id + 1) % self.IDS
+            self.id_struct.pack_into(message, self.id_offset, _id)
+            job = Job(_id=_id, message=bytes(message), address=(ip, port), interval=interval, callback=callback)
+            now = time.monotonic()
+            job.base = job.due = now + (self.random.uniform(0, interval) if delay is None else delay)
+            job.timer = self.timers.schedule(job.due - now, self._due, job, now=now)
+            self.jobs[_id] = job
+        return job
+
+    def remove(self, job=None):
+        with self.lock:
+            job.timer.cancel()
+            self.jobs.pop(job._id, None)
+
+    def _due(self, job=None):
+        # timer callback, runs in run_once holding the lock
+        self.due.append(job)
+
+    def run_once(self, now=None):
+        """
+        Send the requests due by now
+        :return: number of requests sent
+        """
+        with self.lock:
+            self.timers.advance(now=now)
+            due, self.due = self.due, list()
+            if not due:
+                return 0
+            now = time.monotonic() if now is None else now
+            self.ticks += 1
+            self.lag.record(int(max(now - min(job.due for job in due), 0) * 1e9))
+            batches = dict()
+            for job in due:
+                job.runs += 1
+                batches.setdefault(job.address, list()).append(job.message)
+                job.base += job.interval
+                if job.base <= now:
+                    missed = int((now - job.base) / job.interval) + 1
+                    job.missed += missed
+                    job.base += missed * job.interval
+                job.due = job.base + self.random.uniform(0, self.jitter * job.interval)
+                job.timer = self.timers.schedule(job.due - now, self._due, job, now=now)
+        sent = 0
+        for (ip, port), messages in batches.items():
+            try:
+                sent += self.transport.send_batch(packets=messages, ip=ip, port=port)
+            except (BaseException, ) as error:
+                log.warning('scheduler.send', rate=10, ip=ip, port=port, error=str(error))
+        self.batches += len(batches)
+        self.sent += sent
+        return sent
+
+    def poll(self, timeout=None):
+        """
+        Receive responses for up to timeout seconds (returns after the first batch)
+        :return: number of responses matched to a job
+        """
+        matched = 0
+        for data, address in self.transport.client.bulk.receive(timeout=timeout):
+            if len(data) < self.header_length:
+                self.unmatched += 1
+                continue
+            job = self.jobs.get(self.id_struct.unpack_from(data, self.id_offset)[0])
+            # a response has to come from the job's destination, ip included
+            if job is None or job.address != address:
+                self.unmatched += 1
+                continue
+            job.responses += 1
+            matched += 1
+            if job.callback is not None:
+                try:
+                    job.callback(job, bytes(data))
+                except (BaseException, ) as error:
+                    log.warning('scheduler.callback', rate=10, _id=job._id, error=str(error))
+        self.received += matched
+        return matched
+
+    def run(self, block=True):
+        """
+        :param block: run on the calling thread until stop(), otherwise on a daemon thread which is returned
+        """
+        if block is not True:
+            self.thread = threading.Thread(target=self.run, name="dna-scheduler", daemon=True)
+            self.thread.start()
+            return self.thread
+        self.stopped.clear()
+        while not self.stopped.is_set():
+            with self.lock:
+                wait = self.timers.timeout()
+            self.poll(timeout=self.POLL_INTERVAL if wait is None else min(wait, self.POLL_INTERVAL))
+            self.run_once()
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def stats(self):
+        """
+        :return: counters and the lag (nanoseconds behind schedule per tick) histogram snapshot
+        """
+        with self.lock:
+            return {
+                'jobs': len(self.jobs),
+                'ticks': self.ticks,
+                'batches': self.batches,
+                'sent': self.sent,
+                'received': self.received,
+                'unmatched': self.unmatched,
+                'missed': sum(job.missed for job in self.jobs.values()),
+                'lag': self.lag.snapshot()
+            }
+
+
+if "__main__" == __name__:
+
+    # CLI - poll resources 1..n of the local service every interval seconds, print the stats every second
+    try:
+        resources = int(sys.argv[1])
+        assert 0 < resources < Scheduler.IDS
+    except (BaseException, ):
+        resources = 100
+
+    try:
+        interval = float(sys.argv[2])
+        assert interval > 0.0
+    except (BaseException, ):
+        interval = 1.0
+
+    try:
+        seconds = float(sys.argv[3])
+    except (BaseException, ):
+        seconds = 10.0
+    # End CLI
+
+    scheduler = Scheduler()
+    for resource in range(1, resources + 1):
+        scheduler.add(packet=Packet({'id': 0, 'flags': 1 << 11, 'request_address': 1 << 32 | 1 << 16 | resource}),
+                      ip="127.0.0.1", port=12345, interval=interval, callback=lambda job, response: None)
+    scheduler.run(block=False)
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        time.sleep(1.0)
+        print(scheduler.stats())
+    scheduler.stop()
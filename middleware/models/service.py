@@ -1,19 +1,46 @@
 from dna.middleware.models.manager import *
 from dna.middleware.endpoint.server import ManagedHandler
 from dna.middleware.endpoint.server import Server
+from dna.middleware.endpoint.server import AsyncServer
+from dna.middleware.endpoint.server import PooledServer
+from dna.middleware.endpoint.server import BulkServer
+from dna.middleware.endpoint.server import MultiProcessServer
+from dna.middleware.models.dispatcher import Dispatcher
 
 
 class Service(object):
 
-    def __init__(self, host=None, port=None):
+    MODE_THREADED = 'threaded'
+    MODE_ASYNC = 'asyncio'
+    MODE_POOL = 'pool'
+    MODE_BULK = 'bulk'
+    MODE_MULTIPROCESS = 'multiprocess'
+
+    SERVER = {
+        MODE_THREADED: Server,
+        MODE_ASYNC: AsyncServer,
+        MODE_POOL: PooledServer,
+        MODE_BULK: BulkServer,
+        MODE_MULTIPROCESS: MultiProcessServer
+    }
+
+    def __init__(self, host=None, port=None, mode=None, dispatcher=None, workers=None):
+        """
+        :param workers: number of worker processes in multiprocess mode, defaults to the number of CPUs
+        """
         self.__manager = None
         self.__server = None
         self.__host = None
         self.__port = None
+        self.__mode = self.MODE_THREADED
+        self.__dispatcher = dispatcher
+        self.__workers = workers
         if host is not None:
             self.host = host
         if port is not None:
             self.port = port
+        if mode is not None:
+            self.mode = mode
 
     def run(self):
 
@@ -27,8 +54,13 @@ class Service(object):
 
         demo_handler = ManagedHandler()
         demo_manager = Manager()
+        if self.MODE_POOL == self.mode:
+            demo_manager.dispatcher = self.dispatcher or Dispatcher()
         demo_manager.add(entity='resource', _id=257, handler=print_handler)
-        demo_server = Server(host=self.host, port=self.port)
+        if self.MODE_MULTIPROCESS == self.mode:
+            demo_server = MultiProcessServer(host=self.host, port=self.port, workers=self.workers)
+        else:
+            demo_server = self.SERVER[self.mode](host=self.host, port=self.port)
         demo_server.run(handler=demo_handler, manager=demo_manager)
 
     @property
@@ -57,6 +89,34 @@ class Service(object):
         self.__server = server
         server.service = self
 
+    @property
+    def mode(self):
+        return self.__mode
+
+    @mode.setter
+    def mode(self, mode):
+        try:
+            assert mode in self.SERVER
+        except (BaseException, ):
+            raise Exception("Server mode not supported: {}".format(str(mode)))
+        self.__mode = mode
+
+    @property
+    def dispatcher(self):
+        return self.__dispatcher
+
+    @dispatcher.setter
+    def dispatcher(self, dispatcher):
+        self.__dispatcher = dispatcher
+
+    @property
+    def workers(self):
+        return self.__workers
+
+    @workers.setter
+    def workers(self, workers):
+        self.__workers = workers
+
     @property
     def host(self):
         return self.__host
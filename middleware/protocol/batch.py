@@ -0,0 +1,140 @@
+from dna.middleware.protocol.transport import Flags, Parser
+
+try:
+    import numpy
+except (ImportError, ):
+    # optional, only batch decoding needs it
+    numpy = None
+
+
+class BatchException(Exception):
+    pass
+
+
+class BatchCodec(object):
+
+    """
+    Vectorized DNP header codec for packet captures and replay files: many datagrams laid out back to back in one
+    buffer are decoded into a NumPy structured array (one record per packet) in a handful of array operations instead
+    of one Parser.parse call each, and encoded back the same way.
+
+    Records hold the raw header fields, the flag bits, the request and response addresses split into service,
+    component and resource ids (as Router.route) and the offset and length of the payload in the buffer. Datagrams
+    shorter than the header are zero padded, as Parser.parse does.
+
+    Requires NumPy.
+    """
+
+    ERROR_NUMPY = "Batch decoding requires NumPy"
+    ERROR_OFFSETS = "Packet offsets must be increasing and within the buffer"
+    ERROR_PAYLOADS = "Payloads of {} packets expected, {} encountered"
+
+    ADDRESS_PARTS = ['service', 'component', 'resource']
+
+    def __init__(self):
+        try:
+            assert numpy is not None
+        except (BaseException, ):
+            raise BatchException(self.ERROR_NUMPY)
+        codec = Parser.codec()
+        self.length = codec.length
+        # (field, offset, width) of the header fields
+        self.fields = [(field, codec.offsets[field][0], width) for field, width in zip(codec.fields, codec.widths)]
+        self.flags = [(field, shift) for field, shift in Flags.SHIFTS]
+        self.id_bits = 16
+        self.dtype = numpy.dtype(
+            [(field, numpy.uint16 if width <= 2 else numpy.uint64) for field, _, width in self.fields] +
+            [(field, numpy.uint8) for field, _ in self.flags] +
+            [('{}_{}'.format(address, part), numpy.uint16) for address in ('request', 'response')
+             for part in self.ADDRESS_PARTS] +
+            [('payload_offset', numpy.int64), ('payload_length', numpy.int64)])
+        self.columns = numpy.arange(self.length)
+
+    def decode(self, buffer=None, offsets=None, lengths=None):
+        """
+        :param buffer: bytes-like, datagrams back to back
+        :param offsets: start of every datagram in buffer, increasing
+        :param lengths: datagram lengths, by default each datagram runs up to the next offset (the last one to the
+                        end of the buffer)
+        :return: structured array, one record per datagram (see dtype)
+        """
+        data = numpy.frombuffer(buffer, dtype=numpy.uint8)
+        offsets = numpy.asarray(offsets, dtype=numpy.int64)
+        if lengths is None:
+            lengths = numpy.diff(numpy.append(offsets, len(data)))
+        else:
+            lengths = numpy.asarray(lengths, dtype=numpy.int64)
+        try:
+            assert not len(offsets) or (0 <= offsets[0] and (lengths >= 0).all() and
+                                        (offsets + lengths <= len(data)).all())
+        except (BaseException, ):
+            raise BatchException(self.ERROR_OFFSETS)
+        # headers as an (n, header length) byte matrix gathered from the buffer in place (no copy of the buffer, mmap
+        # input stays mapped), indices past the end are clipped and bytes past the end of a short datagram read as zero
+        if len(data):
+            headers = data[numpy.minimum(offsets[:, None] + self.columns, len(data) - 1)]
+        else:
+            headers = numpy.zeros((len(offsets), self.length), dtype=numpy.uint8)
+        headers[self.columns >= lengths[:, None]] = 0
+        records = numpy.zeros(len(offsets), dtype=self.dtype)
+        for field, offset, width in self.fields:
+            value = numpy.zeros(len(offsets), dtype=numpy.uint64)
+            for index in range(width):
+                value = value << numpy.uint64(8) | headers[:, offset + index]
+            records[field] = value
+        flags = records['flags']
+        for field, shift in self.flags:
+            records[field] = flags >> shift & 1
+        mask = numpy.uint64(2 ** self.id_bits - 1)
+        for address in ('request', 'response'):
+            value = records['{}_address'.format(address)]
+            for index, part in enumerate(self.ADDRESS_PARTS):
+                shift = numpy.uint64(self.id_bits * (len(self.ADDRESS_PARTS) - 1 - index))
+                records['{}_{}'.format(address, part)] = value >> shift & mask
+        records['payload_offset'] = offsets + self.length
+        records['payload_length'] = numpy.maximum(lengths - self.length, 0)
+        return records
+
+    def encode(self, records=None, payloads=None):
+        """
+        :param records: structured array with (at least) the header fields, flags taken from the flags field
+        :param payloads: bytes-like the records' payload_offset and payload_length point into (e.g. the decoded buffer),
+                         None for header only packets
+        :return: (bytes, offsets) datagrams back to back and the start of every datagram
+        """
+        count = len(records)
+        if payloads is None:
+            lengths = numpy.zeros(count, dtype=numpy.int64)
+        else:
+            lengths = numpy.asarray(records['payload_length'], dtype=numpy.int64)
+        sizes = lengths + self.length
+        offsets = numpy.zeros(count, dtype=numpy.int64)
+        if count:
+            offsets[1:] = numpy.cumsum(sizes)[:-1]
+        output = numpy.zeros(int(sizes.sum()), dtype=numpy.uint8)
+        headers = numpy.zeros((count, self.length), dtype=numpy.uint8)
+        for field, offset, width in self.fields:
+            value = numpy.asarray(records[field], dtype=numpy.uint64)
+            for index in range(width):
+                headers[:, offset + index] = value >> numpy.uint64(8 * (width - 1 - index)) & numpy.uint64(255)
+        output[offsets[:, None] + self.columns] = headers
+        total = int(lengths.sum())
+        if total:
+            source = numpy.frombuffer(payloads, dtype=numpy.uint8)
+            # position within its payload of every payload byte
+            within = numpy.arange(total) - numpy.repeat(numpy.cumsum(lengths) - lengths, lengths)
+            output[numpy.repeat(offsets + self.length, lengths) + within] = \
+                source[numpy.repeat(numpy.asarray(records['payload_offset'], dtype=numpy.int64), lengths) + within]
+        return output.tobytes(), offsets
+
+    @staticmethod
+    def pack(datagrams=None):
+        """
+        :param datagrams: iterable of bytes-like datagrams
+        :return: (bytes, offsets) the datagrams back to back, as decode expects them
+        """
+        datagrams = [bytes(datagram) for datagram in datagrams]
+        offsets = numpy.zeros(len(datagrams), dtype=numpy.int64)
+        if datagrams:
+            offsets[1:] = numpy.cumsum([len(datagram) for datagram in datagrams])[:-1]
+        return b''.join(datagrams), offsets
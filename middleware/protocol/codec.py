@@ -0,0 +1,139 @@
+import struct
+
+
+class CodecException(Exception):
+    pass
+
+
+class HeaderCodec(object):
+
+    """
+    Fixed-width DNP header codec. The header template is compiled once into a single struct plan, odd sized fields
+    (e.g. 6 byte addresses) are split into 4/2/1 byte words and merged back on decode.
+    """
+
+    BYTE_ORDER = '>'
+    WORDS = [(8, 'Q'), (4, 'I'), (2, 'H'), (1, 'B')]
+
+    ERROR_TEMPLATE = "Header template not valid: {}"
+    ERROR_DATA = "Header data must be bytes, bytearray, memoryview or a list of integers, {} encountered"
+    ERROR_VALUES = "Header expects {} values, {} encountered"
+
+    def __init__(self, template=None):
+        self.fields = list()
+        self.widths = list()
+        self.payload = None
+        self.length = 0
+        self.struct = None
+        self.plan = list()
+        self.masks = list()
+        self.word_masks = list()
+        self.offsets = dict()
+        self._compile(template=template)
+
+    def _compile(self, template=None):
+        pattern = self.BYTE_ORDER
+        index = 0
+        try:
+            for item in template:
+                for key, length in item.items():
+                    if 0 == length:
+                        self.payload = key
+                        continue
+                    assert self.payload is None
+                    assert isinstance(length, int) and length > 0
+                    shifts = list()
+                    remaining = length
+                    for size, code in self.WORDS:
+                        while remaining >= size:
+                            pattern += code
+                            remaining -= size
+                            shifts.append(remaining * 8)
+                            self.word_masks.append(2 ** (8 * size) - 1)
+                    self.plan.append((key, index, tuple(shifts)))
+                    field_struct = struct.Struct(self.BYTE_ORDER + pattern[-len(shifts):])
+                    self.offsets[key] = (self.length, field_struct, tuple(shifts))
+                    self.fields.append(key)
+                    self.widths.append(length)
+                    self.masks.append(2 ** (8 * length) - 1)
+                    self.length += length
+                    index += len(shifts)
+        except (BaseException, ):
+            raise CodecException(self.ERROR_TEMPLATE.format(repr(template)))
+        self.struct = struct.Struct(pattern)
+
+    def decode(self, data=None):
+        """
+        :param data: datagram, header fields shorter then the header length are zero padded
+        :return: dictionary of header fields and the payload (same type as data)
+        """
+        try:
+            words = self.struct.unpack_from(data)
+        except (struct.error, TypeError):
+            words = self.struct.unpack_from(self._pad(data))
+        parts = dict()
+        for key, index, shifts in self.plan:
+            if 1 == len(shifts):
+                parts[key] = words[index]
+            elif 2 == len(shifts):
+                parts[key] = words[index] << shifts[0] | words[index + 1]
+            else:
+                value = 0
+                for offset, shift in enumerate(shifts):
+                    value |= words[index + offset] << shift
+                parts[key] = value
+        if self.payload is not None:
+            parts[self.payload] = data[self.length:]
+        return parts
+
+    def field(self, data=None, key=None):
+        """
+        Decode a single header field in place, data must hold at least the full header
+        """
+        offset, field_struct, shifts = self.offsets[key]
+        words = field_struct.unpack_from(data, offset)
+        if 1 == len(shifts):
+            return words[0]
+        value = 0
+        for word, shift in zip(words, shifts):
+            value |= word << shift
+        return value
+
+    def encode(self, values=None, payload=None):
+        """
+        :param values: header field values in template order, None is packed as 0
+        :param payload: optional payload appended after the header
+        :return: bytes
+        """
+        header = self.struct.pack(*self._words(values))
+        if payload:
+            return header + bytes(payload)
+        return header
+
+    def encode_into(self, buffer=None, offset=0, values=None):
+        self.struct.pack_into(buffer, offset, *self._words(values))
+        return self.length
+
+    def _words(self, values=None):
+        try:
+            assert len(values) == len(self.plan)
+        except (BaseException, ):
+            raise CodecException(self.ERROR_VALUES.format(len(self.plan), repr(values)))
+        words = list()
+        for value, mask, (key, index, shifts) in zip(values, self.masks, self.plan):
+            if not value:
+                value = 0
+            value &= mask
+            if 1 == len(shifts):
+                words.append(value)
+            else:
+                for offset, shift in enumerate(shifts):
+                    words.append(value >> shift & self.word_masks[index + offset])
+        return words
+
+    def _pad(self, data=None):
+        try:
+            data = bytes(data[:self.length])
+        except (BaseException, ):
+            raise CodecException(self.ERROR_DATA.format(type(data)))
+        return data + bytes(self.length - len(data))
@@ -0,0 +1,214 @@
+import threading
+import time
+from dna.middleware.protocol.transport import Flags, Parser
+
+
+class FlowException(Exception):
+    pass
+
+
+class FlowControl(object):
+
+    """
+    Receiver side flow control: counts requests in progress (received, not answered yet) and advertises the free
+    capacity as credits to peers that set the flow_control flag. The credits travel in data_window_start of the
+    response (flow_control flag set, window flag clear), a peer keeps at most credits requests in flight. Requests
+    queued in the socket buffer are not seen yet, credits are an absolute limit rather than an increment for that
+    reason.
+    """
+
+    DEFAULT_CAPACITY = 64
+
+    ERROR_CAPACITY = "Capacity must be a positive integer, {} encountered"
+
+    def __init__(self, capacity=None, per_client=None):
+        """
+        :param capacity: requests the service takes in progress before advertising no credits
+        :param per_client: most credits advertised to a single peer, capacity by default
+        """
+        try:
+            assert capacity is None or int(capacity) > 0
+        except (BaseException, ):
+            raise FlowException(self.ERROR_CAPACITY.format(repr(capacity)))
+        codec = Parser.codec()
+        self.capacity = int(capacity or self.DEFAULT_CAPACITY)
+        self.per_client = per_client or self.capacity
+        self.flags_offset, self.flags_struct, _ = codec.offsets['flags']
+        self.credits_offset = codec.offsets['data_window_start'][0]
+        self.width = codec.widths[codec.fields.index('data_window_start')]
+        shifts = dict(Flags.SHIFTS)
+        self.flow_bit = 1 << shifts['flow_control']
+        self.pending = 0
+        self.requests = 0
+        self.exhausted = 0
+        self.lock = threading.Lock()
+
+    def begin(self):
+        with self.lock:
+            self.pending += 1
+            self.requests += 1
+
+    def end(self):
+        with self.lock:
+            self.pending -= 1
+
+    def credits(self):
+        return max(0, min(self.per_client, self.capacity - self.pending))
+
+    def requested(self, header=None):
+        """
+        :return: True when the peer takes part in flow control (flow_control flag set)
+        """
+        return bool(self.flags_struct.unpack_from(header, self.flags_offset)[0] & self.flow_bit)
+
+    def advertise(self, response=None):
+        """
+        Write the current credits into an encoded response (writable buffer)
+        :return: credits advertised
+        """
+        credits = self.credits()
+        if not credits:
+            self.exhausted += 1
+        response[self.credits_offset:self.credits_offset + self.width] = credits.to_bytes(self.width, 'big')
+        return credits
+
+    def stats(self):
+        return {
+            'capacity': self.capacity,
+            'pending': self.pending,
+            'requests': self.requests,
+            'exhausted': self.exhausted
+        }
+
+
+class CongestionWindow(object):
+
+    """
+    Sender side flow control: requests in flight are limited by an AIMD congestion window (slow start up to the
+    threshold, then one request per window of responses, halved on loss at most once per round trip) and by the
+    credits the receiver advertises. With pacing, sends are spread over the smoothed round trip time instead of going
+    out as a burst.
+    """
+
+    DEFAULT_INITIAL = 4
+    DEFAULT_MAXIMUM = 1024
+    DECREASE = 0.5
+    # smoothed round trip time gain, RFC 6298
+    RTT_GAIN = 0.125
+
+    def __init__(self, initial=None, maximum=None, pacing=True):
+        codec = Parser.codec()
+        self.maximum = maximum or self.DEFAULT_MAXIMUM
+        self.window = float(min(initial or self.DEFAULT_INITIAL, self.maximum))
+        self.threshold = float(self.maximum)
+        self.pacing = pacing
+        self.flags_offset, self.flags_struct, _ = codec.offsets['flags']
+        self.credits_offset = codec.offsets['data_window_start'][0]
+        self.width = codec.widths[codec.fields.index('data_window_start')]
+        shifts = dict(Flags.SHIFTS)
+        self.flow_bit = 1 << shifts['flow_control']
+        self.window_bit = 1 << shifts['window']
+        # requests the receiver allows in flight, unknown until it advertises credits
+        self.granted = None
+        self.rtt = None
+        self.in_flight = 0
+        self.next_send = 0.0
+        self.decreased_at = 0.0
+        self.sent = 0
+        self.acknowledged = 0
+        self.losses = 0
+        self.backoffs = 0
+        self.condition = threading.Condition()
+
+    def limit(self):
+        limit = min(int(self.window), self.maximum)
+        if self.granted is not None:
+            limit = min(limit, self.granted)
+        # a single request probes a receiver that advertised no credits
+        return max(limit, 1)
+
+    def mark(self, message=None):
+        """
+        Set the flow_control flag of a request (bytearray) so that the receiver advertises credits
+        """
+        flags = self.flags_struct.unpack_from(message, self.flags_offset)[0]
+        self.flags_struct.pack_into(message, self.flags_offset, flags | self.flow_bit)
+        return message
+
+    def credits(self, response=None):
+        """
+        :return: credits advertised in a response, None when it carries none
+        """
+        if len(response) < self.credits_offset + self.width:
+            return None
+        flags = self.flags_struct.unpack_from(response, self.flags_offset)[0]
+        if flags & (self.flow_bit | self.window_bit) != self.flow_bit:
+            return None
+        return int.from_bytes(response[self.credits_offset:self.credits_offset + self.width], 'big')
+
+    def acquire(self, timeout=None):
+        """
+        Wait for room in the window, then for the paced send time
+        :return: False if no room was made within timeout
+        """
+        with self.condition:
+            if not self.condition.wait_for(lambda: self.in_flight < self.limit(), timeout=timeout):
+                return False
+            self.in_flight += 1
+            self.sent += 1
+            delay = 0
+            if self.pacing and self.rtt:
+                now = time.monotonic()
+                start = max(now, self.next_send)
+                self.next_send = start + self.rtt / self.limit()
+                delay = start - now
+        if delay > 0:
+            time.sleep(delay)
+        return True
+
+    def release(self, answered=True, rtt=None, credits=None):
+        """
+        :param answered: False for requests given up
+        :param rtt: seconds from send to response, None when unknown (resent requests)
+        :param credits: credits advertised by the response, see credits()
+        """
+        with self.condition:
+            self.in_flight -= 1
+            if answered:
+                self.acknowledged += 1
+                if self.window < self.threshold:
+                    self.window += 1
+                else:
+                    self.window += 1 / self.window
+                self.window = min(self.window, float(self.maximum))
+            if rtt is not None:
+                self.rtt = rtt if self.rtt is None else self.rtt + self.RTT_GAIN * (rtt - self.rtt)
+            if credits is not None:
+                self.granted = credits
+            self.condition.notify_all()
+
+    def loss(self):
+        """
+        Request timed out: multiplicative decrease, once per round trip for a burst of losses
+        """
+        with self.condition:
+            self.losses += 1
+            now = time.monotonic()
+            if now - self.decreased_at > (self.rtt or 0):
+                self.window = max(1.0, self.window * self.DECREASE)
+                self.threshold = self.window
+                self.decreased_at = now
+                self.backoffs += 1
+
+    def stats(self):
+        with self.condition:
+            return {
+                'window': self.window,
+                'granted': self.granted,
+                'rtt': self.rtt,
+                'in_flight': self.in_flight,
+                'sent': self.sent,
+                'acknowledged': self.acknowledged,
+                'losses': self.losses,
+                'backoffs': self.backoffs
+            }
@@ -0,0 +1,125 @@
+import collections
+import threading
+import time
+
+
+class DedupWindow(object):
+
+    """
+    Request ids seen from one peer: a bitmap sliding with the highest id (16 bit ids compared with serial number
+    arithmetic), bit n set when id highest - n was seen. Ids older than the window count as duplicates.
+
+    The last responses sent to the peer are kept for replay, a resent request whose response got lost is answered
+    again instead of being handled twice.
+    """
+
+    __slots__ = ['size', 'mask', 'highest', 'bits', 'touched', 'responses']
+
+    IDS = 2 ** 16
+
+    def __init__(self, size=None):
+        self.size = size
+        self.mask = (1 << size) - 1
+        self.highest = None
+        self.bits = 0
+        self.touched = time.monotonic()
+        self.responses = collections.OrderedDict()
+
+    def check(self, _id=None):
+        """
+        Mark _id as seen
+        :return: True if it was seen before (or is too old to tell)
+        """
+        self.touched = time.monotonic()
+        if self.highest is None:
+            self.highest, self.bits = _id, 1
+            return False
+        ahead = (_id - self.highest) % self.IDS
+        if 0 < ahead < self.IDS // 2:
+            self.bits = (self.bits << ahead | 1) & self.mask
+            self.highest = _id
+            return False
+        age = (self.highest - _id) % self.IDS
+        if age >= self.size or self.bits >> age & 1:
+            return True
+        self.bits |= 1 << age
+        return False
+
+
+class Deduplicator(object):
+
+    """
+    Receiver side duplicate suppression for resent requests, keyed on the request id per peer (client address). Peers
+    idle for longer than ttl start over, at most peers windows are kept.
+    """
+
+    DEFAULT_SIZE = 1024
+    DEFAULT_REPLAY = 64
+    DEFAULT_TTL = 60.0
+    DEFAULT_PEERS = 4096
+
+    def __init__(self, size=None, replay=None, ttl=None, peers=None):
+        """
+        :param size: ids per peer window, less than half the id space
+        :param replay: responses kept per peer for resent requests, 0 disables replay
+        """
+        self.size = min(size or self.DEFAULT_SIZE, DedupWindow.IDS // 2 - 1)
+        self.replay = self.DEFAULT_REPLAY if replay is None else replay
+        self.ttl = ttl or self.DEFAULT_TTL
+        self.max_peers = peers or self.DEFAULT_PEERS
+        self.peers = dict()
+        self.lock = threading.Lock()
+        self.duplicates = 0
+        self.replayed = 0
+
+    def check(self, peer=None, _id=None):
+        """
+        :return: (duplicate, response to replay or None)
+        """
+        with self.lock:
+            window = self.peers.get(peer)
+            if window is None or time.monotonic() - window.touched > self.ttl:
+                window = self._window(peer=peer)
+            if not window.check(_id):
+                return False, None
+            self.duplicates += 1
+            response = window.responses.get(_id)
+            if response is not None:
+                self.replayed += 1
+            return True, response
+
+    def store(self, peer=None, _id=None, response=None):
+        """
+        Keep the response to request _id of peer for replay
+        """
+        if not self.replay:
+            return
+        with self.lock:
+            window = self.peers.get(peer)
+            if window is None:
+                return
+            window.responses[_id] = response
+            window.responses.move_to_end(_id)
+            if len(window.responses) > self.replay:
+                window.responses.popitem(last=False)
+
+    def _window(self, peer=None):
+        """
+        New window for peer, called holding the lock
+        """
+        if peer not in self.peers and len(self.peers) >= self.max_peers:
+            deadline = time.monotonic() - self.ttl
+            for key in [key for key, window in self.peers.items() if window.touched < deadline]:
+                del self.peers[key]
+            if len(self.peers) >= self.max_peers:
+                del self.peers[min(self.peers, key=lambda key: self.peers[key].touched)]
+        window = self.peers[peer] = DedupWindow(size=self.size)
+        return window
+
+    def stats(self):
+        with self.lock:
+            return {
+                'peers': len(self.peers),
+                'duplicates': self.duplicates,
+                'replayed': self.replayed
+            }
@@ -1,5 +1,8 @@
 import re
+import struct
+import threading
 from dna.middleware.endpoint.client import Client
+from dna.middleware.protocol.codec import HeaderCodec
 
 
 class ProtocolException(Exception):
@@ -37,46 +40,46 @@ class Parser(object):
     ]
 
     def parse(self, data=None):
-        parts = dict()
-        total = 0
-        for item in self.TEMPLATE:
-            key = None
-            for key, length in item.items():
-                pass
-            merged = 0
-            if length == 0:
-                parts[key] = data[total:]
-                return parts
-            for byte in range(length):
-                try:
-                    merged <<= 8
-                    merged |= data[total]
-                except (BaseException, ):
-                    merged |= 0
-                total += 1
-            parts[key] = merged
-        return parts
+        return self.codec().decode(data=data)
 
     def pack(self, packet=None):
-        response = list()
-        for item in self.TEMPLATE:
-            key, length = None, None
-            for key, length in item.items():
-                pass
+        codec = self.codec()
+        values = list()
+        for key in codec.fields:
             value = getattr(packet, key)
-            if not value:
-                value = 0
-            partial = list()
-            if 'payload' == key:
-                partial = packet.payload
-            else:
-                if 'flags' == key:
-                    value = value.pack()
-                for byte in range(length):
-                    partial.append(value >> byte * 8 & 2**8-1)
-                partial = reversed(partial)
-            response.extend(partial)
-        return bytes(response)
+            if 'flags' == key and value:
+                value = value.pack()
+            values.append(value)
+        return codec.encode(values=values, payload=getattr(packet, codec.payload))
+
+    @classmethod
+    def codec(cls):
+        """
+        Header codec compiled once per template (per Parser class)
+        """
+        try:
+            return cls.__dict__['_codec']
+        except (KeyError, ):
+            cls._codec = HeaderCodec(template=cls.TEMPLATE)
+            return cls._codec
+
+
+def flag(shift=None):
+    """
+    :param shift: bit position of the flag within Flags.bits
+    :return: descriptor reading/writing a single flag bit by mask
+    """
+    mask = 1 << shift
+
+    def get(self):
+        return self.bits >> shift & 1
+
+    def set(self, value):
+        if value:
+            self.bits |= mask
+        else:
+            self.bits &= ~mask
+    return property(get, set)
 
 
 class Flags(object):
@@ -102,8 +105,13 @@ class Flags(object):
     #
     # INIT_FALSE = 0
     # INIT_TRUE = 1
+    #
+    # CHUNK_FALSE = 0
+    # CHUNK_TRUE = 1 (a chunk or an acknowledgement of a windowed transfer)
     """
 
+    __slots__ = ['bits']
+
     FLAGS_WIDTH = 16
 
     FIELDS = [
@@ -114,18 +122,26 @@ class Flags(object):
             'response_required',
             'window',
             'config',
-            'init'
+            'init',
+            'chunk'
         ]
 
+    # (field, bit position) pairs, the first field is the most significant bit
+    SHIFTS = list(zip(FIELDS, range(FLAGS_WIDTH - 1, FLAGS_WIDTH - len(FIELDS) - 1, -1)))
+    MASK = (2 ** len(FIELDS) - 1) << (FLAGS_WIDTH - len(FIELDS))
+
+    type = flag(15)
+    flow_control = flag(14)
+    target = flag(13)
+    action = flag(12)
+    response_required = flag(11)
+    window = flag(10)
+    config = flag(9)
+    init = flag(8)
+    chunk = flag(7)
+
     def __init__(self, flags=None):
-        self.__type = None
-        self.__flow_control = None
-        self.__target = None
-        self.__action = None
-        self.__response_required = None
-        self.__window = None
-        self.__config = None
-        self.__init = None
+        self.bits = 0
         self._setup(flags=flags)
 
     def __repr__(self):
@@ -135,26 +151,17 @@ class Flags(object):
         return ', '.join([str(i) for i in self.fields()])
 
     def _setup(self, flags=None):
-        try:
-            self.unpack(flags=flags)
-        except (BaseException, ):
-            raise
+        self.unpack(flags=flags)
 
     def _options(self, options=None):
         pass
 
     def fields(self):
-        return {field: int(not not getattr(self, field)) for field in self.FIELDS}
+        bits = self.bits
+        return {field: bits >> shift & 1 for field, shift in self.SHIFTS}
 
     def pack(self):
-        packed = int(self.type)
-        for item in self.FIELDS[1:]:
-            try:
-                packed = packed << 1 | int(getattr(self, item))
-            except (BaseException, ):
-                packed <<= 1
-        packed <<= self.FLAGS_WIDTH - len(self.FIELDS)
-        return packed
+        return self.bits
 
     def unpack(self, flags=None):
         try:
@@ -165,76 +172,7 @@ class Flags(object):
             assert 0 <= flags < 2**16
         except:
             raise ProtocolException("Flags field value out of boundaries [{} - {}]]".format(0, 2**16-1))
-        for index, field in enumerate(self.FIELDS):
-            try:
-                value = int(flags >> (self.FLAGS_WIDTH - index - 1) & 1)
-                setattr(self, field, value)
-            except (BaseException, ):
-                setattr(self, field, 0)
-
-    @property
-    def type(self):
-        return self.__type
-
-    @type.setter
-    def type(self, _type):
-        self.__type = _type
-
-    @property
-    def flow_control(self):
-        return self.__flow_control
-
-    @flow_control.setter
-    def flow_control(self, flow_control):
-        self.__flow_control = flow_control
-
-    @property
-    def target(self):
-        return self.__target
-
-    @target.setter
-    def target(self, target):
-        self.__target = target
-
-    @property
-    def action(self):
-        return self.__action
-
-    @action.setter
-    def action(self, action):
-        self.__action = action
-
-    @property
-    def response_required(self):
-        return self.__response_required
-
-    @response_required.setter
-    def response_required(self, response_required):
-        self.__response_required = response_required
-
-    @property
-    def window(self):
-        return self.__window
-
-    @window.setter
-    def window(self, window):
-        self.__window = window
-
-    @property
-    def config(self):
-        return self.__config
-
-    @config.setter
-    def config(self, config):
-        self.__config = config
-
-    @property
-    def init(self):
-        return self.__init
-
-    @init.setter
-    def init(self, init):
-        self.__init = init
+        self.bits = flags & self.MASK
 
 
 class Packet(object):
@@ -256,19 +194,16 @@ class Packet(object):
         'data_window_end',
         'payload'
     ]
+    OPTIONS = FIELDS[2:]
+
+    __slots__ = FIELDS
 
     def __init__(self, packet=None):
         """
-        :param packet: dictionary of required and optional fields, see self.FIELDS for reference
+        :param packet: dictionary of required and optional fields, see self.FIELDS for reference, flags may be given
+                       either as an integer or a Flags instance
         :return: None
         """
-        self.__id = None
-        self.__flags = None
-        self.__request_address = None
-        self.__response_address = None
-        self.__data_window_start = None
-        self.__data_window_end = None
-        self.__payload = None
         self._setup(packet=packet)
         return None
 
@@ -288,87 +223,221 @@ class Packet(object):
         except (BaseException, ):
             raise ProtocolException(self.ERROR_MISSING_ID)
         try:
-            flags = Flags(packet['flags'])
+            flags = packet['flags']
+            if not isinstance(flags, Flags):
+                flags = Flags(flags)
             self.flags = flags
         except (BaseException, ):
             raise ProtocolException(self.ERROR_MISSING_FLAGS)
         self._options(packet=packet)
 
     def _options(self, packet=None):
-        if 'request_address' in packet.keys():
-            self.request_address = packet['request_address']
-        if 'response_address' in packet.keys():
-            self.response_address = packet['response_address']
-        if 'data_window_start' in packet.keys():
-            self.data_window_start = packet['data_window_start']
-        if 'data_window_end' in packet.keys():
-            self.data_window_end = packet['data_window_end']
-        if 'payload' in packet.keys():
-            self.payload = packet['payload']
+        for field in self.OPTIONS:
+            setattr(self, field, packet.get(field))
 
     def pack(self):
         parser = Parser()
         return parser.pack(self)
 
+    def response(self, payload=None):
+        """
+        :return: response Packet: same id, type set to response, response not required, request and response
+                 addresses swapped
+        """
+        flags = Flags(self.flags.pack() if self.flags else 0)
+        flags.type = 1
+        flags.response_required = 0
+        return Packet({
+            'id': self.id,
+            'flags': flags,
+            'request_address': self.response_address,
+            'response_address': self.request_address,
+            'data_window_start': self.data_window_start,
+            'data_window_end': self.data_window_end,
+            'payload': payload
+        })
+
+
+class PacketView(object):
+
+    """
+    Read-only DNP packet over a received datagram buffer. Header fields are decoded on attribute access and the
+    payload is exposed as a memoryview into the datagram, nothing is copied.
+    """
+
+    __slots__ = ['_data', '_flags']
+
+    FIELDS = Packet.FIELDS
+
+    BUFFER_TYPES = (bytes, bytearray, memoryview)
+
+    ERROR_DATA = "Packet view expects a bytes-like object, {} encountered"
+
+    def __init__(self, data=None):
+        """
+        :param data: bytes, bytearray or memoryview (a list of integers is copied into bytes)
+        :return: None
+        """
+        codec = Parser.codec()
+        if not isinstance(data, self.BUFFER_TYPES):
+            try:
+                data = bytes(data)
+            except (BaseException, ):
+                raise ProtocolException(self.ERROR_DATA.format(type(data)))
+        elif isinstance(data, memoryview) and 'B' != data.format:
+            data = data.cast('B')
+        if len(data) < codec.length:
+            # malformed (short) datagram, header is zero padded the same way Parser.parse does
+            data = bytes(data) + bytes(codec.length - len(data))
+        self._data = data
+        self._flags = None
+
+    def __repr__(self):
+        return str(self.id)
+
+    def __unicode__(self):
+        return str(self.id)
+
+    def pack(self):
+        return bytes(self._data)
+
+    def packet(self):
+        """
+        :return: mutable Packet copy of the view
+        """
+        return Packet(Parser.codec().decode(data=bytes(self._data)))
+
     @property
-    def id(self):
-        return self.__id
+    def view(self):
+        return memoryview(self._data)
 
-    @id.setter
-    def id(self, _id=None):
-        self.__id = _id
+    @property
+    def id(self):
+        return Parser.codec().field(self._data, 'id')
 
     @property
     def flags(self):
-        return self.__flags
-
-    @flags.setter
-    def flags(self, flags=None):
-        try:
-            assert isinstance(flags, Flags)
-            self.__flags = flags
-        except:
-            raise ProtocolException("Flags must be an instance of Flags")
+        if self._flags is None:
+            self._flags = Flags(Parser.codec().field(self._data, 'flags'))
+        return self._flags
 
     @property
     def request_address(self):
-        return self.__request_address
-
-    @request_address.setter
-    def request_address(self, request_address):
-        self.__request_address = request_address
+        return Parser.codec().field(self._data, 'request_address')
 
     @property
     def response_address(self):
-        return self.__response_address
-
-    @response_address.setter
-    def response_address(self, response_address):
-        self.__response_address = response_address
+        return Parser.codec().field(self._data, 'response_address')
 
     @property
     def data_window_start(self):
-        return self.__data_window_start
-
-    @data_window_start.setter
-    def data_window_start(self, data_window_start):
-        self.__data_window_start = data_window_start
+        return Parser.codec().field(self._data, 'data_window_start')
 
     @property
     def data_window_end(self):
-        return self.__data_window_end
-
-    @data_window_end.setter
-    def data_window_end(self, data_window_end):
-        self.__data_window_end = data_window_end
+        return Parser.codec().field(self._data, 'data_window_end')
 
     @property
     def payload(self):
-        return self.__payload
+        return memoryview(self._data)[Parser.codec().length:]
+
+
+class ResponseEncoder(object):
+
+    """
+    Fast response path: the response header is derived from the request header bytes (id and data window copied,
+    flags patched, addresses swapped) and written with the payload into a reusable per thread output buffer, see
+    Packet.response for the equivalent Packet.
+    """
+
+    # largest UDP payload over IPv4
+    DEFAULT_BUFFER_SIZE = 65507
+    # reply templates kept per thread, see template
+    MAX_TEMPLATES = 256
+
+    ERROR_PAYLOAD = "Response payload of {} bytes exceeds the {} bytes available"
+
+    def __init__(self, buffer_size=None):
+        codec = Parser.codec()
+        self.buffer_size = buffer_size or self.DEFAULT_BUFFER_SIZE
+        self.length = codec.length
+        self.local = threading.local()
+        self.flags_offset, self.flags_struct, _ = codec.offsets['flags']
+        shifts = dict(Flags.SHIFTS)
+        self.type_bit = 1 << shifts['type']
+        self.required_bit = 1 << shifts['response_required']
+        request_offset = codec.offsets['request_address'][0]
+        response_offset = codec.offsets['response_address'][0]
+        width = codec.widths[codec.fields.index('request_address')]
+        # (destination, source) slices of the response header taken from the request header
+        self.swaps = [
+            (slice(request_offset, request_offset + width), slice(response_offset, response_offset + width)),
+            (slice(response_offset, response_offset + width), slice(request_offset, request_offset + width))
+        ]
+        # reply templates: the header as raw fields, unpacked from the request and packed into the template in one go
+        # (the flags of the template, the addresses swapped)
+        self.header_struct = struct.Struct(HeaderCodec.BYTE_ORDER + ''.join(
+            'H' if 'flags' == field else '{}s'.format(width) for field, width in zip(codec.fields, codec.widths)))
+        self.template_flags = codec.fields.index('flags')
+        self.template_swap = (codec.fields.index('request_address'), codec.fields.index('response_address'))
+
+    def required(self, request=None):
+        """
+        :param request: request datagram (at least a full header)
+        :return: True when the request asks for a response
+        """
+        return bool(self.flags_struct.unpack_from(request, self.flags_offset)[0] & self.required_bit)
 
-    @payload.setter
-    def payload(self, payload):
-        self.__payload = payload
+    def encode(self, request=None, payload=None):
+        """
+        :param request: request datagram (at least a full header)
+        :param payload: bytes-like response payload
+        :return: memoryview of the encoded response, valid until the next encode call on the same thread
+        """
+        try:
+            buffer, view = self.local.buffer, self.local.view
+        except (AttributeError, ):
+            buffer = self.local.buffer = bytearray(self.buffer_size)
+            view = self.local.view = memoryview(buffer)
+        length = self.length
+        size = length + (len(payload) if payload else 0)
+        if size > self.buffer_size:
+            raise ProtocolException(self.ERROR_PAYLOAD.format(size - length, self.buffer_size - length))
+        buffer[:length] = request[:length]
+        for destination, source in self.swaps:
+            buffer[destination] = request[source]
+        flags = self.flags_struct.unpack_from(buffer, self.flags_offset)[0]
+        self.flags_struct.pack_into(buffer, self.flags_offset, (flags | self.type_bit) & ~self.required_bit)
+        if payload:
+            buffer[length:size] = payload
+        return view[:size]
+
+    def template(self, request=None, payload=None):
+        """
+        Response with a constant payload (status replies): the response packet is built once per thread for each
+        (payload, request flags) pair, only the id, addresses and data window are patched in per request
+        :param request: request datagram (at least a full header)
+        :param payload: bytes, the same few constants every time (each one is a template)
+        :return: memoryview of the response, valid until the next call for the same pair on the same thread
+        """
+        try:
+            templates = self.local.templates
+        except (AttributeError, ):
+            templates = self.local.templates = dict()
+        key = (payload, self.flags_struct.unpack_from(request, self.flags_offset)[0])
+        template = templates.get(key)
+        if template is None:
+            if len(templates) >= self.MAX_TEMPLATES:
+                templates.clear()
+            data = bytearray(self.encode(request=request, payload=payload))
+            templates[key] = (data, memoryview(data), self.flags_struct.unpack_from(data, self.flags_offset)[0])
+            return templates[key][1]
+        fields = list(self.header_struct.unpack_from(request))
+        fields[self.template_flags] = template[2]
+        request_index, response_index = self.template_swap
+        fields[request_index], fields[response_index] = fields[response_index], fields[request_index]
+        self.header_struct.pack_into(template[0], 0, *fields)
+        return template[1]
 
 
 class Transport(object):
@@ -382,9 +451,7 @@ class Transport(object):
         self._setup(client=client)
 
     def _setup(self, client=None):
-        self.client = client
-        if self.client is None:
-            self.client = Client()
+        self.client = Client() if client is None else client
 
     def send(self, packet=None, ip=None, port=None):
         try:
@@ -400,7 +467,26 @@ class Transport(object):
             self.port = int(port)
         except (BaseException, ):
             raise ProtocolException("Port number must be an integer")
-        self._send()
+        return self._send()
+
+    def send_batch(self, packets=None, ip=None, port=None):
+        """
+        Send packets with a single batched socket call, responses are not waited for (they arrive on client.bulk)
+        :param packets: list of Packet instances or packed (bytes) packets
+        :return: number of packets sent
+        """
+        try:
+            self.ip = str(ip)
+        except (BaseException, ):
+            raise ProtocolException("IP address must be a string")
+        try:
+            self.port = int(port)
+        except (BaseException, ):
+            raise ProtocolException("Port number must be an integer")
+        self.verify()
+        address = (self.ip, self.port)
+        return self.client.bulk.send(datagrams=[(packet.pack() if isinstance(packet, Packet) else packet, address)
+                                                for packet in packets])
 
     def receive(self, data=None):
         parser = Parser()
@@ -410,7 +496,8 @@ class Transport(object):
 
     def _send(self):
         self.verify()
-        self.client.send(ip=self.ip, port=self.port, message=self.packet.pack())
+        # with flow control the client marks a copy of the message, the packet is left as the caller built it
+        return self.client.send(ip=self.ip, port=self.port, message=self.packet.pack())
 
     def verify(self):
         pattern = re.compile("^\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}$")
@@ -427,7 +514,7 @@ class Transport(object):
     def client(self, client):
         try:
             assert isinstance(client, Client)
-            self.__client = Client
+            self.__client = client
         except (BaseException, ):
             raise ProtocolException("Transport expects a Client instance, {} encountered".format(type(client)))
 
@@ -0,0 +1,441 @@
+import socket
+import threading
+import time
+from dna.middleware.endpoint.bulk import BulkSocket
+from dna.middleware.protocol.transport import Flags, Parser, PacketView
+
+
+class WindowException(Exception):
+    pass
+
+
+class Window(object):
+
+    """
+    Chunk geometry and packet layout of windowed transfers. A transfer is split into chunks of mtu - header bytes,
+    every chunk is a DNP packet with the window and chunk flags set, data_window_start holding the chunk offset and
+    data_window_end the transfer size. The chunk flag tells chunks apart from requests that only advertise window
+    support, whatever their data window.
+
+    Acknowledgements are response packets (type 1) with the window and chunk flags set, data_window_start holding the
+    number of bytes received contiguously and the payload a bitmap of received chunks from there on (selective
+    acknowledgement, most significant bit first).
+
+    Write transfers (to a service) send request chunks (type 0), read transfers (responses) response chunks (type 1).
+    """
+
+    # IPv4 UDP payload in a 1500 byte Ethernet frame
+    DEFAULT_MTU = 1472
+
+    ERROR_MTU = "MTU must leave room for the {} byte header, {} encountered"
+
+    def __init__(self, mtu=None):
+        codec = Parser.codec()
+        self.mtu = mtu or self.DEFAULT_MTU
+        self.header = codec.length
+        try:
+            assert self.mtu > self.header
+        except (BaseException, ):
+            raise WindowException(self.ERROR_MTU.format(self.header, repr(mtu)))
+        self.chunk_size = self.mtu - self.header
+        self.codec = codec
+        self.start = codec.offsets['data_window_start'][0]
+        self.end = codec.offsets['data_window_end'][0]
+        self.width = codec.widths[codec.fields.index('data_window_start')]
+        shifts = dict(Flags.SHIFTS)
+        self.window_bit = 1 << shifts['window']
+        self.chunk_bit = 1 << shifts['chunk']
+        self.type_bit = 1 << shifts['type']
+        self.required_bit = 1 << shifts['response_required']
+        # largest bitmap an acknowledgement carries
+        self.ack_bits = 8 * self.chunk_size
+
+    def template(self, header=None, total=0):
+        """
+        :param header: header of the request (write) or response (read) the transfer belongs to
+        :return: header template of the transfer, window and chunk flags and data_window_end set, data_window_start patched per
+                 chunk by chunk()
+        """
+        template = bytearray(header[:self.header])
+        offset, flags_struct, _ = self.codec.offsets['flags']
+        flags_struct.pack_into(template, offset, flags_struct.unpack_from(template, offset)[0] | self.window_bit |
+                          self.chunk_bit)
+        template[self.start:self.start + self.width] = bytes(self.width)
+        template[self.end:self.end + self.width] = total.to_bytes(self.width, 'big')
+        return bytes(template)
+
+    def request(self, header=None):
+        """
+        :return: copy of a chunk header with the chunk flag and the data window cleared, the header of the reassembled
+                 request
+        """
+        request = bytearray(header[:self.header])
+        offset, flags_struct, _ = self.codec.offsets['flags']
+        flags_struct.pack_into(request, offset, flags_struct.unpack_from(request, offset)[0] & ~self.chunk_bit)
+        request[self.start:self.end + self.width] = bytes(self.end + self.width - self.start)
+        return bytes(request)
+
+    def chunk(self, template=None, offset=None, data=None):
+        return b''.join((template[:self.start], offset.to_bytes(self.width, 'big'), template[self.start + self.width:],
+                         data))
+
+    def acknowledgement(self, template=None, offset=None, bitmap=None):
+        """
+        :param template: header template of the transfer, the acknowledgement keeps id and addresses as they are
+        """
+        flags = self.codec.field(template, 'flags') | self.type_bit | self.window_bit | self.chunk_bit
+        header = bytearray(template[:self.header])
+        self.codec.offsets['flags'][1].pack_into(header, self.codec.offsets['flags'][0], flags & ~self.required_bit)
+        header[self.start:self.start + self.width] = offset.to_bytes(self.width, 'big')
+        return bytes(header) + bitmap
+
+    def windowed(self, data=None):
+        """
+        :return: True for chunks and acknowledgements (chunk flag set)
+        """
+        return bool(self.codec.field(data, 'flags') & self.chunk_bit)
+
+    def response(self, data=None):
+        return bool(self.codec.field(data, 'flags') & self.type_bit)
+
+    def supported(self, header=None):
+        """
+        :return: True when the window flag is set (the peer accepts windowed responses)
+        """
+        return bool(self.codec.field(header, 'flags') & self.window_bit)
+
+
+class WindowSender(object):
+
+    """
+    Sending side of a transfer: keeps up to size chunks in flight, retransmits chunks reported missing by a
+    selective acknowledgement (a later chunk arrived, see sequence) and chunks not acknowledged within timeout.
+    """
+
+    DEFAULT_WINDOW = 64
+    DEFAULT_TIMEOUT = 0.2
+
+    def __init__(self, payload=None, window=None, chunk_size=None, size=None, timeout=None):
+        """
+        :param window: Window (packet layout), chunk_size taken from it
+        :param size: chunks in flight
+        """
+        self.payload = memoryview(payload).cast('B')
+        self.window = window or Window()
+        self.chunk_size = chunk_size or self.window.chunk_size
+        self.size = size or self.DEFAULT_WINDOW
+        self.timeout = self.DEFAULT_TIMEOUT if timeout is None else timeout
+        self.total = len(self.payload)
+        self.chunks = max(1, -(-self.total // self.chunk_size))
+        self.acknowledged = bytearray(self.chunks)
+        self.sent_at = [None] * self.chunks
+        # transmission order of the last send of every chunk, a chunk sent before an acknowledged one is lost
+        self.sequence = [0] * self.chunks
+        self.counter = 0
+        self.cumulative = 0
+        self.next = 0
+        self.retransmits = 0
+        self.lock = threading.Lock()
+        self.touched = time.monotonic()
+
+    @property
+    def complete(self):
+        return self.cumulative >= self.chunks
+
+    def data(self, index=None):
+        """
+        :return: (offset, memoryview) of chunk index
+        """
+        offset = index * self.chunk_size
+        return offset, self.payload[offset:offset + self.chunk_size]
+
+    def pending(self, now=None):
+        """
+        :return: indices of chunks to send now, lost and timed out chunks first, then new ones within the window
+        """
+        now = time.monotonic() if now is None else now
+        indices = list()
+        for index in range(self.cumulative, self.next):
+            if self.acknowledged[index]:
+                continue
+            sent_at = self.sent_at[index]
+            if sent_at is None or now - sent_at > self.timeout:
+                indices.append(index)
+                self.retransmits += 1
+        while self.next < self.chunks and self.next - self.cumulative < self.size:
+            indices.append(self.next)
+            self.next += 1
+        for index in indices:
+            self.counter += 1
+            self.sent_at[index] = now
+            self.sequence[index] = self.counter
+        return indices
+
+    def deadline(self):
+        """
+        :return: monotonic time the oldest unacknowledged chunk times out, None with nothing in flight
+        """
+        sent = [self.sent_at[index] for index in range(self.cumulative, self.next)
+                if not self.acknowledged[index] and self.sent_at[index] is not None]
+        return min(sent) + self.timeout if sent else None
+
+    def acknowledge(self, offset=None, bitmap=b''):
+        """
+        :param offset: bytes received contiguously
+        :param bitmap: received chunks from offset on, most significant bit first
+        """
+        self.touched = time.monotonic()
+        cumulative = self.chunks if offset >= self.total else offset // self.chunk_size
+        for index in range(self.cumulative, min(cumulative, self.next)):
+            self.acknowledged[index] = 1
+        highest = -1
+        bits = int.from_bytes(bitmap, 'big')
+        width = 8 * len(bitmap)
+        while bits:
+            position = bits.bit_length() - 1
+            index = cumulative + width - 1 - position
+            bits ^= 1 << position
+            if index < self.next:
+                self.acknowledged[index] = 1
+                if highest < 0 or self.sequence[index] > self.sequence[highest]:
+                    highest = index
+        if highest >= 0:
+            # selective retransmit: sent before a chunk that made it, not acknowledged, considered lost
+            last = self.sequence[highest]
+            for index in range(cumulative, highest):
+                if not self.acknowledged[index] and self.sequence[index] < last and self.sent_at[index] is not None:
+                    self.sent_at[index] = None
+        self.cumulative = max(self.cumulative, min(cumulative, self.next))
+        while self.cumulative < self.next and self.acknowledged[self.cumulative]:
+            self.cumulative += 1
+
+
+class WindowReceiver(object):
+
+    """
+    Receiving side of a transfer: chunks are copied into a buffer as they arrive, in any order. Unless one is given,
+    the buffer grows up to the end of the furthest chunk received, a transfer announcing a large total costs memory
+    only as its data comes in.
+    """
+
+    DEFAULT_ACK_EVERY = 16
+
+    ERROR_CHUNK = "Chunk at offset {} ({} bytes) does not fit a {} byte transfer of {} byte chunks"
+
+    def __init__(self, total=None, window=None, chunk_size=None, ack_every=None, buffer=None):
+        """
+        :param ack_every: chunks received between acknowledgements
+        :param buffer: preallocated writable buffer of at least total bytes, by default a bytearray grown on demand
+        """
+        self.window = window or Window()
+        self.total = total
+        self.chunk_size = chunk_size or self.window.chunk_size
+        self.chunks = max(1, -(-total // self.chunk_size))
+        self.ack_every = ack_every or self.DEFAULT_ACK_EVERY
+        self.buffer = buffer if buffer is not None else bytearray()
+        self.received = bytearray(self.chunks)
+        self.count = 0
+        self.cumulative = 0
+        self.highest = -1
+        self.duplicates = 0
+        self.since_ack = 0
+        self.lock = threading.Lock()
+        self.touched = time.monotonic()
+
+    @property
+    def complete(self):
+        return self.count >= self.chunks
+
+    @property
+    def data(self):
+        return memoryview(self.buffer)[:self.total]
+
+    def receive(self, offset=None, data=None):
+        """
+        :return: True for a new chunk, False for a duplicate
+        """
+        index, remainder = divmod(offset, self.chunk_size)
+        expected = min(self.chunk_size, self.total - offset) if offset < self.total else -1
+        try:
+            assert 0 == remainder and len(data) == expected or (0 == self.total and 0 == offset == len(data))
+        except (BaseException, ):
+            raise WindowException(self.ERROR_CHUNK.format(offset, len(data), self.total, self.chunk_size))
+        self.touched = time.monotonic()
+        if self.received[index]:
+            self.duplicates += 1
+            # the sender is retransmitting, it needs an acknowledgement
+            self.since_ack = self.ack_every
+            return False
+        end = offset + len(data)
+        if len(self.buffer) < end:
+            self.buffer.extend(bytes(end - len(self.buffer)))
+        self.buffer[offset:end] = data
+        self.received[index] = 1
+        self.count += 1
+        self.since_ack += 1
+        self.highest = max(self.highest, index)
+        while self.cumulative < self.chunks and self.received[self.cumulative]:
+            self.cumulative += 1
+        return True
+
+    def due(self):
+        """
+        :return: True when an acknowledgement should be sent
+        """
+        return self.since_ack >= self.ack_every or self.complete
+
+    def acknowledgement(self):
+        """
+        :return: (bytes received contiguously, bitmap of received chunks from there on)
+        """
+        self.since_ack = 0
+        offset = min(self.cumulative * self.chunk_size, self.total)
+        if self.highest <= self.cumulative:
+            return offset, b''
+        width = min(self.highest - self.cumulative + 1, self.window.ack_bits)
+        width += -width % 8
+        received = self.received[self.cumulative:self.cumulative + width]
+        received += bytes(width - len(received))
+        bitmap = int(received.translate(BITS), 2)
+        return offset, bitmap.to_bytes(width // 8, 'big')
+
+
+# chunk received flags (0/1) to binary digits
+BITS = bytes.maketrans(b'\x00\x01', b'01')
+
+
+class WindowTransfer(object):
+
+    """
+    Blocking windowed transfers over a UDP socket (client side). send() pushes a large request to a service as request
+    chunks, request() sends a request advertising window support and collects the (possibly windowed) response.
+
+    The receiving side of a read drives retransmission: when chunks stop arriving it repeats its acknowledgement.
+    """
+
+    DEFAULT_TIMEOUT = 0.2
+    DEFAULT_RETRIES = 25
+    # largest response a read transfer preallocates a buffer for
+    DEFAULT_MAX_TOTAL = 2 ** 27
+
+    ERROR_TIMEOUT = "Windowed transfer {} stalled, no progress after {} retries"
+    ERROR_TOTAL = "Windowed transfer {} of {} bytes exceeds the {} byte limit"
+
+    def __init__(self, socket_instance=None, mtu=None, size=None, timeout=None, retries=None, max_total=None):
+        """
+        :param size: chunks in flight, at least the receiver acknowledgement interval (WindowReceiver.ack_every) or
+                     every window waits for a timeout
+        :param timeout: seconds without progress before retransmitting / repeating an acknowledgement
+        :param max_total: largest response accepted by request() / receive()
+        """
+        if socket_instance is None:
+            socket_instance = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.window = Window(mtu=mtu)
+        self.size = size or WindowSender.DEFAULT_WINDOW
+        self.timeout = self.DEFAULT_TIMEOUT if timeout is None else timeout
+        self.retries = self.DEFAULT_RETRIES if retries is None else retries
+        self.max_total = max_total or self.DEFAULT_MAX_TOTAL
+        self.socket = socket_instance
+        self.bulk = BulkSocket(socket_instance=socket_instance, buffer_size=max(self.window.mtu, 2048))
+
+    def send(self, address=None, message=None):
+        """
+        Write transfer: the payload of message (a request packet of any size) is sent in chunks carrying its header
+        :return: response payload when message requires a response, None otherwise
+        """
+        window = self.window
+        message = memoryview(message).cast('B')
+        _id = window.codec.field(message, 'id')
+        required = bool(window.codec.field(message, 'flags') & window.required_bit)
+        sender = WindowSender(payload=message[window.header:], window=window, size=self.size, timeout=self.timeout)
+        template = window.template(header=message, total=sender.total)
+        progressed = time.monotonic()
+        while True:
+            indices = sender.pending()
+            if indices:
+                self.bulk.send(datagrams=[(window.chunk(template, *sender.data(index)), address)
+                                          for index in indices])
+            deadline = sender.deadline()
+            wait = self.timeout if deadline is None else max(deadline - time.monotonic(), 0)
+            for data, source in self.bulk.receive(timeout=wait):
+                if len(data) < window.header or window.codec.field(data, 'id') != _id or not window.response(data):
+                    continue
+                packet = PacketView(data)
+                if not window.windowed(data):
+                    # the service handled the reassembled request (or refused the transfer)
+                    return bytes(packet.payload)
+                before = sender.cumulative
+                sender.acknowledge(offset=packet.data_window_start, bitmap=bytes(packet.payload))
+                if sender.cumulative > before:
+                    progressed = time.monotonic()
+            if sender.complete and not required:
+                return None
+            if time.monotonic() - progressed > self.timeout * self.retries:
+                raise WindowException(self.ERROR_TIMEOUT.format(_id, self.retries))
+
+    def request(self, address=None, message=None, timeout=None):
+        """
+        Read transfer: message is sent with the window flag set (window supported)
+        :return: response payload, memoryview into a buffer preallocated for the whole response (see receive)
+        """
+        window = self.window
+        message = bytearray(message)
+        flags_offset, flags_struct, _ = window.codec.offsets['flags']
+        flags_struct.pack_into(message, flags_offset,
+                               flags_struct.unpack_from(message, flags_offset)[0] | window.window_bit)
+        _id = window.codec.field(message, 'id')
+        self.socket.sendto(message, address)
+        return self.receive(address=address, _id=_id, timeout=timeout)
+
+    def receive(self, address=None, _id=None, timeout=None):
+        """
+        Receive the response chunks of transfer _id, address (the sender) is taken from the first chunk when None.
+        The buffer is allocated for the whole response on the first chunk, responses over max_total bytes are refused
+        :return: response payload
+        """
+        window = self.window
+        timeout = self.timeout if timeout is None else timeout
+        receiver, template, stalled = None, None, 0
+        while receiver is None or not receiver.complete:
+            datagrams = self.bulk.receive(timeout=timeout)
+            if not datagrams:
+                stalled += 1
+                if stalled > self.retries:
+                    raise WindowException(self.ERROR_TIMEOUT.format(_id, self.retries))
+                if receiver is not None:
+                    self._acknowledge(receiver=receiver, template=template, address=address)
+                continue
+            stalled = 0
+            for data, source in datagrams:
+                if len(data) < window.header:
+                    continue
+                packet = PacketView(data)
+                if _id is not None and packet.id != _id or not window.response(data):
+                    continue
+                if not window.windowed(data):
+                    # response small enough for a single datagram
+                    return memoryview(bytes(packet.payload))
+                if receiver is None:
+                    total = packet.data_window_end
+                    try:
+                        assert total <= self.max_total
+                    except (BaseException, ):
+                        raise WindowException(self.ERROR_TOTAL.format(_id, total, self.max_total))
+                    receiver = WindowReceiver(total=total, window=window, buffer=bytearray(total))
+                    template = bytes(data[:window.header])
+                    address = address or source
+                try:
+                    receiver.receive(offset=packet.data_window_start, data=packet.payload)
+                except (WindowException, ):
+                    # not a chunk of this transfer
+                    continue
+            if receiver is not None and receiver.due():
+                self._acknowledge(receiver=receiver, template=template, address=address)
+        return receiver.data
+
+    def _acknowledge(self, receiver=None, template=None, address=None):
+        offset, bitmap = receiver.acknowledgement()
+        self.socket.sendto(self.window.acknowledgement(template=template, offset=offset, bitmap=bitmap), address)
+
+    def close(self):
+        self.socket.close()
@@ -0,0 +1,221 @@
+import atexit
+import collections
+import datetime
+import json
+import os
+import sys
+import threading
+import time
+
+
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+
+LEVEL = {
+    DEBUG: 'DEBUG',
+    INFO: 'INFO',
+    WARNING: 'WARNING',
+    ERROR: 'ERROR'
+}
+
+
+class LogException(Exception):
+    pass
+
+
+class LogWriter(object):
+
+    """
+    Background writer: loggers append records to a bounded deque (appends are atomic, no lock on the logging side),
+    a daemon thread formats and writes them as JSON lines every interval. Records logged while the queue is full are
+    dropped and reported by a single summary record per flush.
+    """
+
+    DEFAULT_MAX_QUEUE = 2 ** 16
+    DEFAULT_INTERVAL = 0.1
+
+    def __init__(self, stream=None, max_queue=None, interval=None):
+        """
+        :param stream: file like object, sys.stderr (looked up on every flush) by default
+        """
+        self.stream = stream
+        self.max_queue = max_queue or self.DEFAULT_MAX_QUEUE
+        self.interval = interval or self.DEFAULT_INTERVAL
+        self.queue = collections.deque()
+        self.dropped = 0
+        self.reported = 0
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = None
+        if hasattr(os, 'register_at_fork'):
+            # forked workers (MultiProcessServer) do not inherit the writer thread
+            os.register_at_fork(after_in_child=self._forked)
+
+    def _forked(self):
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def put(self, record=None):
+        """
+        :return: False when the record was dropped (queue full)
+        """
+        if len(self.queue) >= self.max_queue:
+            self.dropped += 1
+            return False
+        self.queue.append(record)
+        if self.thread is None:
+            self.start()
+        return True
+
+    def start(self):
+        with self.lock:
+            if self.thread is not None:
+                return
+            self.stopped.clear()
+            self.thread = threading.Thread(target=self._run, name="dna-log-writer", daemon=True)
+            self.thread.start()
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            self.flush()
+        self.flush()
+
+    def flush(self):
+        with self.lock:
+            lines = list()
+            try:
+                for _ in range(len(self.queue)):
+                    lines.append(self.format(record=self.queue.popleft()))
+            except (IndexError, ):
+                pass
+            dropped = self.dropped - self.reported
+            if dropped > 0:
+                self.reported += dropped
+                lines.append(self.format(record=(time.time(), WARNING, 'log', 'log.dropped', {'count': dropped})))
+            if not lines:
+                return
+            stream = self.stream or sys.stderr
+            try:
+                stream.write("\n".join(lines) + "\n")
+                stream.flush()
+            except (BaseException, ):
+                # logging must never take the middleware down
+                pass
+
+    @staticmethod
+    def format(record=None):
+        timestamp, level, name, event, fields = record
+        document = {
+            'time': datetime.datetime.fromtimestamp(timestamp).isoformat(),
+            'level': LEVEL.get(level, level),
+            'logger': name,
+            'event': event
+        }
+        document.update(fields)
+        return json.dumps(document, default=repr)
+
+    def close(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+
+class Logger(object):
+
+    """
+    Structured logger, records are an event name plus keyword fields. Nothing is formatted or written on the calling
+    thread.
+
+    sample: log one in sample calls of the event
+    rate: log at most rate records of the event per second, the next logged record carries the suppressed count
+    """
+
+    ERROR_LEVEL = "Log level not supported: {}"
+
+    def __init__(self, name=None, level=None, writer=None):
+        self.name = name
+        self.level = INFO if level is None else level
+        self.writer = writer
+        self.samples = dict()
+        self.windows = dict()
+        self.suppressed = dict()
+
+    def enabled(self, level=None):
+        return level >= self.level
+
+    def log(self, level=None, event=None, sample=None, rate=None, **fields):
+        """
+        :return: True if the record was queued
+        """
+        if level < self.level:
+            return False
+        if sample is not None and sample > 1:
+            count = self.samples.get(event, 0)
+            self.samples[event] = count + 1
+            if count % sample:
+                return False
+        if rate is not None:
+            second = int(time.monotonic())
+            window = self.windows.get(event)
+            if window is None or window[0] != second:
+                window = self.windows[event] = [second, 0]
+            window[1] += 1
+            if window[1] > rate:
+                self.suppressed[event] = self.suppressed.get(event, 0) + 1
+                return False
+            if event in self.suppressed:
+                fields['suppressed'] = self.suppressed.pop(event)
+        writer = self.writer or default_writer
+        return writer.put((time.time(), level, self.name, event, fields))
+
+    def debug(self, event=None, **fields):
+        return self.log(DEBUG, event, **fields)
+
+    def info(self, event=None, **fields):
+        return self.log(INFO, event, **fields)
+
+    def warning(self, event=None, **fields):
+        return self.log(WARNING, event, **fields)
+
+    def error(self, event=None, **fields):
+        return self.log(ERROR, event, **fields)
+
+
+default_writer = LogWriter()
+default_level = [INFO]
+loggers = dict()
+atexit.register(default_writer.close)
+
+
+def logger(name=None):
+    """
+    :return: shared Logger for name, writing through the default writer unless configured otherwise
+    """
+    try:
+        return loggers[name]
+    except (KeyError, ):
+        return loggers.setdefault(name, Logger(name=name, level=default_level[0]))
+
+
+def configure(level=None, stream=None, name=None):
+    """
+    :param level: level of the logger name, all loggers (present and future defaults) when name is None
+    :param stream: stream of the default writer
+    """
+    if level is not None:
+        try:
+            assert level in LEVEL
+        except (BaseException, ):
+            raise LogException(Logger.ERROR_LEVEL.format(repr(level)))
+        if name is None:
+            default_level[0] = level
+        targets = [logger(name=name)] if name is not None else list(loggers.values())
+        for target in targets:
+            target.level = level
+    if stream is not None:
+        default_writer.flush()
+        default_writer.stream = stream
@@ -0,0 +1,123 @@
+import time
+
+
+class TimerException(Exception):
+    pass
+
+
+class Timer(object):
+
+    """
+    Handle of a scheduled callback, see TimerWheel.schedule
+    """
+
+    __slots__ = ['tick', 'callback', 'args', 'cancelled']
+
+    def __init__(self, tick=None, callback=None, args=None):
+        self.tick = tick
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        """
+        Cancelled timers stay in their bucket and are skipped when it comes around, O(1)
+        """
+        self.cancelled = True
+
+
+class TimerWheel(object):
+
+    """
+    Hashed timer wheel: timers are bucketed by their expiry tick (tick modulo slots), scheduling and cancelling are
+    O(1) and advance() only visits the buckets of the ticks that passed. Timers more than one revolution out stay in
+    their bucket until their tick comes around. Timers fire at tick resolution, never early.
+
+    Not thread safe: one thread drives the wheel with advance(), callbacks run on that thread.
+    """
+
+    DEFAULT_TICK = 0.01
+    DEFAULT_SLOTS = 512
+
+    ERROR_TICK = "Tick must be a positive number of seconds, {} encountered"
+
+    def __init__(self, tick=None, slots=None, now=None):
+        """
+        :param tick: resolution in seconds
+        :param slots: buckets, one revolution covers tick * slots seconds
+        """
+        try:
+            assert tick is None or tick > 0
+        except (BaseException, ):
+            raise TimerException(self.ERROR_TICK.format(repr(tick)))
+        self.tick = tick or self.DEFAULT_TICK
+        self.slots = slots or self.DEFAULT_SLOTS
+        self.buckets = [list() for _ in range(self.slots)]
+        self.started = time.monotonic() if now is None else now
+        # last tick processed
+        self.current = 0
+        self.scheduled = 0
+
+    def __len__(self):
+        """
+        :return: timers scheduled and not fired yet (cancelled ones included until their tick)
+        """
+        return self.scheduled
+
+    def schedule(self, delay=None, callback=None, *args, now=None):
+        """
+        :param delay: seconds from now
+        :return: Timer
+        """
+        if now is None:
+            now = time.monotonic()
+        # rounded up, a timer fires within one tick after its delay
+        tick = int((now + delay - self.started) / self.tick) + 1
+        if tick <= self.current:
+            tick = self.current + 1
+        timer = Timer(tick, callback, args)
+        self.buckets[tick % self.slots].append(timer)
+        self.scheduled += 1
+        return timer
+
+    def advance(self, now=None):
+        """
+        Fire the timers due by now
+        :return: number of callbacks run
+        """
+        target = int(((time.monotonic() if now is None else now) - self.started) / self.tick)
+        if target <= self.current:
+            return 0
+        buckets = len(self.buckets)
+        if target - self.current >= buckets:
+            # more than a revolution behind, every bucket is visited once
+            ticks = range(self.current + 1, self.current + buckets + 1)
+        else:
+            ticks = range(self.current + 1, target + 1)
+        due = list()
+        for tick in ticks:
+            bucket = self.buckets[tick % buckets]
+            if not bucket:
+                continue
+            expired = [timer for timer in bucket if timer.tick <= target]
+            if expired:
+                bucket[:] = [timer for timer in bucket if timer.tick > target]
+                due.extend(expired)
+        self.current = target
+        self.scheduled -= len(due)
+        due.sort(key=lambda timer: timer.tick)
+        fired = 0
+        for timer in due:
+            if not timer.cancelled:
+                timer.callback(*timer.args)
+                fired += 1
+        return fired
+
+    def timeout(self, now=None):
+        """
+        :return: seconds until the next tick, None when nothing is scheduled
+        """
+        if not self.scheduled:
+            return None
+        now = time.monotonic() if now is None else now
+        return max(self.started + (self.current + 1) * self.tick - now, 0)